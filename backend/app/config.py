@@ -15,6 +15,19 @@ DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 _cors_env = os.getenv("CORS_ORIGINS", "")
 CORS_ORIGINS = _cors_env.split(",") if _cors_env else []
 
+# 同期処理（DBアクセス・パスワードハッシュ）を実行するスレッドプールのスレッド数
+# ルートハンドラーは def で定義し、このスレッドプールで実行する（イベントループをブロックしない）
+THREADPOOL_WORKERS = int(os.getenv("THREADPOOL_WORKERS", "40"))
+# DB接続プールの接続数（スレッドプールの全スレッドが同時に接続を持てるよう THREADPOOL_WORKERS に合わせる）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(THREADPOOL_WORKERS)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+# パスワードハッシュ（bcrypt）専用スレッドプールのスレッド数と待機数の上限
+# 実行中 + 待機中がこの合計に達したログイン・パスワード操作は即座に 503 を返す
+# （合計を THREADPOOL_WORKERS より小さくし、ログイン集中時も他のAPIのスレッドを残す）
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "16"))
+
 # JWT認証設定
 # 本番環境では必ず環境変数 SECRET_KEY に長いランダム文字列を設定すること
 _DEFAULT_SECRET_KEY = "change-this-secret-key-in-production-32chars"
@@ -33,4 +46,38 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 8
 
 # CSVアップロード制限
-MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "10"))  # デフォルト10MB
+# アップロードはディスクに退避してチャンク単位で取り込むため、メモリ使用量はファイルサイズに比例しない
+# 上限は一時ファイルを置くディスク容量と取込時間の目安として設定する
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "500"))  # デフォルト500MB
+
+# CSVアップロード時の解析単位（1チャンクとして読み込む行数）
+UPLOAD_CSV_CHUNK_ROWS = int(os.getenv("UPLOAD_CSV_CHUNK_ROWS", "50000"))
+
+# CSVアップロード時のDB書き込み単位（1回の executemany で挿入する行数）
+UPLOAD_INSERT_BATCH_SIZE = int(os.getenv("UPLOAD_INSERT_BATCH_SIZE", "1000"))
+
+# バックグラウンドCSV取込ジョブの解析プロセス数（DB書き込みは1スレッドで直列に行う）
+UPLOAD_JOB_PARSE_WORKERS = int(os.getenv("UPLOAD_JOB_PARSE_WORKERS", "2"))
+# 取込ジョブで解析プロセスからの次のチャンクを待つ最大秒数（超えたらジョブを失敗にして次のジョブへ進む）
+UPLOAD_CHUNK_TIMEOUT_SECONDS = float(os.getenv("UPLOAD_CHUNK_TIMEOUT_SECONDS", "300"))
+
+# 監査ログの書き込み（キューに積み、書き込みスレッドがまとめて1トランザクションで書き込む）
+AUDIT_LOG_QUEUE_SIZE = int(os.getenv("AUDIT_LOG_QUEUE_SIZE", "10000"))
+AUDIT_LOG_BATCH_SIZE = int(os.getenv("AUDIT_LOG_BATCH_SIZE", "200"))
+AUDIT_LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL_SECONDS", "1.0"))
+# キューが満杯の場合: drop（破棄して件数を記録）/ block（空くまで待つ。API の応答が遅れる）
+AUDIT_LOG_OVERFLOW = os.getenv("AUDIT_LOG_OVERFLOW", "drop").lower()
+
+# レート制限の回数・キャッシュの世代カウンタの保存先
+#   memory: プロセス内（ワーカー1つの場合）
+#   sqlite: STATE_SQLITE_PATH の SQLite ファイル（uvicorn --workers N など同じホストで複数プロセスを動かす場合は必須）
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", "./state.db")
+
+# 集計結果キャッシュ（CSV取込・全削除で無効化。0 を指定すると無効）
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "512"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "300"))
+
+# 認証ユーザーキャッシュ（ユーザーの削除・変更時は即時破棄。0 を指定すると無効）
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "1024"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
@@ -1,11 +1,14 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from app.config import DATABASE_URL, DEBUG
+from app.config import DATABASE_URL, DB_MAX_OVERFLOW, DB_POOL_SIZE, DEBUG
+
+# 接続プール（インメモリSQLiteは接続ごとに別DBになるためプール設定を変えない）
+_pool_options = {} if ":memory:" in DATABASE_URL else {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
 
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, echo=DEBUG)
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, echo=DEBUG, **_pool_options)
 else:
-    engine = create_engine(DATABASE_URL, echo=DEBUG)
+    engine = create_engine(DATABASE_URL, echo=DEBUG, **_pool_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -3,11 +3,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.concurrency import run_in_threadpool
 import os
-from app.config import DEBUG, CORS_ORIGINS, VERSION
+from anyio import to_thread
+from app.config import DEBUG, CORS_ORIGINS, VERSION, THREADPOOL_WORKERS
 from app.database import engine, Base
+from app.migrations import run_migrations
 from app.routes import sales, health, admin, auth, audit
 from app.utils.rate_limiter import api_limiter
+from app.services.upload_jobs import upload_job_queue
+from app.utils.password_hasher import password_hasher
+from app.utils.audit_logger import audit_log_writer
 # モデルをインポート（テーブル作成のため）
 from app.models.sales import SalesTransaction
 from app.models.user import User
@@ -15,8 +21,9 @@ from app.models.admin import AdminUser
 from app.models.store import Store
 from app.models.audit_log import AuditLog
 
-# テーブル作成
+# テーブル作成（既存DBへのカラム・インデックス追加はスキーマ移行で適用）
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 # デフォルトの管理ユーザーを作成（存在しない場合）
 from sqlalchemy.orm import Session
@@ -84,13 +91,23 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         return response
 
 
+def _api_limit_wait(ip_address: str) -> int:
+    """API レート制限を判定（許可なら 0、拒否なら解除までの秒数（1 以上））"""
+    if api_limiter.is_allowed(ip_address):
+        return 0
+    return max(1, api_limiter.get_remaining_time(ip_address))
+
 # API全体レート制限ミドルウェア（IP単位: 1分間に100リクエストまで）
 class APIRateLimitMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         if request.url.path.startswith("/api/"):
             ip_address = request.client.host if request.client else "unknown"
-            if not api_limiter.is_allowed(ip_address):
-                remaining = api_limiter.get_remaining_time(ip_address)
+            # STATE_BACKEND=sqlite ではファイル I/O・ロック待ちが発生するため、イベントループを止めないようスレッドプールで判定
+            if api_limiter.backend.blocking:
+                remaining = await run_in_threadpool(_api_limit_wait, ip_address)
+            else:
+                remaining = _api_limit_wait(ip_address)
+            if remaining:
                 from fastapi.responses import JSONResponse
                 return JSONResponse(
                     status_code=429,
@@ -128,6 +145,30 @@ app.include_router(admin.router)
 app.include_router(auth.router)
 app.include_router(audit.router)
 
+# def で定義したルートハンドラー・依存関係を実行するスレッドプールのスレッド数
+@app.on_event("startup")
+def configure_threadpool():
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_WORKERS
+
+# 取込ジョブの解析プロセス（spawn）は起動時に開始（最初の取込リクエストでプロセスの起動を待たせない）
+@app.on_event("startup")
+def start_upload_jobs():
+    upload_job_queue.start()
+
+# 終了時は実行中の取込ジョブの完了を待ってから解析プロセスを停止
+@app.on_event("shutdown")
+def shutdown_upload_jobs():
+    upload_job_queue.shutdown()
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    password_hasher.shutdown()
+
+# キューに残った監査ログを書き込んでから終了（他の終了処理で記録されたイベントも含めるため最後に登録）
+@app.on_event("shutdown")
+def shutdown_audit_log_writer():
+    audit_log_writer.shutdown()
+
 # フロントエンド配信
 @app.get("/")
 async def root():
@@ -0,0 +1,160 @@
+"""
+スキーマ移行
+Base.metadata.create_all は既存テーブルへのカラム・インデックス追加を行わないため、
+稼働中のDB（SQLite / PostgreSQL）への差分はここに定義した移行を順番に適用する。
+適用済みの移行は schema_migrations テーブルに記録し、2回目以降はスキップする。
+"""
+
+from datetime import datetime
+from sqlalchemy import Column, DateTime, MetaData, String, Table, bindparam, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", String, primary_key=True),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+_BACKFILL_BATCH_SIZE = 1000
+
+
+def _has_column(conn: Connection, table_name: str, column_name: str) -> bool:
+    return any(c["name"] == column_name for c in inspect(conn).get_columns(table_name))
+
+
+def _add_sales_fingerprint(conn: Connection):
+    """sales_transactions に重複排除用フィンガープリントを追加し、既存行をバックフィル"""
+    from app.models.sales import SalesTransaction, transaction_fingerprint
+
+    if not _has_column(conn, "sales_transactions", "fingerprint"):
+        conn.execute(text("ALTER TABLE sales_transactions ADD COLUMN fingerprint VARCHAR"))
+
+    table = SalesTransaction.__table__
+    seen = set(conn.execute(select(table.c.fingerprint).where(table.c.fingerprint.isnot(None))).scalars())
+    stmt = update(table).where(table.c.id == bindparam("_id")).values(fingerprint=bindparam("_fingerprint"))
+
+    # id順にバッチ単位で読み込み、既存データ内の完全重複は最初の1件のみに付与（残りはNULLのまま）
+    last_id = 0
+    filled = skipped = 0
+    while True:
+        rows = conn.execute(
+            select(
+                table.c.id, table.c.transaction_date, table.c.ticket_number, table.c.staff_id,
+                table.c.product_code, table.c.quantity, table.c.total_price,
+            )
+            .where(table.c.fingerprint.is_(None), table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(_BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        batch = []
+        for row in rows:
+            fingerprint = transaction_fingerprint(
+                row.transaction_date, row.ticket_number, row.staff_id, row.product_code, row.quantity, row.total_price
+            )
+            if fingerprint in seen:
+                skipped += 1
+                continue
+            seen.add(fingerprint)
+            batch.append({"_id": row.id, "_fingerprint": fingerprint})
+        if batch:
+            conn.execute(stmt, batch)
+            filled += len(batch)
+
+    if filled or skipped:
+        print(f"[MIGRATION] fingerprint バックフィル: {filled}件 (既存重複 {skipped}件)")
+
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_sales_transactions_fingerprint "
+        "ON sales_transactions (fingerprint)"
+    ))
+
+
+def _add_sales_query_indexes(conn: Connection):
+    """sales_transactions にモデルの __table_args__ のインデックスのうち未作成のものを追加"""
+    from app.models.sales import SalesTransaction
+
+    existing = {index["name"] for index in inspect(conn).get_indexes("sales_transactions")}
+    created = []
+    for index in SalesTransaction.__table__.indexes:
+        if index.name in existing:
+            continue
+        index.create(conn)
+        created.append(index.name)
+
+    if created:
+        # 新しいインデックスをクエリプランナーが選択できるよう統計情報を更新
+        conn.execute(text("ANALYZE sales_transactions"))
+        print(f"[MIGRATION] インデックス作成: {', '.join(created)}")
+
+
+def _add_sales_grid_indexes(conn: Connection):
+    """
+    管理画面の一覧（/api/admin/sales-data）の検索・並び替え用インデックスを追加
+      - GRID_TEXT_COLUMNS: (export_service.text_key と同じ式, id)。前方一致検索と、列 + id 順の並び替えに使う
+      - total_price: (total_price, id)
+      - transaction_date: SQLite の (transaction_date) インデックスは末尾に rowid（= id）を含むため PostgreSQL のみ追加
+    方言ごとに式が異なるため、モデルの __table_args__ ではなく DDL で作成する
+    """
+    from app.services.export_service import GRID_TEXT_COLUMNS
+
+    dialect = conn.dialect.name
+    statements = []
+    for column in GRID_TEXT_COLUMNS:
+        key = f'(lower({column}) COLLATE "C")' if dialect == "postgresql" else f"{column} COLLATE NOCASE"
+        statements.append(f"CREATE INDEX IF NOT EXISTS ix_sales_grid_{column} ON sales_transactions ({key}, id)")
+    statements.append("CREATE INDEX IF NOT EXISTS ix_sales_grid_total_price ON sales_transactions (total_price, id)")
+    if dialect == "postgresql":
+        statements.append(
+            "CREATE INDEX IF NOT EXISTS ix_sales_grid_transaction_date ON sales_transactions (transaction_date, id)"
+        )
+
+    for statement in statements:
+        conn.execute(text(statement))
+    conn.execute(text("ANALYZE sales_transactions"))
+    print(f"[MIGRATION] 一覧用インデックス作成: {len(statements)}件")
+
+
+def _add_sales_daily_rollup(conn: Connection):
+    """売上の日別集計テーブルを作成し、既存の売上データから集計"""
+    from app.models.sales import SalesDailyRollup
+    from app.services.rollup_service import RollupService
+
+    SalesDailyRollup.__table__.create(conn, checkfirst=True)
+    RollupService.rebuild(conn)
+
+
+# (バージョン, 移行処理) を適用順に並べる
+MIGRATIONS = [
+    ("0001_sales_transactions_fingerprint", _add_sales_fingerprint),
+    ("0002_sales_transactions_query_indexes", _add_sales_query_indexes),
+    ("0003_sales_daily_rollup", _add_sales_daily_rollup),
+    ("0004_sales_transactions_grid_indexes", _add_sales_grid_indexes),
+]
+
+
+def run_migrations(engine: Engine):
+    """未適用の移行を順番に適用（各移行は1トランザクション）"""
+    _metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    for version, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.utcnow()))
+        print(f"[MIGRATION] {version} を適用しました")
+
+
+if __name__ == "__main__":
+    from app.database import engine
+
+    run_migrations(engine)
@@ -1,5 +1,5 @@
-from .sales import SalesTransaction
+from .sales import SalesTransaction, SalesDailyRollup
 from .user import User
 from .store import Store
 
-__all__ = ["SalesTransaction", "User", "Store"]
+__all__ = ["SalesTransaction", "SalesDailyRollup", "User", "Store"]
@@ -1,9 +1,40 @@
+import hashlib
+import json
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Date, Integer, String, Float, DateTime, ForeignKey, Index
 from app.database import Base
 
+
+def transaction_fingerprint(transaction_date, ticket_number, staff_id, product_code, quantity, total_price) -> str:
+    """完全重複判定用のフィンガープリント（取引日時・伝票番号・担当者・商品・数量・金額のMD5）"""
+    hash_data = f"{transaction_date}_{ticket_number}_{staff_id}_{product_code}_{quantity}_{total_price}"
+    return hashlib.md5(hash_data.encode()).hexdigest()
+
+
+# 日別集計の集計キー（SalesDailyRollup の1行に対応する組み合わせ）
+ROLLUP_KEY_COLUMNS = (
+    "sales_date", "store_code", "staff_id", "staff_name", "service_category",
+    "large_category", "small_category", "product_code", "product_name",
+)
+
+
+def rollup_key(*values) -> str:
+    """集計キー（ROLLUP_KEY_COLUMNS の順の値）のMD5（NULL と空文字を区別するため JSON で連結）"""
+    hash_data = json.dumps([str(v) if v is not None else None for v in values], ensure_ascii=False)
+    return hashlib.md5(hash_data.encode()).hexdigest()
+
+
 class SalesTransaction(Base):
     __tablename__ = "sales_transactions"
+    __table_args__ = (
+        # SalesService の集計クエリの絞り込み条件に合わせた複合インデックス
+        # （既存DBへの追加は app/migrations.py の移行で行う）
+        Index("ix_sales_store_date", "store_code", "transaction_date"),  # 店舗 + 期間
+        Index("ix_sales_category_store_date", "large_category", "store_code", "transaction_date"),  # 大分類 + 店舗 + 期間
+        Index("ix_sales_staff_date", "staff_id", "transaction_date"),  # スタッフ + 期間
+        Index("ix_sales_date", "transaction_date"),  # 期間のみ（全店舗集計）
+        Index("ix_sales_service_category_date", "service_category", "transaction_date"),  # サービスカテゴリ + 期間（管理画面の絞り込み）
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     transaction_date = Column(DateTime, default=datetime.utcnow)
@@ -25,3 +56,37 @@ class SalesTransaction(Base):
     procedure_name = Column(String)  # 手続区分名
     procedure_name_2 = Column(String)  # 手続区分２名
     service_category = Column(String)  # サービスカテゴリ（MNP判定結果）
+    
+    # 重複排除用フィンガープリント（transaction_fingerprint の値、一意制約あり）
+    fingerprint = Column(String, unique=True, index=True)
+
+
+class SalesDailyRollup(Base):
+    """
+    売上の日別集計（集計キーごとの数量・売上額・粗利の合計と行数）
+    アップロード時に sales_transactions への挿入と同じトランザクションで加算する
+    """
+    __tablename__ = "sales_daily_rollup"
+    __table_args__ = (
+        Index("ix_rollup_store_date", "store_code", "sales_date"),
+        Index("ix_rollup_category_store_date", "large_category", "store_code", "sales_date"),
+        Index("ix_rollup_staff_date", "staff_id", "sales_date"),
+        Index("ix_rollup_date", "sales_date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # 集計キー（NULL を含む組み合わせでも一意制約が効くよう rollup_key() の値で判定）
+    rollup_key = Column(String, nullable=False, unique=True)
+    sales_date = Column(Date)
+    store_code = Column(String)
+    staff_id = Column(String)
+    staff_name = Column(String)
+    service_category = Column(String)
+    large_category = Column(String)
+    small_category = Column(String)
+    product_code = Column(String)
+    product_name = Column(String)
+    quantity = Column(Integer, nullable=False, default=0)
+    total_price = Column(Float, nullable=False, default=0)
+    gross_profit = Column(Float, nullable=False, default=0)
+    row_count = Column(Integer, nullable=False, default=0)
@@ -1,18 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field, field_validator
-from passlib.context import CryptContext
 from app.database import get_db
 from app.models.admin import AdminUser
 from app.models.sales import SalesTransaction
 from app.models.store import Store
+from app.services.export_service import EXPORT_MEDIA_TYPES, MAX_PAGE_SIZE, SEARCH_FIELDS, SORT_COLUMNS, ExportService
+from app.services.query_cache import query_cache
+from app.services.rollup_service import RollupService
+from app.utils.password_hasher import hash_password, verify_password
 from app.utils.jwt_auth import get_current_user, require_admin
+from app.utils.principal_cache import principal_cache
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
-# パスワードハッシング設定
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 class AdminLogin(BaseModel):
     password: str = Field(..., min_length=1, max_length=128)
 
@@ -35,14 +38,8 @@ class StoreCreate(BaseModel):
     location: str = Field(default="", max_length=256)
     phone: str = Field(default=None, max_length=32)
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
 @router.post("/verify-password")
-async def verify_password_endpoint(data: AdminLogin, current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def verify_password_endpoint(data: AdminLogin, current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """管理者パスワードを検証"""
     admin = db.query(AdminUser).filter(AdminUser.username == "admin").first()
     
@@ -65,7 +62,7 @@ async def verify_password_endpoint(data: AdminLogin, current_user=Depends(requir
         raise HTTPException(status_code=401, detail="パスワードが正しくありません")
 
 @router.post("/change-password")
-async def change_password_endpoint(data: AdminChangePassword, current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def change_password_endpoint(data: AdminChangePassword, current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """管理者パスワードを変更"""
     admin = db.query(AdminUser).filter(AdminUser.username == "admin").first()
     
@@ -81,57 +78,79 @@ async def change_password_endpoint(data: AdminChangePassword, current_user=Depen
     return {"success": True, "message": "パスワードを変更しました"}
 
 @router.get("/sales-data")
-async def get_sales_data(current_user=Depends(require_admin), db: Session = Depends(get_db), store_code: str = None):
-    """すべての売上データを取得"""
+def get_sales_data(
+    current_user=Depends(require_admin),
+    db: Session = Depends(get_db),
+    store_code: str = None,
+    start_date: str = None,
+    end_date: str = None,
+    staff_id: str = None,
+    large_category: str = None,
+    small_category: str = None,
+    service_category: str = None,
+    product: str = None,
+    search_field: str = None,
+    search: str = None,
+    sort: str = "transaction_date",
+    order: str = "asc",
+    page: int = Query(None, ge=1),
+    page_size: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    limit: int = Query(None, ge=1),
+    format: str = "json"
+):
+    """
+    売上データを取得（絞り込み・並び替えは SQL で行う）
+      - page 指定時：1ページ分と総件数 {"data", "count", "total", "page", "page_size", "pages"}
+      - page 省略時：条件に一致する全件を逐次出力
+        format: json（{"data": [...], "count": 件数}）/ ndjson（1行1件）/ csv（BOM付き UTF-8）、limit: 件数上限
+    絞り込み：store_code・staff_id・large_category・small_category・service_category（完全一致）、
+      期間（start_date 〜 end_date）、product（商品名・商品コードの前方一致）、search（search_field 列の前方一致）
+    sort: 並び替える列（SORT_COLUMNS のみ。インデックスのある列）、order: asc / desc
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不明な出力形式です: {format}（json / ndjson / csv）")
+    if sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"並び替えできない列です: {sort}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order は asc または desc を指定してください")
+    if search_field and search_field not in SEARCH_FIELDS:
+        raise HTTPException(status_code=400, detail=f"検索できない列です: {search_field}")
     try:
-        from sqlalchemy.orm import joinedload
-        from sqlalchemy import outerjoin
-        
-        query = db.query(SalesTransaction).outerjoin(Store, SalesTransaction.store_code == Store.store_code)
-        
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        transactions = query.all()
-        result = []
-        for t in transactions:
-            # 店舗情報を取得（なければNone）
-            store = db.query(Store).filter(Store.store_code == t.store_code).first()
-            store_name = store.store_name if store else t.store_code
-            
-            result.append({
-                "id": t.id,
-                "transaction_date": t.transaction_date.isoformat() if t.transaction_date else None,
-                "store_code": t.store_code,
-                "store_name": store_name,
-                "product_code": t.product_code,
-                "product_name": t.product_name,
-                "quantity": t.quantity,
-                "unit_price": t.unit_price,
-                "total_price": t.total_price,
-                "gross_profit": t.gross_profit,
-                "staff_id": t.staff_id,
-                "staff_name": t.staff_name,
-                "ticket_number": t.ticket_number,
-                "large_category": t.large_category,
-                "small_category": t.small_category,
-                "procedure_name": t.procedure_name,
-                "procedure_name_2": t.procedure_name_2,
-                "service_category": t.service_category,
-                "created_at": t.created_at.isoformat() if t.created_at else None,
-            })
-        return {"data": result, "count": len(result)}
-    except Exception as e:
-        print(f"[ERROR] /admin/sales-data: {e}")
-        raise HTTPException(status_code=500, detail="データ取得中にエラーが発生しました")
+        start = datetime.fromisoformat(start_date) if start_date else None
+        end = datetime.fromisoformat(end_date) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日付の形式が不正です（YYYY-MM-DD）")
+    
+    query = ExportService.build_query(
+        store_code, start, end, limit,
+        staff_id=staff_id, large_category=large_category, small_category=small_category,
+        service_category=service_category, product=product, search_field=search_field, search=search,
+        sort=sort, order=order, dialect=db.get_bind().dialect.name
+    )
+    
+    if page is not None:
+        try:
+            return ExportService.page(db, query, page, page_size)
+        except Exception as e:
+            print(f"[ERROR] /admin/sales-data: {e}")
+            raise HTTPException(status_code=500, detail="データ取得中にエラーが発生しました")
+    
+    headers = {}
+    if format == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="sales_data_{datetime.now():%Y%m%d_%H%M%S}.csv"'
+    return StreamingResponse(
+        ExportService.stream(query, format), media_type=EXPORT_MEDIA_TYPES[format], headers=headers
+    )
 
 @router.post("/clear-data")
-async def clear_data_endpoint(current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def clear_data_endpoint(current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """すべての売上データをクリア"""
     try:
-        # 全トランザクションを削除
+        # 全トランザクションと日別集計を削除
         db.query(SalesTransaction).delete()
+        RollupService.clear(db)
         db.commit()
+        query_cache.bump_generation()
         
         # 削除前の数を返す（ログ用）
         return {
@@ -143,8 +162,35 @@ async def clear_data_endpoint(current_user=Depends(require_admin), db: Session =
         print(f"[ERROR] /admin/clear-data: {e}")
         raise HTTPException(status_code=500, detail="データ削除中にエラーが発生しました")
 
+@router.get("/rollup/check")
+def check_rollup(current_user=Depends(require_admin), db: Session = Depends(get_db)):
+    """日別集計（sales_daily_rollup）と生データの集計が一致するか確認"""
+    try:
+        return RollupService.check(db)
+    except Exception as e:
+        print(f"[ERROR] /admin/rollup/check: {e}")
+        raise HTTPException(status_code=500, detail="日別集計の確認中にエラーが発生しました")
+
+@router.post("/rollup/rebuild")
+def rebuild_rollup(current_user=Depends(require_admin), db: Session = Depends(get_db)):
+    """日別集計を生データから作り直す"""
+    try:
+        rows = RollupService.rebuild(db)
+        db.commit()
+        query_cache.bump_generation()
+        return {"success": True, "rollup_rows": rows, "message": "日別集計を再構築しました"}
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] /admin/rollup/rebuild: {e}")
+        raise HTTPException(status_code=500, detail="日別集計の再構築中にエラーが発生しました")
+
+@router.get("/cache/stats")
+def get_cache_stats(current_user=Depends(require_admin)):
+    """集計結果キャッシュのヒット・ミス件数（principal: 認証ユーザーキャッシュ）"""
+    return dict(query_cache.stats(), principal=principal_cache.stats())
+
 @router.get("/stores")
-async def get_stores(current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+def get_stores(current_user=Depends(get_current_user), db: Session = Depends(get_db)):
     """店舗一覧を取得"""
     try:
         stores = db.query(Store).all()
@@ -163,7 +209,7 @@ async def get_stores(current_user=Depends(get_current_user), db: Session = Depen
         raise HTTPException(status_code=500, detail="店舗情報の取得中にエラーが発生しました")
 
 @router.post("/stores")
-async def create_store(store: StoreCreate, current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def create_store(store: StoreCreate, current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """新規店舗を追加"""
     try:
         # 重複チェック
@@ -196,7 +242,7 @@ async def create_store(store: StoreCreate, current_user=Depends(require_admin),
         raise HTTPException(status_code=500, detail="店舗追加中にエラーが発生しました")
 
 @router.delete("/delete-store")
-async def delete_store(request: Request, store_id: int, current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def delete_store(request: Request, store_id: int, current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """店舗を削除"""
     try:
         store = db.query(Store).filter(Store.id == store_id).first()
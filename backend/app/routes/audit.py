@@ -4,13 +4,14 @@ from app.database import get_db
 from app.models.user import User
 from app.models.audit_log import AuditLog
 from app.utils.jwt_auth import require_admin
+from app.utils.audit_logger import audit_log_writer
 from datetime import datetime, timedelta
 from typing import List
 
 router = APIRouter(prefix="/api", tags=["audit"])
 
 @router.get("/admin/security-logs")
-async def get_security_logs(
+def get_security_logs(
     request: Request,
     current_user=Depends(require_admin),
     event_type: str = Query(None),
@@ -72,7 +73,7 @@ async def get_security_logs(
     }
 
 @router.get("/admin/security-stats")
-async def get_security_stats(
+def get_security_stats(
     current_user=Depends(require_admin),
     days: int = Query(7),
     db: Session = Depends(get_db)
@@ -122,11 +123,13 @@ async def get_security_stats(
             "csv_uploads": csv_uploads
         },
         "period_days": days,
+        # 書き込みキューの状態（待ち件数・破棄件数など）
+        "writer": audit_log_writer.stats(),
         "generated_at": datetime.utcnow().isoformat()
     }
 
 @router.delete("/admin/security-logs/{log_id}")
-async def delete_security_log(
+def delete_security_log(
     log_id: int,
     request: Request,
     current_user=Depends(require_admin),
@@ -163,7 +166,7 @@ async def delete_security_log(
 
 
 @router.delete("/admin/security-logs-all")
-async def clear_all_security_logs(
+def clear_all_security_logs(
     request: Request,
     current_user=Depends(require_admin),
     db: Session = Depends(get_db)
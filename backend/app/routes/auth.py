@@ -2,19 +2,17 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, field_validator, Field
-from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from app.database import get_db
 from app.models.user import User
 from app.utils.rate_limiter import login_limiter
 from app.utils.audit_logger import log_event
+from app.utils.password_hasher import hash_password, verify_password
 from app.utils.jwt_auth import create_access_token, get_current_user, require_admin
+from app.utils.principal_cache import principal_cache
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
-# パスワードハッシング設定
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # スキーマ
 class UserLogin(BaseModel):
     username: str = Field(..., min_length=1, max_length=64)
@@ -63,14 +61,8 @@ class UserCreate(BaseModel):
 class UserReset(BaseModel):
     username: str
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
 @router.post("/login")
-async def login(request: Request, data: UserLogin, db: Session = Depends(get_db)):
+def login(request: Request, data: UserLogin, db: Session = Depends(get_db)):
     """ユーザーログイン"""
     # IPアドレス取得
     ip_address = request.client.host if request.client else "unknown"
@@ -149,19 +141,22 @@ async def logout():
     return {"success": True, "message": "ログアウトしました"}
 
 @router.post("/change-password")
-async def change_password(data: UserChangePassword, current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+def change_password(data: UserChangePassword, current_user=Depends(get_current_user), db: Session = Depends(get_db)):
     """パスワード変更（一般ユーザー用）"""
-    if not verify_password(data.old_password, current_user.password_hash):
+    # current_user はキャッシュのスナップショットのため、更新対象はDBから取得する
+    user = db.query(User).filter(User.id == current_user.id).first()
+    if not user or not verify_password(data.old_password, user.password_hash):
         raise HTTPException(status_code=401, detail="現在のパスワードが正しくありません")
     
-    current_user.password_hash = hash_password(data.new_password)
-    current_user.updated_at = datetime.now(timezone.utc)
+    user.password_hash = hash_password(data.new_password)
+    user.updated_at = datetime.now(timezone.utc)
     db.commit()
+    principal_cache.invalidate(user.id)
     
     return {"success": True, "message": "パスワードを変更しました"}
 
 @router.post("/admin/create-user")
-async def create_user(data: UserCreate, current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def create_user(data: UserCreate, current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """ユーザー作成（管理者用）"""
     # ユーザーが既に存在するか確認
     existing = db.query(User).filter(User.username == data.username).first()
@@ -181,6 +176,8 @@ async def create_user(data: UserCreate, current_user=Depends(require_admin), db:
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    # 削除済みユーザーの ID が再利用された場合に「ユーザーなし」のキャッシュが残らないようにする
+    principal_cache.invalidate(new_user.id)
     
     return {
         "success": True,
@@ -189,7 +186,7 @@ async def create_user(data: UserCreate, current_user=Depends(require_admin), db:
     }
 
 @router.post("/admin/reset-password")
-async def reset_password(request: Request, data: UserReset, current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def reset_password(request: Request, data: UserReset, current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """パスワードリセット（管理者用）"""
     ip_address = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "unknown")
@@ -210,6 +207,7 @@ async def reset_password(request: Request, data: UserReset, current_user=Depends
     user.password_hash = hash_password(default_password)
     user.updated_at = datetime.now(timezone.utc)
     db.commit()
+    principal_cache.invalidate(user.id)
     
     log_event(
         event_type="password_reset",
@@ -232,7 +230,7 @@ async def reset_password(request: Request, data: UserReset, current_user=Depends
     }
 
 @router.get("/admin/users")
-async def list_users(current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def list_users(current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """ユーザー一覧を取得（管理者用）"""
     users = db.query(User).all()
     return [
@@ -249,7 +247,7 @@ async def list_users(current_user=Depends(require_admin), db: Session = Depends(
     ]
 
 @router.delete("/admin/users/{username}")
-async def delete_user(request: Request, username: str, current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def delete_user(request: Request, username: str, current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """ユーザーを削除（管理者用）"""
     ip_address = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "unknown")
@@ -278,6 +276,7 @@ async def delete_user(request: Request, username: str, current_user=Depends(requ
     # ユーザーを削除
     db.delete(user)
     db.commit()
+    principal_cache.invalidate(user.id)
     
     log_event(
         event_type="user_deleted",
@@ -302,7 +301,7 @@ class UserUpdate(BaseModel):
     store_code: str = None
 
 @router.put("/admin/users/{username}")
-async def update_user(request: Request, username: str, data: UserUpdate, current_user=Depends(require_admin), db: Session = Depends(get_db)):
+def update_user(request: Request, username: str, data: UserUpdate, current_user=Depends(require_admin), db: Session = Depends(get_db)):
     """ユーザー情報を更新（管理者用）"""
     ip_address = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "unknown")
@@ -330,6 +329,7 @@ async def update_user(request: Request, username: str, data: UserUpdate, current
         user.updated_at = datetime.now(timezone.utc)
     
     db.commit()
+    principal_cache.invalidate(user.id)
     
     log_event(
         event_type="user_updated",
@@ -1,27 +1,36 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query
+import base64
+import json
+import os
+import tempfile
+from datetime import datetime
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.services.csv_service import CSVService
 from app.services.sales_service import SalesService
+from app.services.dashboard_service import PANELS, DashboardService
+from app.services.query_cache import query_cache
+from app.services.upload_service import UploadService
+from app.services.upload_jobs import upload_job_queue
 from app.models.sales import SalesTransaction
-from app.models.store import Store
 from app.schemas import SalesTransactionRead
 from app.utils.jwt_auth import get_current_user
+from app.utils.http_cache import conditional_etag
+from app.utils.state_backend import StateBackendUnavailable
 from app.config import MAX_UPLOAD_SIZE_MB
 from typing import List
 
 router = APIRouter(prefix="/api", tags=["sales"])
 
 _ALLOWED_CONTENT_TYPES = {"text/csv", "application/csv", "application/octet-stream", "text/plain"}
+# アップロードファイルをディスクに書き出す単位
+_SPOOL_BLOCK_BYTES = 1024 * 1024
+# /transactions の1ページの最大件数
+_MAX_TRANSACTIONS_PAGE_SIZE = 1000
 
-@router.post("/upload")
-async def upload_csv(file: UploadFile = File(...), current_user=Depends(get_current_user), db: Session = Depends(get_db)):
-    """CSVファイルをアップロードして販売データを登録
-    
-    user_idが与えられた場合、権限チェックを実施します。
-    一般ユーザー(role != 'admin')は自身の店舗のデータのみアップロード可能です。
-    CSVに複数の店舗が含まれている場合、一般ユーザーの場合は自身の店舗のデータのみを抽出します。
-    """
+def _validate_upload_file(file: UploadFile):
+    """アップロードファイルの拡張子・Content-Type をチェック"""
     # ファイル名の拡張子チェック
     filename = file.filename or ""
     if not filename.lower().endswith(".csv"):
@@ -31,91 +40,57 @@ async def upload_csv(file: UploadFile = File(...), current_user=Depends(get_curr
     if content_type and content_type not in _ALLOWED_CONTENT_TYPES:
         raise HTTPException(status_code=400, detail=f"サポートされないファイル形式です: {content_type}")
 
-    try:
-        import hashlib
-        
-        print(f"[CSV] Upload started - user: {current_user.username} (id={current_user.id}, role={current_user.role})")
-
-        # ファイルをバイナリで読み込み
-        content = await file.read()
 
+async def _spool_upload(file: UploadFile, spool):
+    """アップロードファイルをディスクに退避（上限を超えた時点で中断し、全体をメモリに載せない）"""
+    max_bytes = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+    size = 0
+    while True:
+        block = await file.read(_SPOOL_BLOCK_BYTES)
+        if not block:
+            break
+        size += len(block)
         # ファイルサイズ上限チェック
-        max_bytes = MAX_UPLOAD_SIZE_MB * 1024 * 1024
-        if len(content) > max_bytes:
+        if size > max_bytes:
             raise HTTPException(status_code=413, detail=f"ファイルサイズが上限（{MAX_UPLOAD_SIZE_MB}MB）を超えています")
-        
-        # CSVから店舗情報を抽出
-        store_info_list = CSVService.extract_store_info(content)
-        
-        # ユーザー情報取得（JWTから取得済み）
-        user = current_user
-        
-        # 抽出した店舗情報をDBに登録（一般ユーザーは自身の店舗のみ）
-        registered_stores = []
-        for store_info in store_info_list:
-            # 非管理者ユーザーの場合、自身の店舗のみ処理
-            if user and user.role != 'admin' and store_info['store_code'] != user.store_code:
-                print(f"⚠️ スキップ: {store_info['store_name']} ({store_info['store_code']}) - ユーザーの店舗ではありません")
-                continue
-            
-            existing_store = db.query(Store).filter(Store.store_code == store_info['store_code']).first()
-            if not existing_store:
-                new_store = Store(
-                    store_code=store_info['store_code'],
-                    store_name=store_info['store_name'],
-                    location=store_info.get('location', '未設定')
-                )
-                db.add(new_store)
-                registered_stores.append(f"新規：{store_info['store_name']} ({store_info['store_code']})")
-            else:
-                # 既存店舗の場合は店舗名を更新
-                if existing_store.store_name.startswith('店舗 ') and store_info['store_name']:
-                    existing_store.store_name = store_info['store_name']
-                    db.add(existing_store)
-                    registered_stores.append(f"更新：{store_info['store_name']} ({store_info['store_code']})")
-        
-        db.commit()
-        
-        # CSV解析（エンコーディング自動検出）
-        transactions = CSVService.parse_sales_csv(content)
-        
-        # 既存データのハッシュを取得（完全重複を検出するため）
-        existing_hashes = set()
-        existing_records = db.query(SalesTransaction).all()
-        for record in existing_records:
-            # レコードの主要な情報でハッシュを作成
-            hash_data = f"{record.transaction_date}_{record.ticket_number}_{record.staff_id}_{record.product_code}_{record.quantity}_{record.total_price}"
-            existing_hashes.add(hashlib.md5(hash_data.encode()).hexdigest())
-        
-        # 新規レコードのみをフィルタリング
-        new_transactions = []
-        duplicate_count = 0
-        filtered_out_count = 0
-        
-        for transaction in transactions:
-            # 非管理者ユーザーがアップロードする場合、ユーザーの店舗のデータのみを抽出
-            if user and user.role != 'admin' and transaction.store_code != user.store_code:
-                filtered_out_count += 1
-                continue
-
-            # トランザクションのハッシュを作成
-            hash_data = f"{transaction.transaction_date}_{transaction.ticket_number}_{transaction.staff_id}_{transaction.product_code}_{transaction.quantity}_{transaction.total_price}"
-            tx_hash = hashlib.md5(hash_data.encode()).hexdigest()
+        spool.write(block)
+    spool.flush()
+
+
+def _ingest_and_commit(db: Session, spool, user):
+    result = UploadService.ingest_csv(db, spool, user)
+    db.commit()
+    query_cache.bump_generation()
+    return result
+
+
+@router.post("/upload")
+async def upload_csv(file: UploadFile = File(...), current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+    """CSVファイルをアップロードして販売データを登録
+    
+    user_idが与えられた場合、権限チェックを実施します。
+    一般ユーザー(role != 'admin')は自身の店舗のデータのみアップロード可能です。
+    CSVに複数の店舗が含まれている場合、一般ユーザーの場合は自身の店舗のデータのみを抽出します。
+    大きなファイルは POST /api/upload/jobs（バックグラウンド取込）の利用を推奨します。
+    """
+    _validate_upload_file(file)
+
+    try:
+        print(f"[CSV] Upload started - user: {current_user.username} (id={current_user.id}, role={current_user.role})")
+
+        with tempfile.TemporaryFile() as spool:
+            await _spool_upload(file, spool)
             
-            if tx_hash not in existing_hashes:
-                new_transactions.append(transaction)
-                existing_hashes.add(tx_hash)
-            else:
-                duplicate_count += 1
-        
-        # データベースに保存
-        for transaction in new_transactions:
-            db_transaction = SalesTransaction(**transaction.dict())
-            db.add(db_transaction)
+            # チャンク単位で店舗登録・解析・一括挿入（コミットは最後に1回）
+            # 同期処理のためスレッドプールで実行し、イベントループを止めない
+            result = await run_in_threadpool(_ingest_and_commit, db, spool, current_user)
         
-        db.commit()
+        inserted_count = result["inserted"]
+        duplicate_count = result["duplicates"]
+        filtered_out_count = result["filtered_out"]
+        registered_stores = result["registered_stores"]
         
-        message = f"Successfully uploaded {len(new_transactions)} new transactions"
+        message = f"Successfully uploaded {inserted_count} new transactions"
         if duplicate_count > 0:
             message += f" (skipped {duplicate_count} duplicates)"
         if filtered_out_count > 0:
@@ -127,7 +102,7 @@ async def upload_csv(file: UploadFile = File(...), current_user=Depends(get_curr
         
         return {
             "message": message + store_message,
-            "count": len(new_transactions),
+            "count": inserted_count,
             "store_count": len(registered_stores),
             "stores": registered_stores,
             "duplicates": duplicate_count,
@@ -142,17 +117,137 @@ async def upload_csv(file: UploadFile = File(...), current_user=Depends(get_curr
         db.rollback()
         raise HTTPException(status_code=400, detail="CSVファイルの処理中にエラーが発生しました。ファイル形式を確認してください")
 
+@router.post("/upload/jobs", status_code=202)
+async def create_upload_job(file: UploadFile = File(...), current_user=Depends(get_current_user)):
+    """CSVファイルを取込ジョブとして受け付け、ジョブIDを即時に返す
+    
+    解析・登録はバックグラウンドで実行され、進捗は GET /api/upload/jobs/{job_id} で確認できます。
+    権限チェック（一般ユーザーは自身の店舗のデータのみ登録）は /api/upload と同じです。
+    """
+    _validate_upload_file(file)
+
+    print(f"[CSV] Upload job requested - user: {current_user.username} (id={current_user.id}, role={current_user.role})")
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=".csv")
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            await _spool_upload(file, spool)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    # ジョブの登録は解析プロセスとの通信を伴うため、イベントループを止めないようスレッドプールで実行
+    job = await run_in_threadpool(upload_job_queue.submit, path, file.filename, current_user)
+    return upload_job_queue.snapshot(job)
+
+@router.get("/upload/jobs/{job_id}")
+def get_upload_job(job_id: str, current_user=Depends(get_current_user)):
+    """取込ジョブの進捗（段階・処理行数・重複件数・エラー）を取得
+    
+    ジョブを登録したユーザーと管理者のみ参照できます。
+    """
+    try:
+        job = upload_job_queue.find(job_id, current_user)
+    except StateBackendUnavailable as e:
+        print(f"[ERROR] /upload/jobs/{job_id}: {e}")
+        raise HTTPException(status_code=503, detail="取込ジョブの状態を取得できません。しばらくしてから再試行してください")
+    if job is None:
+        raise HTTPException(status_code=404, detail="取込ジョブが見つかりません")
+    return job
+
+def _encode_cursor(transaction_date, transaction_id: int) -> str:
+    """次ページの開始位置（最後の行の transaction_date, id）を不透明な文字列にする"""
+    payload = json.dumps({"d": transaction_date.isoformat() if transaction_date else None, "i": transaction_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    """Returns: (transaction_date（日付が解釈できなかった行は None）, id)"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        last_date = datetime.fromisoformat(payload["d"]) if payload["d"] is not None else None
+        return last_date, int(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="cursor が不正です")
+
+
+def _after_cursor(last_date, last_id: int):
+    """
+    (transaction_date, id) の並び（transaction_date が NULL の行が先頭）で cursor より後の行の条件
+    NULL は比較演算子では一致しないため、IS NULL / IS NOT NULL で明示的に判定する
+    """
+    if last_date is None:
+        return or_(
+            and_(SalesTransaction.transaction_date.is_(None), SalesTransaction.id > last_id),
+            SalesTransaction.transaction_date.is_not(None),
+        )
+    return or_(
+        SalesTransaction.transaction_date > last_date,
+        and_(SalesTransaction.transaction_date == last_date, SalesTransaction.id > last_id)
+    )
+
+
 @router.get("/transactions", response_model=List[SalesTransactionRead])
-def get_transactions(current_user=Depends(get_current_user), db: Session = Depends(get_db), skip: int = 0, limit: int = 100):
-    """販売トランザクション一覧を取得"""
+def get_transactions(
+    response: Response,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cursor: str = None,
+    limit: int = Query(100, ge=1, le=_MAX_TRANSACTIONS_PAGE_SIZE),
+    skip: int = Query(0, ge=0)
+):
+    """
+    販売トランザクション一覧を取得（transaction_date, id の昇順。transaction_date が NULL の行は先頭）
+    次ページがある場合は X-Next-Cursor ヘッダーの値を cursor に指定して取得する（ページの深さによらず一定の速度）
+    skip は互換性のため残しているが、深いページほど遅くなるため cursor を使うこと
+    """
     query = db.query(SalesTransaction)
     # 非adminユーザーは自身の店舗のデータのみに制限
     if current_user.role != 'admin':
         query = query.filter(SalesTransaction.store_code == current_user.store_code)
-    transactions = query.offset(skip).limit(limit).all()
+    if cursor:
+        query = query.filter(_after_cursor(*_decode_cursor(cursor)))
+    # NULL の位置はDBごとに異なる（PostgreSQL は末尾）ため、cursor の条件に合わせて先頭に固定する
+    query = query.order_by(SalesTransaction.transaction_date.asc().nulls_first(), SalesTransaction.id)
+    if not cursor and skip:
+        query = query.offset(skip)
+    # 次ページの有無を判定するため1件多く取得
+    transactions = query.limit(limit + 1).all()
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        response.headers["X-Next-Cursor"] = _encode_cursor(last.transaction_date, last.id)
     return transactions
 
-@router.get("/summary/daily")
+@router.get("/dashboard", dependencies=[Depends(conditional_etag)])
+def get_dashboard(
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+    panels: str = None,
+    staff_id: str = None,
+    store_code: str = None,
+    start_date: str = None,
+    end_date: str = None
+):
+    """
+    ダッシュボードの複数パネルを1回のリクエストで集計
+    panels: カンマ区切りのパネル名（省略時は全パネル）。各パネルの形式は個別APIと同じ
+      daily=/summary/daily, product=/summary/product, au1_total=/au1-collection/total,
+      au1_summary=/au1-collection/summary, au1_category=/au1-collection/category,
+      au1_detail=/au1-collection/detail, au1_daily=/au1-collection/daily, unit_price=/smartphone/unit-price
+    staff_id・store_code・期間はすべてのパネルに共通で適用する
+    """
+    
+    names = [name.strip() for name in panels.split(",") if name.strip()] if panels else list(PANELS)
+    unknown = [name for name in names if name not in PANELS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不明なパネルです: {', '.join(unknown)}")
+    
+    start = datetime.fromisoformat(start_date) if start_date else None
+    end = datetime.fromisoformat(end_date) if end_date else None
+    
+    return DashboardService.build(db, names, staff_id, store_code, start, end)
+
+@router.get("/summary/daily", dependencies=[Depends(conditional_etag)])
 def get_daily_summary(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -161,7 +256,6 @@ def get_daily_summary(
     end_date: str = None
 ):
     """日別売上サマリーを取得"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -179,7 +273,7 @@ def get_daily_summary(
         for row in summary
     ]
 
-@router.get("/summary/product")
+@router.get("/summary/product", dependencies=[Depends(conditional_etag)])
 def get_product_summary(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -188,7 +282,6 @@ def get_product_summary(
     end_date: str = None
 ):
     """商品別売上サマリーを取得"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -206,7 +299,7 @@ def get_product_summary(
         for row in summary
     ]
 
-@router.get("/summary/staff-list")
+@router.get("/summary/staff-list", dependencies=[Depends(conditional_etag)])
 def get_staff_list(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -224,7 +317,7 @@ def get_staff_list(
         for staff in staff_list
     ]
 
-@router.get("/summary/staff-performance")
+@router.get("/summary/staff-performance", dependencies=[Depends(conditional_etag)])
 def get_staff_performance(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -234,7 +327,6 @@ def get_staff_performance(
     end_date: str = None
 ):
     """スタッフ別成績を取得（サービス種別ごとの詳細）"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -253,7 +345,7 @@ def get_staff_performance(
         for result in performance
     ]
 
-@router.get("/summary/staff-aggregated")
+@router.get("/summary/staff-aggregated", dependencies=[Depends(conditional_etag)])
 def get_staff_aggregated(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -263,7 +355,6 @@ def get_staff_aggregated(
     end_date: str = None
 ):
     """スタッフ別集計成績（サービス別集計済み）"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -290,7 +381,7 @@ def get_staff_aggregated(
     
     return result_list
 
-@router.get("/au1-collection/summary")
+@router.get("/au1-collection/summary", dependencies=[Depends(conditional_etag)])
 def get_au1_collection_summary(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -300,7 +391,6 @@ def get_au1_collection_summary(
     end_date: str = None
 ):
     """au+1Collection実績サマリー"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -319,7 +409,7 @@ def get_au1_collection_summary(
     ]
 
 
-@router.get("/au1-collection/detail")
+@router.get("/au1-collection/detail", dependencies=[Depends(conditional_etag)])
 def get_au1_collection_detail(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -329,7 +419,6 @@ def get_au1_collection_detail(
     end_date: str = None
 ):
     """au+1Collection詳細統計（商品別）"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -350,7 +439,7 @@ def get_au1_collection_detail(
     ]
 
 
-@router.get("/au1-collection/category")
+@router.get("/au1-collection/category", dependencies=[Depends(conditional_etag)])
 def get_au1_collection_category(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -360,7 +449,6 @@ def get_au1_collection_category(
     end_date: str = None
 ):
     """au+1Collection中分類別集計"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -380,7 +468,7 @@ def get_au1_collection_category(
     ]
 
 
-@router.get("/au1-collection/daily")
+@router.get("/au1-collection/daily", dependencies=[Depends(conditional_etag)])
 def get_au1_collection_daily(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -390,7 +478,6 @@ def get_au1_collection_daily(
     end_date: str = None
 ):
     """au+1Collection日別推移"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -408,7 +495,7 @@ def get_au1_collection_daily(
     ]
 
 
-@router.get("/au1-collection/total")
+@router.get("/au1-collection/total", dependencies=[Depends(conditional_etag)])
 def get_au1_collection_total(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -417,28 +504,11 @@ def get_au1_collection_total(
     end_date: str = None
 ):
     """au+1Collection全体統計（全スタッフ合計）"""
-    from datetime import datetime
-    from sqlalchemy import func
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
     
-    query = db.query(
-        func.count(SalesTransaction.id).label("transaction_count"),
-        func.sum(SalesTransaction.total_price).label("total_sales"),
-        func.sum(SalesTransaction.gross_profit).label("gross_profit")
-    ).filter(SalesTransaction.large_category == 'au+1 Collection')
-    
-    if store_code:
-        query = query.filter(SalesTransaction.store_code == store_code)
-    
-    if start:
-        query = query.filter(SalesTransaction.transaction_date >= start)
-    
-    if end:
-        query = query.filter(SalesTransaction.transaction_date <= end)
-    
-    result = query.first()
+    result = SalesService.get_au_plus_one_collection_total(db, store_code, start, end)
     
     transaction_count = result[0] or 0
     total_sales = float(result[1]) if result[1] else 0
@@ -450,7 +520,7 @@ def get_au1_collection_total(
         "gross_profit": gross_profit
     }
 
-@router.get("/smartphone/unit-price")
+@router.get("/smartphone/unit-price", dependencies=[Depends(conditional_etag)])
 def get_smartphone_unit_price(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -460,7 +530,6 @@ def get_smartphone_unit_price(
     end_date: str = None
 ):
     """スマートフォン台当たり単価（au+1 Collection粗利 ÷ スマートフォン台数）"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -469,7 +538,7 @@ def get_smartphone_unit_price(
     
     return results
 
-@router.get("/smartphone/summary")
+@router.get("/smartphone/summary", dependencies=[Depends(conditional_etag)])
 def get_smartphone_sales_summary(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -479,7 +548,6 @@ def get_smartphone_sales_summary(
     end_date: str = None
 ):
     """スマートフォン販売（移動機 + iPhone/スマートフォン）実績サマリー"""
-    from datetime import datetime
     
     start = datetime.fromisoformat(start_date) if start_date else None
     end = datetime.fromisoformat(end_date) if end_date else None
@@ -22,6 +22,8 @@ class SalesTransactionCreate(BaseModel):
     service_category: Optional[str] = None
 
 class SalesTransactionRead(SalesTransactionCreate):
+    # 日付が解釈できずに登録された行は NULL
+    transaction_date: Optional[datetime] = None
     id: int
     created_at: datetime
 
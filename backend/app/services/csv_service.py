@@ -1,9 +1,173 @@
+import codecs
+import io
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 from io import StringIO
-from typing import List, Dict, Tuple
+from typing import BinaryIO, Callable, Hashable, Iterator, List, Dict, Optional, Tuple, Union
 import chardet
 from datetime import datetime
+from pydantic import TypeAdapter, ValidationError
 from app.schemas import SalesTransactionCreate
+from app.utils.state_backend import StateBackendUnavailable, state_backend
+
+# 実際のCSVファイル構造に合わせたマッピング
+# POS売上明細データの場合（transaction_date は 売上日付 + 売上時刻 の複合カラム）
+COLUMN_INDEX_MAP = {
+    'store_code': 1,  # 統括拠点コード
+    'store_name': 2,  # 統括拠点名
+    'sales_date': 4,  # 売上日付
+    'sales_time': 5,  # 売上時刻
+    'ticket_number': 7,  # 売上伝票番号
+    'product_code': 16,  # 商品コード
+    'product_name': 17,  # POS表示商品名
+    'large_category': 21,  # 大分類名
+    'small_category': 23,  # 中分類名
+    'quantity': 30,  # 数量
+    'unit_price': 31,  # 販売単価（税込）
+    'total_price': 32,  # 販売明細額（税込）
+    'procedure_name': 48,  # 手続区分名
+    'procedure_name_2': 50,  # 手続区分２名
+    'staff_id': 57,  # 実績ユーザーID
+    'staff_name_first': 58,  # 実績担当者姓
+    'staff_name_last': 59,  # 実績担当者名
+    'contract_type': 64,  # お客様契約区分名
+    'gross_profit': 73,  # 粗利（column 73）
+}
+
+# read_csv で読み込むカラム位置（COLUMN_INDEX_MAP に含まれるカラムのみ）
+READ_POSITIONS = sorted(set(COLUMN_INDEX_MAP.values()))
+# カテゴリ型で読み込むカラム（種類が少なく同じ値が繰り返し出現する分類名）
+CATEGORY_COLUMNS = ['large_category', 'small_category', 'procedure_name', 'procedure_name_2']
+# 文字列のまま読み込むカラム（コード・名称・日時）
+# 型を推論させると、空欄を含むチャンクだけ数値が float になり "5555" が "5555.0" に変わる（先頭の 0 も落ちる）ため、
+# 一括読み込みとチャンク読み込みで同じ値になるよう文字列として読み込む
+TEXT_COLUMNS = [
+    'store_code', 'store_name', 'sales_date', 'sales_time', 'ticket_number', 'product_code', 'product_name',
+    'staff_id', 'staff_name_first', 'staff_name_last', 'contract_type',
+]
+
+# 売上日付 + 売上時刻 の対応フォーマット（先頭から順に試行）
+DATE_FORMATS = ["%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d", "%Y%m%d %H:%M:%S"]
+
+# ファイルの日付形式を判定する際に調べる値の数（重複を除いた先頭から）
+DATE_FORMAT_SAMPLE_SIZE = 50
+# pandas の一括変換は秒 60・61 を繰り上げて受理してしまうため、strptime で個別に判定する
+_LEAP_SECOND_PATTERN = r':6[01]$'
+
+# デコード失敗時に順に試すエンコーディング
+FALLBACK_ENCODINGS = ['utf-8', 'shift_jis', 'cp932', 'euc_jp', 'latin-1']
+
+# chardet による推定は遅いため、まず厳密デコードできるかを試すエンコーディング（先頭から順に）
+FAST_PATH_ENCODINGS = ['utf-8', 'cp932']
+# chardet に渡す先頭バイト数（ファイルサイズによらず推定時間を一定にする）
+ENCODING_SAMPLE_BYTES = 64 * 1024
+# 確認済みエンコーディングの記憶を state_backend に保持する秒数と名前空間
+_ENCODING_RECORD_TTL_SECONDS = 30 * 24 * 3600
+_ENCODING_RECORD_NAMESPACE = "csv_encoding"
+# ストリーミング読み込み時の逐次デコードの読み込み単位
+_STREAM_BLOCK_BYTES = 1024 * 1024
+
+_TRANSACTION_LIST_ADAPTER = TypeAdapter(List[SalesTransactionCreate])
+
+class EncodingCache:
+    """
+    確認済みエンコーディングの記憶（店舗・アップロードユーザー単位）
+    同じ店舗・ユーザーの2回目以降のアップロードはエンコーディング推定を省略する
+    state_backend にも保存し、STATE_BACKEND=sqlite なら別のワーカーで受け付けたアップロードにも引き継ぐ
+    （記憶は推定の優先候補にすぎないため、保存先を読み書きできない場合はプロセス内の記憶のみで続行する）
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = _ENCODING_RECORD_TTL_SECONDS, backend=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend or state_backend
+        self.entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[str]:
+        with self.lock:
+            encoding = self.entries.get(key)
+            if encoding is not None:
+                self.entries.move_to_end(key)
+                return encoding
+        try:
+            encoding = self.backend.get_record(_ENCODING_RECORD_NAMESPACE, repr(key))
+        except StateBackendUnavailable:
+            return None
+        if encoding is not None:
+            self._remember(key, encoding)
+        return encoding
+    
+    def put(self, key: Hashable, encoding: str):
+        self._remember(key, encoding)
+        try:
+            self.backend.put_record(_ENCODING_RECORD_NAMESPACE, repr(key), encoding, self.ttl_seconds)
+        except StateBackendUnavailable as e:
+            print(f"[警告] エンコーディングの記憶を共有できません: {e}")
+    
+    def _remember(self, key: Hashable, encoding: str):
+        with self.lock:
+            self.entries[key] = encoding
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# グローバルエンコーディングキャッシュ
+encoding_cache = EncodingCache()
+
+
+class CSVReadPlan:
+    """
+    POSエクスポート用の read_csv 設定
+    READ_POSITIONS のカラムのみ読み込み、分類名は CATEGORY_COLUMNS に従いカテゴリ型、
+    コード・名称は TEXT_COLUMNS に従い文字列型で保持する（数値カラムのみ型を推論）
+    読み込んだ DataFrame のカラムラベルは元ファイルでのカラム位置（int）に置き換える
+    """
+    
+    def __init__(self, header: List[str]):
+        self.header = header
+        self.positions = [position for position in READ_POSITIONS if position < len(header)]
+        self.dtype = {
+            header[COLUMN_INDEX_MAP[name]]: str
+            for name in TEXT_COLUMNS if COLUMN_INDEX_MAP[name] < len(header)
+        }
+        self.dtype.update({
+            header[COLUMN_INDEX_MAP[name]]: 'category'
+            for name in CATEGORY_COLUMNS if COLUMN_INDEX_MAP[name] < len(header)
+        })
+    
+    @staticmethod
+    def from_text(text) -> "CSVReadPlan":
+        """ヘッダー行からプランを作成（text は先頭に巻き戻す）"""
+        header = pd.read_csv(text, nrows=0).columns.tolist()
+        text.seek(0)
+        print(f"[CSV] 検出カラム数: {len(header)}")
+        print(f"[CSV] 実際のカラム: {header[:10]}")  # 最初の10カラムをログに出力
+        return CSVReadPlan(header)
+    
+    def read_csv(self, text, **kwargs):
+        """プランに従って read_csv を実行（chunksize 指定時はリーダーを返す）"""
+        return pd.read_csv(text, usecols=self.positions, dtype=self.dtype, **kwargs)
+    
+    def label(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """カラムラベルを元ファイルでの位置に置き換える"""
+        frame.columns = self.positions
+        return frame
+
+
+class ParsedCSV:
+    """
+    デコード・読み込み済みのアップロードCSV
+    df のカラムラベルは元ファイルでのカラム位置（CSVReadPlan 参照）
+    """
+    
+    def __init__(self, df: pd.DataFrame, encoding: str):
+        self.df = df
+        self.encoding = encoding
+
 
 class MNPJudge:
     """MNP判定ロジック"""
@@ -97,6 +261,61 @@ class MNPJudge:
         
         return result
 
+    @staticmethod
+    def judge_frame(frame: pd.DataFrame) -> pd.Series:
+        """
+        複数伝票の行をまとめてサービスカテゴリ判定（judge_service_category と同じ結果）
+        frame: ticket_number, large_category, small_category, procedure_name, product_name,
+               お客様契約区分名 の文字列カラムを持つDataFrame
+        Returns: 各行のサービスカテゴリ（frame と同じ index）
+        """
+        large_cat = frame['large_category']
+        small_cat = frame['small_category']
+        procedure = frame['procedure_name']
+        product_name = frame['product_name'].astype(str)
+        contract_type = frame['お客様契約区分名']
+        
+        # 行単位のフラグを算出し、伝票単位で1回のgroupbyで集約
+        is_device = (large_cat == '移動機') & (small_cat != '')
+        is_sim = (large_cat == 'SIM') & (small_cat != '')
+        row_flags = pd.DataFrame({
+            'has_procedure': procedure.str.contains('MNP', regex=False) | procedure.str.contains('番号移行', regex=False),
+            'has_device_au': is_device & (
+                product_name.str.lower().str.contains('au', regex=False) | small_cat.isin(['iPhone', 'スマートフォン'])
+            ),
+            'has_device_uq': is_device & product_name.str.upper().str.contains('UQ', regex=False),
+            'has_au_sim': is_sim & small_cat.isin(['au-SIM', 'eSIM']),
+            'has_uq_sim': is_sim & small_cat.isin(['UQ-SIM', 'UQ-SIM2']),
+        }, index=frame.index)
+        ticket_flags = row_flags.groupby(frame['ticket_number'], sort=False).transform('any')
+        has_procedure = ticket_flags['has_procedure']
+        has_device_au = ticket_flags['has_device_au']
+        has_device_uq = ticket_flags['has_device_uq']
+        has_au_sim = ticket_flags['has_au_sim']
+        has_uq_sim = ticket_flags['has_uq_sim']
+        
+        # 優先度の低い判定から順に上書きする
+        result = large_cat.to_numpy(dtype=object, copy=True)
+        is_sim_category = (large_cat == 'SIM').to_numpy()
+        rules = [
+            # MNPでない場合のカテゴリ判定
+            (is_sim_category, None),
+            (is_sim_category & (small_cat == 'UQ-SIM').to_numpy(), 'UQ-SIM単体販売'),
+            (is_sim_category & (small_cat == 'au-SIM').to_numpy(), 'au-SIM単体販売'),
+            (procedure.str.contains('機種変更', regex=False).to_numpy(), '機種変更'),
+            (small_cat.str.contains('店頭設定サポート', regex=False).to_numpy(), 'au店頭設定サポート'),
+            ((large_cat == 'au+1 Collection').to_numpy(), 'au+1Collection'),
+            # MNP判定
+            ((has_procedure & (contract_type == 'UQ') & has_uq_sim & ~has_device_uq).to_numpy(), 'UQMNP(SIM単体)'),
+            ((has_procedure & (contract_type == 'UQ') & has_device_uq & has_uq_sim).to_numpy(), 'UQMNP(端末あり)'),
+            ((has_procedure & (contract_type == 'au') & has_au_sim & ~has_device_au).to_numpy(), 'auMNP(SIM単体)'),
+            ((has_procedure & (contract_type == 'au') & has_device_au & has_au_sim).to_numpy(), 'auMNP(端末あり)'),
+        ]
+        for mask, service_category in rules:
+            result[mask] = service_category
+        
+        return pd.Series(result, index=frame.index, dtype=object)
+
 class CSVService:
     """CSV ファイル解析サービス"""
     
@@ -104,80 +323,145 @@ class CSVService:
     def detect_encoding(file_bytes: bytes) -> str:
         """
         ファイルのエンコーディングを自動検出
+        UTF-8 / CP932 で厳密にデコードできればそれを採用し、どちらでもない場合のみ
+        先頭 ENCODING_SAMPLE_BYTES バイトを chardet で推定する
+        """
+        return _detect_encoding(
+            file_bytes[:ENCODING_SAMPLE_BYTES],
+            lambda encoding: _bytes_decode_error(file_bytes, encoding)
+        )
+
+    @staticmethod
+    def load_csv(file_bytes: bytes) -> ParsedCSV:
         """
-        result = chardet.detect(file_bytes)
-        encoding = result.get('encoding', 'utf-8')
+        アップロードされたCSVを読み込む（エンコーディング検出・デコード・read_csv を1回だけ実施）
+        店舗情報抽出とトランザクション解析はこの結果を共有する
+        """
+        # エンコーディング自動検出
+        detected_encoding = CSVService.detect_encoding(file_bytes)
+        print(f"[CSV] 検出されたエンコーディング: {detected_encoding}")
         
-        # 一般的なエンコーディングの正規化
-        if encoding is None:
-            encoding = 'utf-8'
+        # ファイルをデコード
+        try:
+            content_str = file_bytes.decode(detected_encoding)
+        except (UnicodeDecodeError, LookupError) as e:
+            print(f"[警告] {detected_encoding} でのデコード失敗: {e}")
+            # 失敗した場合はフォールバック
+            content_str = None
+            
+            for enc in FALLBACK_ENCODINGS:
+                try:
+                    content_str = file_bytes.decode(enc)
+                    print(f"[成功] {enc} でのデコードに成功")
+                    detected_encoding = enc
+                    break
+                except UnicodeDecodeError:
+                    continue
+            
+            if content_str is None:
+                raise ValueError("サポートされているエンコーディングでファイルをデコードできません")
         
-        encoding_map = {
-            'utf-8': 'utf-8',
-            'UTF-8': 'utf-8',
-            'shift_jis': 'shift_jis',
-            'SHIFT_JIS': 'shift_jis',
-            'cp932': 'cp932',
-            'CP932': 'cp932',
-            'euc_jp': 'euc_jp',
-            'EUC_JP': 'euc_jp',
-            'iso-2022-jp': 'iso-2022-jp',
-        }
+        # CSVを読み込み（必要なカラムのみ。デコード済み文字列は読み込み後に破棄）
+        text = StringIO(content_str)
+        del content_str
+        plan = CSVReadPlan.from_text(text)
+        df = plan.label(plan.read_csv(text))
+        
+        return ParsedCSV(df, detected_encoding)
+
+    @staticmethod
+    def detect_stream_encoding(file_obj: BinaryIO, preferred: Optional[str] = None) -> str:
+        """
+        ディスクに退避したCSVのエンコーディングを判定（ファイル全体をメモリに載せない）
+        preferred: 前回確認済みのエンコーディング（ファイル全体をデコードできれば推定を省略）
+        推定結果はファイル全体を逐次デコードできるか検証し、できない場合は load_csv() と同じ順でフォールバック
+        """
+        if preferred and _stream_decode_error(file_obj, preferred) is None:
+            print(f"[CSV] 確認済みのエンコーディングを使用: {preferred}")
+            return preferred
         
-        # マッピングにない場合は小文字に正規化
-        normalized = encoding_map.get(encoding, encoding.lower())
-        return normalized
+        file_obj.seek(0)
+        head = file_obj.read(ENCODING_SAMPLE_BYTES)
+        detected_encoding = _detect_encoding(head, lambda encoding: _stream_decode_error(file_obj, encoding))
+        print(f"[CSV] 検出されたエンコーディング: {detected_encoding}")
+        
+        error = _stream_decode_error(file_obj, detected_encoding)
+        if error is None:
+            return detected_encoding
+        print(f"[警告] {detected_encoding} でのデコード失敗: {error}")
+        
+        for enc in FALLBACK_ENCODINGS:
+            if _stream_decode_error(file_obj, enc) is None:
+                print(f"[成功] {enc} でのデコードに成功")
+                return enc
+        
+        raise ValueError("サポートされているエンコーディングでファイルをデコードできません")
 
     @staticmethod
-    def extract_store_info(file_bytes: bytes) -> List[Dict]:
+    def iter_csv_frames(file_obj: BinaryIO, encoding: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """
+        ディスクに退避したCSVを逐次デコードし、chunk_rows 行ずつ DataFrame として返す
+        MNP判定は伝票単位で行うため、チャンク末尾の伝票の行は次のチャンクに持ち越し、
+        同一伝票の行が必ず同じ DataFrame に含まれるようにする（POSデータは伝票ごとに連続して並ぶ前提）
+        DataFrame の index はファイル全体での行位置を保持する（警告の行番号は load_csv() と同じ）
+        """
+        file_obj.seek(0)
+        text = io.TextIOWrapper(file_obj, encoding=encoding, newline='')
+        ticket_position = COLUMN_INDEX_MAP['ticket_number']
+        carry = None
+        try:
+            plan = CSVReadPlan.from_text(text)
+            with plan.read_csv(text, chunksize=chunk_rows) as reader:
+                chunk = next(reader, None)
+                
+                while chunk is not None:
+                    # 最終チャンクかどうかを判定するため1チャンク先読みする
+                    next_chunk = next(reader, None)
+                    chunk = plan.label(chunk)
+                    frame = chunk if carry is None else _concat_frames(carry, chunk)
+                    carry = None
+                    if next_chunk is None or ticket_position not in frame.columns:
+                        yield frame
+                    else:
+                        tickets = frame[ticket_position].astype(str).str.strip()
+                        is_trailing_ticket = (tickets == tickets.iloc[-1]).to_numpy()
+                        carry = frame[is_trailing_ticket]
+                        if not is_trailing_ticket.all():
+                            yield frame[~is_trailing_ticket]
+                    chunk = next_chunk
+        finally:
+            # 呼び出し側のファイルを閉じないようにラッパーを切り離す
+            text.detach()
+
+    @staticmethod
+    def extract_store_info(source: Union[bytes, ParsedCSV]) -> List[Dict]:
         """
         CSVから店舗情報を抽出
+        source: ファイルバイナリ または CSVService.load_csv() の結果
         Returns: [{"store_code": "S002078", "store_name": "..."}]
         """
         try:
-            # エンコーディング自動検出
-            detected_encoding = CSVService.detect_encoding(file_bytes)
-            
-            # ファイルをデコード
-            try:
-                content_str = file_bytes.decode(detected_encoding)
-            except (UnicodeDecodeError, LookupError):
-                fallback_encodings = ['utf-8', 'shift_jis', 'cp932', 'euc_jp', 'latin-1']
-                content_str = None
-                
-                for enc in fallback_encodings:
-                    try:
-                        content_str = file_bytes.decode(enc)
-                        detected_encoding = enc
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                
-                if content_str is None:
-                    raise ValueError("サポートされているエンコーディングでファイルをデコードできません")
+            parsed = source if isinstance(source, ParsedCSV) else CSVService.load_csv(source)
+            df = parsed.df
             
-            # CSVを読み込み
-            df = pd.read_csv(StringIO(content_str))
+            if COLUMN_INDEX_MAP['store_code'] not in df.columns:
+                print(f"[CSV] 0件の店舗情報を抽出")
+                return []
             
             # 店舗情報を抽出（重複排除）
+            store_codes = _text_column(df, COLUMN_INDEX_MAP['store_code'])
+            store_names = _text_column(df, COLUMN_INDEX_MAP['store_name'])
             stores = []
             seen_codes = set()
             
-            for idx, row in df.iterrows():
-                try:
-                    store_code = str(row.iloc[1]).strip() if len(row) > 1 else None
-                    store_name = str(row.iloc[2]).strip() if len(row) > 2 else None
-                    
-                    if store_code and store_code != "" and store_code not in seen_codes and pd.notna(store_code):
-                        seen_codes.add(store_code)
-                        stores.append({
-                            "store_code": store_code,
-                            "store_name": store_name if store_name and store_name != "" else f"店舗 {store_code}",
-                            "location": "未設定"
-                        })
-                except Exception as e:
-                    print(f"[警告] 行{idx+2}での店舗情報抽出: {e}")
-                    continue
+            for store_code, store_name in zip(store_codes, store_names):
+                if store_code and store_code not in seen_codes:
+                    seen_codes.add(store_code)
+                    stores.append({
+                        "store_code": store_code,
+                        "store_name": store_name if store_name else f"店舗 {store_code}",
+                        "location": "未設定"
+                    })
             
             print(f"[CSV] {len(stores)}件の店舗情報を抽出")
             return stores
@@ -187,191 +471,15 @@ class CSVService:
             return []
     
     @staticmethod
-    def parse_sales_csv(file_bytes: bytes) -> List[SalesTransactionCreate]:
+    def parse_sales_csv(source: Union[bytes, ParsedCSV]) -> List[SalesTransactionCreate]:
         """
         販売データCSVを解析
-        ファイルバイナリを受け取りエンコーディング自動検出してパース
+        source: ファイルバイナリ（エンコーディング自動検出してパース）または CSVService.load_csv() の結果
         """
         try:
-            # エンコーディング自動検出
-            detected_encoding = CSVService.detect_encoding(file_bytes)
-            print(f"[CSV] 検出されたエンコーディング: {detected_encoding}")
+            parsed = source if isinstance(source, ParsedCSV) else CSVService.load_csv(source)
             
-            # ファイルをデコード
-            try:
-                content_str = file_bytes.decode(detected_encoding)
-            except (UnicodeDecodeError, LookupError) as e:
-                print(f"[警告] {detected_encoding} でのデコード失敗: {e}")
-                # 失敗した場合はフォールバック
-                fallback_encodings = ['utf-8', 'shift_jis', 'cp932', 'euc_jp', 'latin-1']
-                content_str = None
-                
-                for enc in fallback_encodings:
-                    try:
-                        content_str = file_bytes.decode(enc)
-                        print(f"[成功] {enc} でのデコードに成功")
-                        detected_encoding = enc
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                
-                if content_str is None:
-                    raise ValueError("サポートされているエンコーディングでファイルをデコードできません")
-            
-            # CSVを読み込み
-            df = pd.read_csv(StringIO(content_str))
-            
-            print(f"[CSV] 検出カラム数: {len(df.columns)}")
-            print(f"[CSV] 実際のカラム: {df.columns.tolist()[:10]}")  # 最初の10カラムをログに出力
-            
-            transactions = []
-            
-            # 実際のCSVファイル構造に合わせたマッピング
-            # POS売上明細データの場合
-            column_index_map = {
-                'transaction_date': None,  # 複合カラム: 売上日付 + 売上時刻
-                'store_code': 1,  # 統括拠点コード
-                'product_code': 16,  # 商品コード
-                'product_name': 17,  # POS表示商品名
-                'quantity': 30,  # 数量
-                'unit_price': 31,  # 販売単価（税込）
-                'total_price': 32,  # 販売明細額（税込）
-                'gross_profit': 73,  # 粗利（column 73）
-                'staff_id': 57,  # 実績ユーザーID
-                'staff_name_first': 58,  # 実績担当者姓
-                'staff_name_last': 59,  # 実績担当者名
-                'ticket_number': 7,  # 売上伝票番号
-                'large_category': 21,  # 大分類名
-                'small_category': 23,  # 中分類名
-                'procedure_name': 48,  # 手続区分名
-                'procedure_name_2': 50,  # 手続区分２名
-                'contract_type': 64,  # お客様契約区分名
-            }
-            
-            # 同一伝票番号ごとにグループ化してMNP判定を実施
-            grouped_by_ticket = {}
-            raw_data_map = {}
-            
-            for idx, row in df.iterrows():
-                try:
-                    ticket_num = str(row.iloc[7]).strip() if len(row) > 7 else f"UNKNOWN_{idx}"
-                    
-                    if ticket_num not in grouped_by_ticket:
-                        grouped_by_ticket[ticket_num] = []
-                        raw_data_map[ticket_num] = []
-                    
-                    # 行データを保存
-                    line_data = {
-                        'row_index': idx,
-                        'large_category': str(row.iloc[21]).strip() if len(row) > 21 else '',
-                        'small_category': str(row.iloc[23]).strip() if len(row) > 23 else '',
-                        'procedure_name': str(row.iloc[48]).strip() if len(row) > 48 and pd.notna(row.iloc[48]) else '',
-                        'product_name': str(row.iloc[17]).strip() if len(row) > 17 else '',
-                        'お客様契約区分名': str(row.iloc[64]).strip() if len(row) > 64 else '',
-                    }
-                    
-                    grouped_by_ticket[ticket_num].append(line_data)
-                    raw_data_map[ticket_num].append(row)
-                    
-                except Exception as e:
-                    print(f"[警告] 行{idx+2}: グループ化エラー: {e}")
-                    continue
-            
-            # 各伝票についてMNP判定を実施
-            ticket_service_categories = {}
-            ticket_row_count = {}  # 伝票ごとの行カウント
-            
-            for ticket_num, line_data_list in grouped_by_ticket.items():
-                service_categories = MNPJudge.judge_service_category(line_data_list)
-                ticket_service_categories[ticket_num] = service_categories
-                ticket_row_count[ticket_num] = len(line_data_list)  # 伝票の行数を記録
-            
-            # 伝票内での行番号をカウントするためのマップを作成
-            ticket_row_index_map = {}
-            for ticket_num in grouped_by_ticket.keys():
-                ticket_row_index_map[ticket_num] = 0
-            
-            # トランザクション作成
-            for idx, row in df.iterrows():
-                try:
-                    data = {}
-                    
-                    # 日付と時刻を組み合わせる
-                    try:
-                        date_str = str(row.iloc[4]).strip()  # 売上日付
-                        time_str = str(row.iloc[5]).strip() if len(row) > 5 else "00:00:00"  # 売上時刻
-                        combined_datetime = f"{date_str} {time_str}"
-                        # 複数の日付フォーマットに対応
-                        for fmt in ["%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d", "%Y%m%d %H:%M:%S"]:
-                            try:
-                                dt = datetime.strptime(combined_datetime, fmt)
-                                data['transaction_date'] = dt
-                                break
-                            except ValueError:
-                                continue
-                        if 'transaction_date' not in data:
-                            raise ValueError(f"日付形式が認識できません: {combined_datetime}")
-                    except Exception as e:
-                        print(f"[警告] 行{idx+2}: 日付パース失敗: {e}")
-                        continue
-                    
-                    # その他のカラムをマッピング
-                    data['store_code'] = str(row.iloc[1]).strip() if len(row) > 1 else ""
-                    data['product_code'] = str(row.iloc[16]).strip() if len(row) > 16 else ""
-                    data['product_name'] = str(row.iloc[17]).strip() if len(row) > 17 else ""
-                    data['ticket_number'] = str(row.iloc[7]).strip() if len(row) > 7 else ""
-                    data['large_category'] = str(row.iloc[21]).strip() if len(row) > 21 else ""
-                    data['small_category'] = str(row.iloc[23]).strip() if len(row) > 23 else ""
-                    data['procedure_name'] = str(row.iloc[48]).strip() if len(row) > 48 and pd.notna(row.iloc[48]) else ""
-                    data['procedure_name_2'] = str(row.iloc[50]).strip() if len(row) > 50 and pd.notna(row.iloc[50]) else ""
-                    
-                    # 数値変換
-                    try:
-                        data['quantity'] = int(row.iloc[30]) if len(row) > 30 and pd.notna(row.iloc[30]) else 1
-                    except:
-                        data['quantity'] = 1
-                    
-                    try:
-                        data['unit_price'] = float(row.iloc[31]) if len(row) > 31 and pd.notna(row.iloc[31]) else 0
-                    except:
-                        data['unit_price'] = 0
-                    
-                    try:
-                        data['total_price'] = float(row.iloc[32]) if len(row) > 32 and pd.notna(row.iloc[32]) else 0
-                    except:
-                        data['total_price'] = 0
-                    
-                    try:
-                        data['gross_profit'] = float(row.iloc[73]) if len(row) > 73 and pd.notna(row.iloc[73]) else 0
-                    except:
-                        data['gross_profit'] = 0
-                    
-                    # スタッフ情報（実績ユーザーを使用）
-                    data['staff_id'] = str(row.iloc[57]).strip() if len(row) > 57 else ""
-                    staff_first = str(row.iloc[58]).strip() if len(row) > 58 else ""
-                    staff_last = str(row.iloc[59]).strip() if len(row) > 59 else ""
-                    data['staff_name'] = f"{staff_first}{staff_last}".strip() if staff_first or staff_last else ""
-                    
-                    # サービスカテゴリを追加
-                    ticket_num = data['ticket_number']
-                    # 同じ伝票番号内での行番号を計算
-                    if ticket_num in grouped_by_ticket:
-                        row_line_index = len(grouped_by_ticket[ticket_num]) - 1
-                    else:
-                        row_line_index = 0
-                    
-                    if ticket_num in ticket_service_categories and row_line_index in ticket_service_categories[ticket_num]:
-                        data['service_category'] = ticket_service_categories[ticket_num][row_line_index]
-                    else:
-                        data['service_category'] = 'その他'
-                    
-                    # スキーマバリデーション
-                    transaction = SalesTransactionCreate(**data)
-                    transactions.append(transaction)
-                    
-                except Exception as e:
-                    print(f"[警告] 行{idx+2}: {e}")
-                    continue
+            transactions = CSVService.parse_sales_frame(parsed.df)
             
             print(f"[CSV] {len(transactions)}件のトランザクションを抽出")
             return transactions
@@ -379,4 +487,301 @@ class CSVService:
         except Exception as e:
             raise ValueError(f"CSV解析失敗: {str(e)}")
 
+    @staticmethod
+    def parse_sales_frame(df: pd.DataFrame) -> List[SalesTransactionCreate]:
+        """
+        読み込み済みのDataFrameからトランザクションを生成（列単位で一括変換）
+        df のカラムラベルは元ファイルでのカラム位置（CSVReadPlan.label() 済み）
+        行番号（警告表示用）は df.index + 2 とする
+        """
+        n = len(df)
+        if n == 0:
+            return []
+        
+        # 必要なカラムを一括で取り出す
+        line_numbers = (df.index + 2).tolist()
+        tickets = _text_column(df, COLUMN_INDEX_MAP['ticket_number'])
+        large_categories = _text_column(df, COLUMN_INDEX_MAP['large_category'])
+        small_categories = _text_column(df, COLUMN_INDEX_MAP['small_category'])
+        procedure_names = _text_column(df, COLUMN_INDEX_MAP['procedure_name'], skip_na=True)
+        product_names = _text_column(df, COLUMN_INDEX_MAP['product_name'])
+        contract_types = _text_column(df, COLUMN_INDEX_MAP['contract_type'])
+        
+        # 同一伝票番号ごとにMNP判定を実施（伝票番号カラムがない場合は判定不能のため「その他」）
+        if COLUMN_INDEX_MAP['ticket_number'] in df.columns:
+            row_categories = MNPJudge.judge_frame(pd.DataFrame({
+                'ticket_number': tickets,
+                'large_category': large_categories,
+                'small_category': small_categories,
+                'procedure_name': procedure_names,
+                'product_name': product_names,
+                'お客様契約区分名': contract_types,
+            }))
+            # 伝票内の最終行の判定結果を伝票全体のサービスカテゴリとする（従来の挙動を踏襲）
+            is_last_row = ~pd.Series(tickets).duplicated(keep='last').to_numpy()
+            ticket_service_category = dict(zip(
+                np.asarray(tickets, dtype=object)[is_last_row], row_categories.to_numpy()[is_last_row]
+            ))
+            service_categories = [ticket_service_category[t] for t in tickets]
+        else:
+            service_categories = ['その他'] * n
+        
+        # 日付と時刻を組み合わせる
+        dates = _text_column(df, COLUMN_INDEX_MAP['sales_date'])
+        if COLUMN_INDEX_MAP['sales_time'] in df.columns:
+            times = _text_column(df, COLUMN_INDEX_MAP['sales_time'])
+        else:
+            times = ["00:00:00"] * n
+        combined_datetimes = (pd.Series(dates, dtype=object) + " " + pd.Series(times, dtype=object)).tolist()
+        transaction_dates = _parse_datetime_column(combined_datetimes)
+        for line_no, combined_datetime, dt in zip(line_numbers, combined_datetimes, transaction_dates):
+            if dt is None:
+                print(f"[警告] 行{line_no}: 日付パース失敗: 日付形式が認識できません: {combined_datetime}")
+        
+        # その他のカラムをマッピング
+        staff_first = _text_column(df, COLUMN_INDEX_MAP['staff_name_first'])
+        staff_last = _text_column(df, COLUMN_INDEX_MAP['staff_name_last'])
+        columns = {
+            'transaction_date': transaction_dates,
+            'store_code': _text_column(df, COLUMN_INDEX_MAP['store_code']),
+            'product_code': _text_column(df, COLUMN_INDEX_MAP['product_code']),
+            'product_name': product_names,
+            'ticket_number': tickets,
+            'large_category': large_categories,
+            'small_category': small_categories,
+            'procedure_name': procedure_names,
+            'procedure_name_2': _text_column(df, COLUMN_INDEX_MAP['procedure_name_2'], skip_na=True),
+            'quantity': _int_column(df, COLUMN_INDEX_MAP['quantity'], default=1),
+            'unit_price': _float_column(df, COLUMN_INDEX_MAP['unit_price']),
+            'total_price': _float_column(df, COLUMN_INDEX_MAP['total_price']),
+            'gross_profit': _float_column(df, COLUMN_INDEX_MAP['gross_profit']),
+            # スタッフ情報（実績ユーザーを使用）
+            'staff_id': _text_column(df, COLUMN_INDEX_MAP['staff_id']),
+            'staff_name': [f"{first}{last}".strip() for first, last in zip(staff_first, staff_last)],
+            'service_category': service_categories,
+        }
+        
+        # 日付が解釈できた行のみを対象にレコードを組み立てる
+        keys = list(columns.keys())
+        records = []
+        record_line_numbers = []
+        for line_no, values in zip(line_numbers, zip(*columns.values())):
+            if values[0] is None:
+                continue
+            records.append(dict(zip(keys, values)))
+            record_line_numbers.append(line_no)
+        
+        # スキーマバリデーション（一括）
+        try:
+            return _TRANSACTION_LIST_ADAPTER.validate_python(records)
+        except ValidationError:
+            pass
+        
+        # 一括検証に失敗した場合は行単位で検証し、不正な行のみ除外
+        transactions = []
+        for line_no, record in zip(record_line_numbers, records):
+            try:
+                transactions.append(SalesTransactionCreate(**record))
+            except Exception as e:
+                print(f"[警告] 行{line_no}: {e}")
+        return transactions
+
+
+def _text_column(df: pd.DataFrame, position: int, default: str = "", skip_na: bool = False) -> List[str]:
+    """
+    位置指定でカラムを文字列リストとして取り出す（str(値).strip() 相当）
+    skip_na=True の場合は欠損値を空文字にする
+    """
+    if position not in df.columns:
+        return [default] * len(df)
+    column = df[position]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # カテゴリ型はカテゴリ（値の種類）ごとに1回だけ変換し、コードで引き当てる
+        # 欠損値のコードは -1 のため、変換表の末尾に欠損値の表現を置く
+        labels = column.cat.categories.astype(str).str.strip().tolist()
+        labels.append("" if skip_na else "nan")
+        return np.asarray(labels, dtype=object)[column.cat.codes.to_numpy()].tolist()
+    values = column.astype(str).str.strip()
+    if skip_na:
+        values = values.where(column.notna(), "")
+    return values.tolist()
 
+
+def _detect_encoding(head: bytes, decode_error: Callable[[str], Optional[Exception]]) -> str:
+    """
+    エンコーディング判定の共通処理
+    head: ファイル先頭のバイト列 / decode_error: ファイル全体を厳密デコードした際の例外を返す関数（成功時 None）
+    """
+    # BOM付きUTF-8はBOMを除去してデコードする
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    
+    # ISO-2022-JP はエスケープシーケンス以外 ASCII のため UTF-8 としてもデコードできてしまう
+    if b'\x1b' not in head:
+        for encoding in FAST_PATH_ENCODINGS:
+            if decode_error(encoding) is None:
+                return encoding
+    
+    return _chardet_encoding(head)
+
+
+def _chardet_encoding(sample: bytes) -> str:
+    """chardet でエンコーディングを推定し、Python のコーデック名に正規化"""
+    result = chardet.detect(sample)
+    encoding = result.get('encoding', 'utf-8')
+    
+    # 一般的なエンコーディングの正規化
+    if encoding is None:
+        encoding = 'utf-8'
+    
+    encoding_map = {
+        'utf-8': 'utf-8',
+        'UTF-8': 'utf-8',
+        'shift_jis': 'shift_jis',
+        'SHIFT_JIS': 'shift_jis',
+        'cp932': 'cp932',
+        'CP932': 'cp932',
+        'euc_jp': 'euc_jp',
+        'EUC_JP': 'euc_jp',
+        'iso-2022-jp': 'iso-2022-jp',
+    }
+    
+    # マッピングにない場合は小文字に正規化
+    return encoding_map.get(encoding, encoding.lower())
+
+
+def _bytes_decode_error(file_bytes: bytes, encoding: str) -> Optional[Exception]:
+    """バイト列を厳密デコードし、失敗した場合はその例外を返す（成功時は None）"""
+    try:
+        file_bytes.decode(encoding)
+        return None
+    except (UnicodeDecodeError, LookupError) as e:
+        return e
+
+
+def _stream_decode_error(file_obj: BinaryIO, encoding: str) -> Optional[Exception]:
+    """ファイル全体を逐次デコードし、失敗した場合はその例外を返す（成功時は None）"""
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)()
+    except LookupError as e:
+        return e
+    file_obj.seek(0)
+    try:
+        while True:
+            block = file_obj.read(_STREAM_BLOCK_BYTES)
+            decoder.decode(block, final=not block)
+            if not block:
+                return None
+    except UnicodeDecodeError as e:
+        return e
+
+
+def _concat_frames(head: pd.DataFrame, tail: pd.DataFrame) -> pd.DataFrame:
+    """
+    持ち越した行と次のチャンクを連結
+    チャンクごとに推論された型が異なるカラムは object 型で連結し、各値の文字列表現を変えない
+    """
+    mismatched = [
+        position for position, (head_dtype, tail_dtype) in enumerate(zip(head.dtypes, tail.dtypes))
+        if head_dtype != tail_dtype
+    ]
+    if mismatched:
+        head = head.copy()
+        tail = tail.copy()
+        for position in mismatched:
+            head.isetitem(position, head.iloc[:, position].astype(object))
+            tail.isetitem(position, tail.iloc[:, position].astype(object))
+    return pd.concat([head, tail])
+
+
+def _to_int(value, default):
+    try:
+        return int(value) if pd.notna(value) else default
+    except Exception:
+        return default
+
+
+def _to_float(value, default):
+    try:
+        return float(value) if pd.notna(value) else default
+    except Exception:
+        return default
+
+
+def _int_column(df: pd.DataFrame, position: int, default: int) -> List[int]:
+    """
+    位置指定でカラムを整数リストとして取り出す（int(値)、欠損・変換失敗時は default）
+    数値型カラムはベクトル演算で変換し、文字列が混在するカラムのみ値ごとに変換する
+    """
+    if position not in df.columns:
+        return [default] * len(df)
+    column = df[position]
+    if pd.api.types.is_numeric_dtype(column):
+        values = column.to_numpy(dtype="float64")
+        valid = np.isfinite(values)
+        # float64で整数を正確に表せる範囲外の値は値ごとに変換する
+        if not (np.abs(values[valid]) >= 2 ** 53).any():
+            converted = np.trunc(np.where(valid, values, default)).astype("int64")
+            return converted.tolist()
+    return [_to_int(value, default) for value in column.tolist()]
+
+
+def _float_column(df: pd.DataFrame, position: int, default: float = 0) -> List[float]:
+    """位置指定でカラムを浮動小数点リストとして取り出す（float(値)、欠損・変換失敗時は default）"""
+    if position not in df.columns:
+        return [default] * len(df)
+    column = df[position]
+    if pd.api.types.is_numeric_dtype(column):
+        values = column.to_numpy(dtype="float64")
+        return np.where(np.isnan(values), default, values).tolist()
+    return [_to_float(value, default) for value in column.tolist()]
+
+
+def _parse_datetime_column(values: List[str]) -> List[Optional[datetime]]:
+    """
+    売上日付 + 売上時刻 の文字列をまとめて datetime に変換（失敗した要素は None）
+    同一伝票の行は同じ日時を持つため重複を除いて変換する。ファイルの日付形式をサンプルから判定して
+    まず全件を一括変換し、一致しなかった値のみ残りの形式で順に変換する。
+    最後まで一括変換できなかった値（範囲外の年など）は _parse_datetime() で個別に変換する
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    resolved = np.full(len(uniques), None, dtype=object)
+    remaining = pd.Series(uniques, dtype=object)
+    remaining = remaining[~remaining.str.contains(_LEAP_SECOND_PATTERN)]
+    
+    for fmt in _date_format_order(uniques[:DATE_FORMAT_SAMPLE_SIZE]):
+        if remaining.empty:
+            break
+        converted = pd.to_datetime(remaining, format=fmt, errors='coerce')
+        matched = converted.notna().to_numpy()
+        resolved[remaining.index[matched]] = pd.DatetimeIndex(converted[matched]).to_pydatetime()
+        remaining = remaining[~matched]
+    
+    for position in np.flatnonzero(pd.isna(resolved)):
+        resolved[position] = _parse_datetime(uniques[position])
+    
+    return resolved[codes].tolist()
+
+
+def _date_format_order(sample) -> List[str]:
+    """サンプルで最も多く一致した形式を先頭にした DATE_FORMATS"""
+    counts = {fmt: 0 for fmt in DATE_FORMATS}
+    for value in sample:
+        for fmt in DATE_FORMATS:
+            try:
+                datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+            counts[fmt] += 1
+            break
+    return sorted(DATE_FORMATS, key=lambda fmt: -counts[fmt])
+
+
+def _parse_datetime(value: str):
+    """売上日付 + 売上時刻 の文字列を datetime に変換（失敗時は None）"""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,296 @@
+"""
+ダッシュボード集計
+共通の絞り込み条件（店舗・スタッフ・期間）で日別集計（RollupService.facts()）を1回だけ参照する。
+要求されたパネルが必要とするキーの和集合で GROUP BY し（SQL で集計済み・不要なキーは集約）、
+その結果から各パネルを組み立てる。各パネルの形式は個別APIのレスポンスと同じ。
+"""
+
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.services.query_cache import query_cache
+from app.services.rollup_service import RollupService
+
+AU1_CATEGORY = 'au+1 Collection'
+DEVICE_CATEGORY = '移動機'
+
+
+def _sort_key(*values):
+    """NULL を先頭にした並び順（SQLite の ORDER BY と同じ。同順位は残りのキーで並べる）"""
+    return tuple((value is not None, value if value is not None else '') for value in values)
+
+
+def _amount(value) -> float:
+    return float(value) if value else 0
+
+
+def _group(rows: Iterable, key: Callable) -> Dict:
+    """key ごとに数量・売上額・粗利・行数を合計"""
+    groups: Dict = {}
+    for row in rows:
+        group_key = key(row)
+        totals = groups.get(group_key)
+        if totals is None:
+            totals = groups[group_key] = {'quantity': 0, 'total_price': 0, 'gross_profit': 0, 'row_count': 0}
+        totals['quantity'] += row.quantity or 0
+        totals['total_price'] += row.total_price or 0
+        totals['gross_profit'] += row.gross_profit or 0
+        totals['row_count'] += row.row_count or 0
+    return groups
+
+
+def _au1_rows(rows: List) -> List:
+    return [row for row in rows if row.large_category == AU1_CATEGORY]
+
+
+def _panel_daily(rows: List) -> List[Dict]:
+    groups = _group(rows, lambda r: (r.sales_date, r.store_code))
+    return [
+        {
+            "date": sales_date.isoformat() if sales_date else None,
+            "store_code": store_code,
+            "total_sales": _amount(totals['total_price']),
+            "gross_profit": _amount(totals['gross_profit']),
+            "transaction_count": totals['row_count'],
+        }
+        for (sales_date, store_code), totals in sorted(groups.items(), key=lambda item: _sort_key(*item[0]))
+    ]
+
+
+def _panel_product(rows: List) -> List[Dict]:
+    groups = _group(rows, lambda r: (r.product_code, r.product_name))
+    return [
+        {
+            "product_code": product_code,
+            "product_name": product_name,
+            "total_quantity": totals['quantity'],
+            "total_sales": _amount(totals['total_price']),
+            "total_gross_profit": _amount(totals['gross_profit']),
+        }
+        for (product_code, product_name), totals in sorted(groups.items(), key=lambda item: _sort_key(*item[0]))
+    ]
+
+
+def _panel_au1_total(rows: List) -> Dict:
+    totals = _group(_au1_rows(rows), lambda r: None).get(None, {'total_price': 0, 'gross_profit': 0, 'row_count': 0})
+    return {
+        "transaction_count": totals['row_count'],
+        "total_sales": _amount(totals['total_price']),
+        "gross_profit": _amount(totals['gross_profit']),
+    }
+
+
+def _panel_au1_summary(rows: List) -> List[Dict]:
+    groups = _group(_au1_rows(rows), lambda r: (r.staff_id, r.staff_name))
+    return [
+        {
+            "staff_id": staff_id,
+            "staff_name": staff_name,
+            "transaction_count": totals['row_count'],
+            "total_sales": _amount(totals['total_price']),
+            "gross_profit": _amount(totals['gross_profit']),
+        }
+        for (staff_id, staff_name), totals in sorted(groups.items(), key=lambda item: _sort_key(item[0][1], item[0][0]))
+    ]
+
+
+def _panel_au1_category(rows: List) -> List[Dict]:
+    groups = _group(_au1_rows(rows), lambda r: (r.staff_id, r.staff_name, r.small_category))
+    return [
+        {
+            "staff_id": staff_id,
+            "staff_name": staff_name,
+            "category": small_category,
+            "transaction_count": totals['row_count'],
+            "total_sales": _amount(totals['total_price']),
+            "gross_profit": _amount(totals['gross_profit']),
+        }
+        for (staff_id, staff_name, small_category), totals
+        in sorted(groups.items(), key=lambda item: _sort_key(item[0][1], item[0][2], item[0][0]))
+    ]
+
+
+def _panel_au1_detail(rows: List) -> List[Dict]:
+    groups = _group(_au1_rows(rows), lambda r: (r.staff_id, r.staff_name, r.product_name, r.small_category))
+    return [
+        {
+            "staff_id": staff_id,
+            "staff_name": staff_name,
+            "product_name": product_name,
+            "category": small_category,
+            "transaction_count": totals['row_count'],
+            "total_sales": _amount(totals['total_price']),
+            "gross_profit": _amount(totals['gross_profit']),
+        }
+        for (staff_id, staff_name, product_name, small_category), totals
+        in sorted(groups.items(), key=lambda item: _sort_key(item[0][1], item[0][2], item[0][0], item[0][3]))
+    ]
+
+
+def _panel_au1_daily(rows: List) -> List[Dict]:
+    groups = _group(_au1_rows(rows), lambda r: r.sales_date)
+    return [
+        {
+            "date": str(sales_date),
+            "transaction_count": totals['row_count'],
+            "total_sales": _amount(totals['total_price']),
+            "gross_profit": _amount(totals['gross_profit']),
+        }
+        for sales_date, totals in sorted(groups.items(), key=lambda item: _sort_key(item[0]))
+    ]
+
+
+def _panel_unit_price(rows: List) -> List[Dict]:
+    """SalesService.get_unit_price_per_smartphone と同じ形式"""
+    staff: Dict = {}
+    for row in rows:
+        if row.large_category == AU1_CATEGORY:
+            field, value = 'au1_gross_profit', row.gross_profit or 0
+        elif row.large_category == DEVICE_CATEGORY and row.small_category == 'スマートフォン':
+            field, value = 'smartphone_count', row.quantity or 0
+        elif row.large_category == DEVICE_CATEGORY and row.small_category == 'iPhone':
+            field, value = 'iphone_count', row.quantity or 0
+        else:
+            continue
+        entry = staff.setdefault((row.staff_id, row.staff_name), {'au1_gross_profit': 0, 'smartphone_count': 0, 'iphone_count': 0})
+        entry[field] += value
+
+    results = []
+    for (staff_id, staff_name), entry in staff.items():
+        total_device_count = entry['smartphone_count'] + entry['iphone_count']
+        unit_price = float(entry['au1_gross_profit']) / float(total_device_count) if total_device_count > 0 else 0
+        results.append({
+            'staff_id': staff_id,
+            'staff_name': staff_name,
+            'au1_gross_profit': _amount(entry['au1_gross_profit']),
+            'smartphone_count': int(entry['smartphone_count']),
+            'iphone_count': int(entry['iphone_count']),
+            'unit_price': round(unit_price, 0),
+        })
+    results.sort(key=lambda x: x['staff_name'])
+    return results
+
+
+# パネル名 → (組み立て処理, 必要な集計キー, 必要な大分類（None は全分類）)
+PANELS = {
+    "daily": (_panel_daily, ("sales_date", "store_code"), None),
+    "product": (_panel_product, ("product_code", "product_name"), None),
+    "au1_total": (_panel_au1_total, ("large_category",), (AU1_CATEGORY,)),
+    "au1_summary": (_panel_au1_summary, ("large_category", "staff_id", "staff_name"), (AU1_CATEGORY,)),
+    "au1_category": (
+        _panel_au1_category, ("large_category", "staff_id", "staff_name", "small_category"), (AU1_CATEGORY,)
+    ),
+    "au1_detail": (
+        _panel_au1_detail,
+        ("large_category", "staff_id", "staff_name", "product_name", "small_category"),
+        (AU1_CATEGORY,),
+    ),
+    "au1_daily": (_panel_au1_daily, ("large_category", "sales_date"), (AU1_CATEGORY,)),
+    "unit_price": (
+        _panel_unit_price, ("large_category", "small_category", "staff_id", "staff_name"), (AU1_CATEGORY, DEVICE_CATEGORY)
+    ),
+}
+
+
+class DashboardService:
+    """ダッシュボードの複数パネルをまとめて集計"""
+
+    @staticmethod
+    def plan(panels: List[str]) -> Tuple[Tuple[str, ...], Optional[List[str]]]:
+        """
+        パネルをまとめて組み立てるための (集計キー, 大分類)
+        集計キーは各パネルのキーの和集合、大分類は全分類が必要なパネルがあれば None（絞り込みなし）
+        """
+        keys: List[str] = []
+        categories: Optional[set] = set()
+        for name in panels:
+            _, panel_keys, panel_categories = PANELS[name]
+            keys += [key for key in panel_keys if key not in keys]
+            if panel_categories is None:
+                categories = None
+            elif categories is not None:
+                categories.update(panel_categories)
+        return tuple(keys), sorted(categories) if categories is not None else None
+
+    @staticmethod
+    def load_rows(
+        db: Session,
+        keys: Tuple[str, ...],
+        large_categories: Optional[List[str]] = None,
+        staff_id: str = None,
+        store_code: str = None,
+        start_date: datetime = None,
+        end_date: datetime = None
+    ) -> List:
+        """keys で GROUP BY した数量・売上額・粗利・行数の合計を読み込む（集計は SQL 側で行う）"""
+        facts = RollupService.facts(
+            start_date, end_date, large_category=large_categories, staff_id=staff_id, store_code=store_code
+        )
+        key_columns = [facts.c[name] for name in keys]
+        return db.execute(
+            select(
+                *key_columns,
+                func.sum(facts.c.quantity).label("quantity"),
+                func.sum(facts.c.total_price).label("total_price"),
+                func.sum(facts.c.gross_profit).label("gross_profit"),
+                func.sum(facts.c.row_count).label("row_count"),
+            ).group_by(*key_columns)
+        ).all()
+
+    @staticmethod
+    def build(
+        db: Session,
+        panels: List[str],
+        staff_id: str = None,
+        store_code: str = None,
+        start_date: datetime = None,
+        end_date: datetime = None
+    ) -> Dict:
+        """
+        指定したパネルを集計（結果は query_cache に保持）
+        Returns: {"panels": {パネル名: データ}, "load_ms": 日別集計の読み込み（1回）, "timings_ms": {パネル名: 組み立て},
+                  "total_ms", "rows": 読み込んだ集計行数,
+                  "cached": キャッシュから返した場合 True（timings_ms は集計時の値）}
+        """
+        key = query_cache.make_key(
+            "DashboardService.build", panels=tuple(panels),
+            staff_id=staff_id, store_code=store_code, start_date=start_date, end_date=end_date
+        )
+        result, hit = query_cache.get_or_compute(
+            key, lambda: DashboardService._compute(db, panels, staff_id, store_code, start_date, end_date)
+        )
+        return dict(result, cached=hit)
+
+    @staticmethod
+    def _compute(
+        db: Session,
+        panels: List[str],
+        staff_id: str = None,
+        store_code: str = None,
+        start_date: datetime = None,
+        end_date: datetime = None
+    ) -> Dict:
+        started = time.perf_counter()
+
+        keys, categories = DashboardService.plan(panels)
+        rows = DashboardService.load_rows(db, keys, categories, staff_id, store_code, start_date, end_date)
+        load_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        timings = {}
+        results = {}
+        for name in panels:
+            panel_started = time.perf_counter()
+            results[name] = PANELS[name][0](rows)
+            timings[name] = round((time.perf_counter() - panel_started) * 1000, 2)
+
+        return {
+            "panels": results,
+            "load_ms": load_ms,
+            "timings_ms": timings,
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+            "rows": len(rows),
+        }
@@ -0,0 +1,230 @@
+"""
+売上データのエクスポート（/api/admin/sales-data）
+  - 店舗名は stores との外部結合で取得（行ごとの店舗検索はしない）
+  - 行は yield_per でバッチごとに読み込み（PostgreSQL ではサーバーサイドカーソル）、
+    JSON / NDJSON / CSV に変換しながら逐次返す（全件をメモリに載せない）
+  - 管理画面の一覧は絞り込み・並び替え・ページ分割を SQL で行い、1ページ分と総件数のみ返す
+    文字列の検索は大文字小文字を区別しない前方一致、並び替えは SORT_COLUMNS の列（同順位は id 順）のみとし、
+    いずれもインデックス（migrations.py の 0004）で処理する
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.sales import SalesTransaction
+from app.models.store import Store
+
+# 出力する列（順序は CSV のヘッダーと同じ）
+EXPORT_COLUMNS = (
+    "id", "transaction_date", "store_code", "store_name", "product_code", "product_name",
+    "quantity", "unit_price", "total_price", "gross_profit", "staff_id", "staff_name",
+    "ticket_number", "large_category", "small_category", "procedure_name", "procedure_name_2",
+    "service_category", "created_at",
+)
+# 形式 → Content-Type
+EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+# 1回に読み込む行数
+_EXPORT_BATCH_SIZE = 1000
+# 1ページの最大件数
+MAX_PAGE_SIZE = 500
+# 前方一致検索できる列（search_field）
+SEARCH_FIELDS = (
+    "staff_name", "product_name", "store_code", "store_name",
+    "large_category", "small_category", "service_category",
+)
+# 大文字小文字を区別しない検索・並び替え用のインデックス（「検索キー, id」）を持つ文字列の列
+GRID_TEXT_COLUMNS = (
+    "store_code", "product_code", "product_name", "staff_name",
+    "large_category", "small_category", "service_category",
+)
+# 並び替えできる列（いずれも「列, id」の順のインデックスあり）
+SORT_COLUMNS = (
+    "id", "transaction_date", "store_code", "product_name", "staff_name",
+    "large_category", "small_category", "total_price",
+)
+
+
+def _serialize(row) -> dict:
+    record = dict(zip(EXPORT_COLUMNS, row))
+    for name in ("transaction_date", "created_at"):
+        if record[name] is not None:
+            record[name] = record[name].isoformat()
+    return record
+
+
+def text_key(column, dialect: str):
+    """
+    文字列の列の検索・並び替えキー（GRID_TEXT_COLUMNS のインデックスと同じ式）
+    SQLite: NOCASE 照合（LIKE の前方一致もこのインデックスを使う）
+    PostgreSQL: lower() を C 照合で比較（LIKE の前方一致にインデックスを使うため）
+    """
+    if dialect == "postgresql":
+        return func.lower(column).collate("C")
+    return column.collate("NOCASE")
+
+
+def _starts_with(column, value: str, dialect: str):
+    """大文字小文字を区別しない前方一致（% と _ はそのまま文字として扱う）"""
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if dialect == "postgresql":
+        escaped = escaped.lower()
+    return text_key(column, dialect).like(f"{escaped}%", escape="\\")
+
+
+class ExportService:
+    """売上データを逐次出力"""
+
+    @staticmethod
+    def build_query(
+        store_code: str = None,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        limit: Optional[int] = None,
+        staff_id: str = None,
+        large_category: str = None,
+        small_category: str = None,
+        service_category: str = None,
+        product: str = None,
+        search_field: str = None,
+        search: str = None,
+        sort: str = "transaction_date",
+        order: str = "asc",
+        dialect: str = "sqlite"
+    ):
+        """
+        出力対象の行を取得するクエリ（sort 列の昇順 / 降順、同順位は id 順。文字列の列は大文字小文字を区別しない）
+        store_code・staff_id・分類は完全一致、product は商品名・商品コードの前方一致、
+        search は search_field 列の前方一致（値が空の条件は付けない）
+        dialect: 接続先DBの方言名（検索・並び替えの式をインデックスに合わせる）
+        """
+        table = SalesTransaction.__table__
+        columns = {name: table.c[name] for name in EXPORT_COLUMNS if name != "store_name"}
+        # 店舗マスタにない店舗コードは店舗コードをそのまま店舗名とする
+        columns["store_name"] = func.coalesce(Store.store_name, SalesTransaction.store_code).label("store_name")
+        query = select(*(columns[name] for name in EXPORT_COLUMNS)).outerjoin(
+            Store, SalesTransaction.store_code == Store.store_code
+        )
+
+        for name, value in (
+            ("store_code", store_code), ("staff_id", staff_id), ("large_category", large_category),
+            ("small_category", small_category), ("service_category", service_category),
+        ):
+            if value:
+                query = query.where(table.c[name] == value)
+        if start_date:
+            query = query.where(SalesTransaction.transaction_date >= start_date)
+        if end_date:
+            query = query.where(SalesTransaction.transaction_date <= end_date)
+        if product:
+            query = query.where(or_(
+                _starts_with(SalesTransaction.product_name, product, dialect),
+                _starts_with(SalesTransaction.product_code, product, dialect),
+            ))
+        if search_field == "store_name" and search:
+            # 店舗名は店舗マスタで店舗コードに変換（マスタにない店舗は店舗コードが店舗名）
+            query = query.where(or_(
+                SalesTransaction.store_code.in_(
+                    select(Store.store_code).where(_starts_with(Store.store_name, search, dialect))
+                ),
+                and_(
+                    SalesTransaction.store_code.not_in(select(Store.store_code)),
+                    _starts_with(SalesTransaction.store_code, search, dialect),
+                ),
+            ))
+        elif search_field and search:
+            query = query.where(_starts_with(columns[search_field], search, dialect))
+
+        sort_column = text_key(columns[sort], dialect) if sort in GRID_TEXT_COLUMNS else columns[sort]
+        if order == "desc":
+            query = query.order_by(sort_column.desc(), SalesTransaction.id.desc())
+        else:
+            query = query.order_by(sort_column, SalesTransaction.id)
+        if limit:
+            query = query.limit(limit)
+        return query
+
+    @staticmethod
+    def page(db: Session, query, page: int, page_size: int) -> Dict:
+        """
+        クエリ結果の1ページ分と条件に一致する総件数
+        Returns: {"data": [...], "count": ページの件数, "total": 総件数, "page", "page_size", "pages"}
+        """
+        total = db.execute(select(func.count()).select_from(query.order_by(None).subquery())).scalar()
+        rows = db.execute(query.offset((page - 1) * page_size).limit(page_size)).all()
+        data = [_serialize(row) for row in rows]
+        return {
+            "data": data,
+            "count": len(data),
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "pages": (total + page_size - 1) // page_size,
+        }
+
+    @staticmethod
+    def iter_records(query) -> Iterator[dict]:
+        """
+        クエリ結果をバッチごとに読み込んで1行ずつ返す
+        レスポンスの送信中も読み込みを続けるため、リクエストのセッションとは別のセッションを使う
+        """
+        db = SessionLocal()
+        try:
+            result = db.execute(query.execution_options(yield_per=_EXPORT_BATCH_SIZE))
+            for partition in result.partitions():
+                for row in partition:
+                    yield _serialize(row)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _lines(records: Iterator[dict], export_format: str) -> Iterator[str]:
+        if export_format == "ndjson":
+            for record in records:
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+        elif export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, lineterminator="\r\n")
+            # Excel で文字化けしないよう BOM を付ける
+            buffer.write("\ufeff")
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            # 従来と同じ {"data": [...], "count": 件数}
+            yield '{"data": ['
+            count = 0
+            for record in records:
+                yield ("," if count else "") + json.dumps(record, ensure_ascii=False)
+                count += 1
+            yield f'], "count": {count}}}'
+
+    @staticmethod
+    def stream(query, export_format: str) -> Iterator[str]:
+        """指定形式（json / ndjson / csv）の出力をバッチ単位の文字列で返す"""
+        chunk = []
+        try:
+            for line in ExportService._lines(ExportService.iter_records(query), export_format):
+                chunk.append(line)
+                if len(chunk) >= _EXPORT_BATCH_SIZE:
+                    yield "".join(chunk)
+                    chunk = []
+            yield "".join(chunk)
+        except Exception as e:
+            # 送信開始後はステータスを変えられないため、ログを残して出力を打ち切る
+            print(f"[ERROR] /admin/sales-data (export): {e}")
+            raise
@@ -0,0 +1,168 @@
+"""
+集計結果キャッシュ
+売上データが変わるのは CSV 取込と全削除のときだけなので、集計結果を
+（関数, 正規化した絞り込み条件）をキーに保持して同じ集計の再実行を省く。
+  - 件数上限付きの LRU + 有効期限（TTL）
+  - データ世代カウンタ：取込・削除のコミット後に bump_generation() で繰り上げ、
+    それ以前の世代で計算した結果は返さない（集計中に取込が完了した場合も古い結果を返さない）
+  - 世代カウンタは state_backend（app/utils/state_backend.py）に保存する。
+    STATE_BACKEND=sqlite なら同じホストの全プロセスで共有され、どのプロセスで取込しても全プロセスのキャッシュが無効になる
+    世代を読めない場合（StateBackendUnavailable）は古い結果を返さないよう、キャッシュを使わずに集計する
+"""
+
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Callable, Dict, Hashable, Tuple
+
+from app.config import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_SECONDS
+from app.utils.state_backend import StateBackendUnavailable, state_backend
+
+# state_backend のカウンタ名
+_GENERATION_COUNTER = "query_cache.generation"
+
+
+def _normalize(value):
+    """絞り込み条件の表記ゆれを揃える（空文字は指定なし、日時は ISO 形式、リストはタプル）"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_normalize(v) for v in value)
+    return value
+
+
+class QueryCache:
+    """データ世代付きの集計結果キャッシュ（LRU + TTL）"""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl_seconds: float = QUERY_CACHE_TTL_SECONDS,
+                 backend=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend or state_backend
+        # 保存先ごとの識別子（再起動・状態ファイルの作り直しで世代が 0 に戻っても data_version が以前と重ならないようにする）
+        self.epoch = self.backend.instance_id
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # キー → (世代, 期限（monotonic）, 値)
+        self._entries: "OrderedDict[Hashable, Tuple[int, float, object]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    @property
+    def generation(self) -> int:
+        """現在のデータ世代（他プロセスでの取込・削除も反映される）"""
+        return self.backend.counter(_GENERATION_COUNTER)
+
+    @property
+    def data_version(self) -> str:
+        """売上データの版（ETag などに使う。取込・削除のたびに変わる）"""
+        return f"{self.epoch}.{self.generation}"
+
+    def make_key(self, name: str, **filters) -> Tuple:
+        return (name,) + tuple(sorted((k, _normalize(v)) for k, v in filters.items()))
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]) -> Tuple[object, bool]:
+        """
+        キャッシュ済みの値を返す。なければ compute() の結果を保存して返す
+        Returns: (値, キャッシュヒットか)
+        """
+        if not self.enabled:
+            return compute(), False
+
+        now = time.monotonic()
+        try:
+            generation = self.generation
+        except StateBackendUnavailable as e:
+            print(f"[警告] データ世代を取得できないため、キャッシュを使わずに集計します: {e}")
+            return compute(), False
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2], True
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+
+        # 集計はロックの外で実行（同じキーの同時ミスは双方が計算する）
+        value = compute()
+
+        # 計算中に世代が進んだ場合、結果は古い可能性があるため保存しない
+        try:
+            current_generation = self.generation
+        except StateBackendUnavailable:
+            return value, False
+        with self.lock:
+            if generation == current_generation:
+                self._entries[key] = (generation, time.monotonic() + self.ttl_seconds, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value, False
+
+    def bump_generation(self):
+        """
+        売上データの変更（取込・削除）をコミットした後に呼ぶ
+        世代を繰り上げられない場合も、コミット済みの変更は取り消さない（このプロセスのキャッシュのみ破棄する）
+        """
+        try:
+            self.backend.increment(_GENERATION_COUNTER)
+        except StateBackendUnavailable as e:
+            print(f"[ERROR] データ世代を繰り上げられません（他プロセスのキャッシュは有効期限まで残ります）: {e}")
+        with self.lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        try:
+            generation = self.generation
+        except StateBackendUnavailable:
+            generation = None
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "backend": self.backend.name,
+                "generation": generation,
+                "data_version": f"{self.epoch}.{generation}" if generation is not None else None,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            }
+
+
+# グローバル集計結果キャッシュ
+query_cache = QueryCache()
+
+
+def cached_query(func: Callable) -> Callable:
+    """
+    SalesService の集計関数（第1引数が db）の結果を query_cache に保持するデコレータ
+    キーは関数名と正規化した引数（位置引数・キーワード引数の違いは問わない）
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(db, *args, **kwargs):
+        bound = signature.bind(db, *args, **kwargs)
+        bound.apply_defaults()
+        filters = {name: value for name, value in bound.arguments.items() if name != "db"}
+        key = query_cache.make_key(func.__qualname__, **filters)
+        value, _ = query_cache.get_or_compute(key, lambda: func(db, *args, **kwargs))
+        return value
+
+    return wrapper
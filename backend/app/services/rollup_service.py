@@ -0,0 +1,262 @@
+"""
+売上の日別集計（sales_daily_rollup）
+  - アップロード時：挿入した行を集計キーごとにまとめて加算（挿入と同じトランザクション）
+  - 集計API：facts() で「期間内で丸1日含まれる日は日別集計・期間の端の日は生データ」を組み合わせて参照
+  - 管理：生データからの再構築（rebuild）と生データ集計との整合性チェック（check）
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+from sqlalchemy import Date, delete, func, insert, literal, or_, select, type_coerce, union_all, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.models.sales import ROLLUP_KEY_COLUMNS, SalesDailyRollup, SalesTransaction, rollup_key
+
+# 日別集計で合計する値
+MEASURE_COLUMNS = ("quantity", "total_price", "gross_profit", "row_count")
+# 整合性チェックで一致とみなす金額の誤差（浮動小数点の加算順による差）
+_AMOUNT_TOLERANCE = 0.005
+# 再構築時の挿入バッチサイズ
+_REBUILD_BATCH_SIZE = 1000
+
+
+def _dialect_name(db: Union[Session, Connection]) -> str:
+    bind = db.get_bind() if isinstance(db, Session) else db
+    return bind.dialect.name
+
+
+def _to_date(value) -> Optional[date]:
+    """func.date() の結果（SQLite は文字列、PostgreSQL は date）を date に揃える"""
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+def _filter_conditions(table, filters: Dict) -> List:
+    """{カラム名: 値 or 値のリスト} を条件式に変換（値が空の条件は付けない）"""
+    conditions = []
+    for name, value in filters.items():
+        if not value:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(table.c[name].in_(list(value)))
+        else:
+            conditions.append(table.c[name] == value)
+    return conditions
+
+
+class RollupService:
+    """売上の日別集計の更新・参照"""
+
+    @staticmethod
+    def apply_rows(db: Union[Session, Connection], rows: Iterable[dict]) -> int:
+        """
+        sales_transactions に挿入した行（カラム名の dict）を日別集計に加算
+        Returns: 更新した集計キーの数
+        """
+        deltas: Dict[str, dict] = {}
+        for row in rows:
+            transaction_date = row['transaction_date']
+            values = (
+                transaction_date.date() if transaction_date else None,
+                row['store_code'], row['staff_id'], row['staff_name'], row.get('service_category'),
+                row.get('large_category'), row.get('small_category'), row['product_code'], row['product_name'],
+            )
+            key = rollup_key(*values)
+            entry = deltas.get(key)
+            if entry is None:
+                entry = deltas[key] = dict(
+                    zip(ROLLUP_KEY_COLUMNS, values), rollup_key=key,
+                    quantity=0, total_price=0.0, gross_profit=0.0, row_count=0,
+                )
+            entry['quantity'] += row['quantity'] or 0
+            entry['total_price'] += row['total_price'] or 0
+            entry['gross_profit'] += row['gross_profit'] or 0
+            entry['row_count'] += 1
+
+        if deltas:
+            RollupService._upsert(db, list(deltas.values()))
+        return len(deltas)
+
+    @staticmethod
+    def _upsert(db: Union[Session, Connection], entries: List[dict]):
+        """集計キーが既存なら合計値に加算、なければ挿入"""
+        table = SalesDailyRollup.__table__
+        dialect = _dialect_name(db)
+
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            # ON CONFLICT 非対応のDBでは既存キーを UPDATE、残りを INSERT
+            existing = set(db.execute(
+                select(table.c.rollup_key).where(table.c.rollup_key.in_([e['rollup_key'] for e in entries]))
+            ).scalars())
+            updates = [e for e in entries if e['rollup_key'] in existing]
+            inserts = [e for e in entries if e['rollup_key'] not in existing]
+            for entry in updates:
+                db.execute(
+                    update(table)
+                    .where(table.c.rollup_key == entry['rollup_key'])
+                    .values({name: table.c[name] + entry[name] for name in MEASURE_COLUMNS})
+                )
+            if inserts:
+                db.execute(insert(table), inserts)
+            return
+
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['rollup_key'],
+            set_={name: table.c[name] + stmt.excluded[name] for name in MEASURE_COLUMNS},
+        )
+        db.execute(stmt, entries)
+
+    @staticmethod
+    def clear(db: Union[Session, Connection]):
+        db.execute(delete(SalesDailyRollup.__table__))
+
+    @staticmethod
+    def _raw_groups():
+        """生データを集計キーごとに集計するクエリ"""
+        raw = SalesTransaction.__table__
+        key_columns = [func.date(raw.c.transaction_date).label('sales_date')] + [raw.c[name] for name in ROLLUP_KEY_COLUMNS[1:]]
+        return select(
+            *key_columns,
+            func.sum(raw.c.quantity).label('quantity'),
+            func.sum(raw.c.total_price).label('total_price'),
+            func.sum(raw.c.gross_profit).label('gross_profit'),
+            func.count(raw.c.id).label('row_count'),
+        ).group_by(*key_columns)
+
+    @staticmethod
+    def rebuild(db: Union[Session, Connection]) -> int:
+        """
+        日別集計を生データから作り直す（コミットは呼び出し側）
+        Returns: 作成した集計行数
+        """
+        RollupService.clear(db)
+        table = SalesDailyRollup.__table__
+        created = 0
+        batch = []
+        for row in db.execute(RollupService._raw_groups()):
+            entry = row._asdict()
+            entry['sales_date'] = _to_date(entry['sales_date'])
+            entry['rollup_key'] = rollup_key(*(entry[name] for name in ROLLUP_KEY_COLUMNS))
+            batch.append(entry)
+            if len(batch) >= _REBUILD_BATCH_SIZE:
+                db.execute(insert(table), batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            db.execute(insert(table), batch)
+            created += len(batch)
+        print(f"[ROLLUP] 日別集計を再構築: {created}行")
+        return created
+
+    @staticmethod
+    def check(db: Union[Session, Connection], sample_limit: int = 10) -> Dict:
+        """日別集計と生データの集計を集計キーごとに比較"""
+        raw_groups = {}
+        for row in db.execute(RollupService._raw_groups()):
+            entry = row._asdict()
+            entry['sales_date'] = _to_date(entry['sales_date'])
+            raw_groups[rollup_key(*(entry[name] for name in ROLLUP_KEY_COLUMNS))] = entry
+
+        table = SalesDailyRollup.__table__
+        rollup_rows = {row.rollup_key: row._asdict() for row in db.execute(select(table))}
+
+        missing = [key for key in raw_groups if key not in rollup_rows]
+        extra = [key for key in rollup_rows if key not in raw_groups]
+        mismatched = []
+        for key, expected in raw_groups.items():
+            actual = rollup_rows.get(key)
+            if actual is None:
+                continue
+            if (
+                actual['quantity'] != (expected['quantity'] or 0)
+                or actual['row_count'] != expected['row_count']
+                or abs(actual['total_price'] - (expected['total_price'] or 0)) > _AMOUNT_TOLERANCE
+                or abs(actual['gross_profit'] - (expected['gross_profit'] or 0)) > _AMOUNT_TOLERANCE
+            ):
+                mismatched.append(key)
+
+        def describe(key, source):
+            row = source[key]
+            described = {name: row[name] for name in ROLLUP_KEY_COLUMNS + MEASURE_COLUMNS}
+            described['sales_date'] = described['sales_date'].isoformat() if described['sales_date'] else None
+            return described
+
+        return {
+            "consistent": not (missing or extra or mismatched),
+            "raw_groups": len(raw_groups),
+            "rollup_rows": len(rollup_rows),
+            "missing": len(missing),
+            "extra": len(extra),
+            "mismatched": len(mismatched),
+            "samples": (
+                [dict(describe(key, raw_groups), problem="missing") for key in missing[:sample_limit]]
+                + [dict(describe(key, rollup_rows), problem="extra") for key in extra[:sample_limit]]
+                + [
+                    dict(describe(key, rollup_rows), problem="mismatched", expected=describe(key, raw_groups))
+                    for key in mismatched[:sample_limit]
+                ]
+            ),
+        }
+
+    @staticmethod
+    def facts(start_date: datetime = None, end_date: datetime = None, **filters):
+        """
+        集計用の売上ファクト（sales_date, 集計キー, quantity, total_price, gross_profit, row_count）のサブクエリ
+        期間に丸1日含まれる日は日別集計、期間の端で一部の時刻のみ含まれる日は生データを参照する
+        （生データに対する transaction_date >= start_date / <= end_date の絞り込みと同じ結果になる）
+        filters: {カラム名: 値 or 値のリスト}（値が空の条件は付けない）
+        """
+        rollup = SalesDailyRollup.__table__
+        raw = SalesTransaction.__table__
+
+        # 期間に丸1日含まれる最初の日・最後の日（None は制限なし）
+        first_full_day = None
+        if start_date is not None:
+            first_full_day = start_date.date() if start_date.time() == time.min else start_date.date() + timedelta(days=1)
+        last_full_day = end_date.date() - timedelta(days=1) if end_date is not None else None
+
+        parts = []
+        raw_ranges = None  # None: 期間内の生データをすべて参照
+        if first_full_day is None or last_full_day is None or first_full_day <= last_full_day:
+            conditions = _filter_conditions(rollup, filters)
+            if first_full_day is not None:
+                conditions.append(rollup.c.sales_date >= first_full_day)
+            if last_full_day is not None:
+                conditions.append(rollup.c.sales_date <= last_full_day)
+            parts.append(
+                select(*[rollup.c[name] for name in ROLLUP_KEY_COLUMNS + MEASURE_COLUMNS]).where(*conditions)
+            )
+            # 生データは日別集計で参照した日の前後のみ
+            raw_ranges = []
+            if first_full_day is not None:
+                raw_ranges.append(raw.c.transaction_date < datetime.combine(first_full_day, time.min))
+            if last_full_day is not None:
+                raw_ranges.append(raw.c.transaction_date >= datetime.combine(last_full_day + timedelta(days=1), time.min))
+
+        if raw_ranges is None or raw_ranges:
+            conditions = _filter_conditions(raw, filters)
+            if start_date is not None:
+                conditions.append(raw.c.transaction_date >= start_date)
+            if end_date is not None:
+                conditions.append(raw.c.transaction_date <= end_date)
+            if raw_ranges:
+                conditions.append(or_(*raw_ranges))
+            parts.append(
+                select(
+                    type_coerce(func.date(raw.c.transaction_date), Date).label('sales_date'),
+                    *[raw.c[name] for name in ROLLUP_KEY_COLUMNS[1:]],
+                    raw.c.quantity, raw.c.total_price, raw.c.gross_profit,
+                    literal(1).label('row_count'),
+                ).where(*conditions)
+            )
+
+        statement = parts[0] if len(parts) == 1 else union_all(*parts)
+        return statement.subquery('sales_facts')
@@ -1,94 +1,92 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy import and_, case, func, or_
 from datetime import datetime, timedelta
 from app.models.sales import SalesTransaction
+from app.services.query_cache import cached_query
+from app.services.rollup_service import RollupService
+
+
+def sum_if(value, condition):
+    """
+    条件に一致する行のみの合計（SUM(CASE WHEN 条件 THEN 値 END)、一致する行がなければ NULL）
+    複数の指標を1回の集計で求める場合に、指標ごとの条件で使い分ける
+    """
+    return func.sum(case((condition, value)))
+
 
 class SalesService:
-    """販売データ分析サービス"""
+    """
+    販売データ分析サービス
+    集計は RollupService.facts()（日別集計 + 期間の端の日の生データ）に対して行い、
+    生データに対する集計と同じ結果を返す。件数は行数の合計（row_count）で数える
+    結果は query_cache に保持し、CSV取込・全削除で無効化する
+    """
     
     @staticmethod
+    @cached_query
     def get_daily_summary(db: Session, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
         """日別売上サマリーを取得"""
+        facts = RollupService.facts(start_date, end_date, store_code=store_code)
         query = db.query(
-            func.date(SalesTransaction.transaction_date).label("date"),
-            SalesTransaction.store_code,
-            func.sum(SalesTransaction.total_price).label("total_sales"),
-            func.sum(SalesTransaction.gross_profit).label("gross_profit"),
-            func.count(SalesTransaction.id).label("transaction_count")
+            facts.c.sales_date.label("date"),
+            facts.c.store_code,
+            func.sum(facts.c.total_price).label("total_sales"),
+            func.sum(facts.c.gross_profit).label("gross_profit"),
+            func.sum(facts.c.row_count).label("transaction_count")
         )
         
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
-        
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
-        
         return query.group_by(
-            func.date(SalesTransaction.transaction_date),
-            SalesTransaction.store_code
+            facts.c.sales_date,
+            facts.c.store_code
         ).all()
     
     @staticmethod
+    @cached_query
     def get_product_summary(db: Session, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
         """商品別売上サマリーを取得"""
+        facts = RollupService.facts(start_date, end_date, store_code=store_code)
         query = db.query(
-            SalesTransaction.product_code,
-            SalesTransaction.product_name,
-            func.sum(SalesTransaction.quantity).label("total_quantity"),
-            func.sum(SalesTransaction.total_price).label("total_sales"),
-            func.sum(SalesTransaction.gross_profit).label("total_gross_profit")
+            facts.c.product_code,
+            facts.c.product_name,
+            func.sum(facts.c.quantity).label("total_quantity"),
+            func.sum(facts.c.total_price).label("total_sales"),
+            func.sum(facts.c.gross_profit).label("total_gross_profit")
         )
         
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
-        
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
-        
         return query.group_by(
-            SalesTransaction.product_code,
-            SalesTransaction.product_name
+            facts.c.product_code,
+            facts.c.product_name
         ).all()
     
     @staticmethod
+    @cached_query
     def get_store_summary(db: Session, start_date: datetime = None, end_date: datetime = None):
         """店舗別売上サマリーを取得"""
+        facts = RollupService.facts(start_date, end_date)
         query = db.query(
-            SalesTransaction.store_code,
-            func.sum(SalesTransaction.total_price).label("total_sales"),
-            func.sum(SalesTransaction.gross_profit).label("total_gross_profit"),
-            func.count(SalesTransaction.id).label("transaction_count")
+            facts.c.store_code,
+            func.sum(facts.c.total_price).label("total_sales"),
+            func.sum(facts.c.gross_profit).label("total_gross_profit"),
+            func.sum(facts.c.row_count).label("transaction_count")
         )
         
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
-        
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
-        
-        return query.group_by(SalesTransaction.store_code).all()
+        return query.group_by(facts.c.store_code).all()
     
     @staticmethod
+    @cached_query
     def get_staff_list(db: Session, store_code: str = None):
         """スタッフ一覧を取得"""
+        facts = RollupService.facts(store_code=store_code)
         query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            SalesTransaction.store_code
+            facts.c.staff_id,
+            facts.c.staff_name,
+            facts.c.store_code
         ).distinct()
         
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        return query.order_by(SalesTransaction.staff_name).all()
+        return query.order_by(facts.c.staff_name).all()
     
     @staticmethod
+    @cached_query
     def get_staff_performance(db: Session, staff_id: str = None, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
         """スタッフ別の成績サマリーを取得（サービス種別ごと）"""
         
@@ -107,36 +105,26 @@ class SalesService:
         
         services_gross_profit = ['au+1Collection']
         
+        facts = RollupService.facts(start_date, end_date, staff_id=staff_id, store_code=store_code)
         query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            SalesTransaction.product_name,
-            func.count(SalesTransaction.id).label("count"),
-            func.sum(SalesTransaction.gross_profit).label("gross_profit"),
-            func.sum(SalesTransaction.total_price).label("total_sales")
+            facts.c.staff_id,
+            facts.c.staff_name,
+            facts.c.product_name,
+            func.sum(facts.c.row_count).label("count"),
+            func.sum(facts.c.gross_profit).label("gross_profit"),
+            func.sum(facts.c.total_price).label("total_sales")
         )
         
-        if staff_id:
-            query = query.filter(SalesTransaction.staff_id == staff_id)
-        
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
-        
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
-        
         results = query.group_by(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            SalesTransaction.product_name
+            facts.c.staff_id,
+            facts.c.staff_name,
+            facts.c.product_name
         ).all()
         
         return results
     
     @staticmethod
+    @cached_query
     def aggregate_staff_performance(db: Session, staff_id: str = None, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
         """スタッフ別の集計済み成績を取得（MNP対応版）"""
         
@@ -159,31 +147,20 @@ class SalesService:
         ]
         
         # サービスカテゴリごとに集計するクエリを作成
+        facts = RollupService.facts(start_date, end_date, staff_id=staff_id, store_code=store_code)
         query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            SalesTransaction.service_category,
-            func.count(SalesTransaction.id).label("count"),
-            func.sum(SalesTransaction.gross_profit).label("gross_profit"),
-            func.sum(SalesTransaction.total_price).label("total_sales")
+            facts.c.staff_id,
+            facts.c.staff_name,
+            facts.c.service_category,
+            func.sum(facts.c.row_count).label("count"),
+            func.sum(facts.c.gross_profit).label("gross_profit"),
+            func.sum(facts.c.total_price).label("total_sales")
         )
         
-        if staff_id:
-            query = query.filter(SalesTransaction.staff_id == staff_id)
-        
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
-        
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
-        
         results = query.group_by(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            SalesTransaction.service_category
+            facts.c.staff_id,
+            facts.c.staff_name,
+            facts.c.service_category
         ).all()
         
         # スタッフごとに集計結果を整形
@@ -219,256 +196,177 @@ class SalesService:
         return list(staff_data.values())
     
     @staticmethod
+    @cached_query
     def get_au_plus_one_collection_summary(db: Session, staff_id: str = None, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
         """au+1Collection実績サマリーを取得"""
         
+        facts = RollupService.facts(
+            start_date, end_date, large_category='au+1 Collection', staff_id=staff_id, store_code=store_code
+        )
         query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            func.count(SalesTransaction.id).label("transaction_count"),
-            func.sum(SalesTransaction.total_price).label("total_sales"),
-            func.sum(SalesTransaction.gross_profit).label("gross_profit")
-        ).filter(SalesTransaction.large_category == 'au+1 Collection')
-        
-        if staff_id:
-            query = query.filter(SalesTransaction.staff_id == staff_id)
-        
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
-        
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
+            facts.c.staff_id,
+            facts.c.staff_name,
+            func.sum(facts.c.row_count).label("transaction_count"),
+            func.sum(facts.c.total_price).label("total_sales"),
+            func.sum(facts.c.gross_profit).label("gross_profit")
+        )
         
         results = query.group_by(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name
-        ).order_by(SalesTransaction.staff_name).all()
+            facts.c.staff_id,
+            facts.c.staff_name
+        ).order_by(facts.c.staff_name).all()
         
         return results
     
     @staticmethod
+    @cached_query
     def get_au_plus_one_collection_detail(db: Session, staff_id: str = None, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
         """au+1Collection詳細情報を取得（商品別）"""
         
+        facts = RollupService.facts(
+            start_date, end_date, large_category='au+1 Collection', staff_id=staff_id, store_code=store_code
+        )
         query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            SalesTransaction.product_name,
-            SalesTransaction.small_category,
-            func.count(SalesTransaction.id).label("transaction_count"),
-            func.sum(SalesTransaction.total_price).label("total_sales"),
-            func.sum(SalesTransaction.gross_profit).label("gross_profit")
-        ).filter(SalesTransaction.large_category == 'au+1 Collection')
-        
-        if staff_id:
-            query = query.filter(SalesTransaction.staff_id == staff_id)
-        
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
-        
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
+            facts.c.staff_id,
+            facts.c.staff_name,
+            facts.c.product_name,
+            facts.c.small_category,
+            func.sum(facts.c.row_count).label("transaction_count"),
+            func.sum(facts.c.total_price).label("total_sales"),
+            func.sum(facts.c.gross_profit).label("gross_profit")
+        )
         
         results = query.group_by(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            SalesTransaction.product_name,
-            SalesTransaction.small_category
-        ).order_by(SalesTransaction.staff_name, SalesTransaction.product_name).all()
+            facts.c.staff_id,
+            facts.c.staff_name,
+            facts.c.product_name,
+            facts.c.small_category
+        ).order_by(facts.c.staff_name, facts.c.product_name).all()
         
         return results
     
     @staticmethod
+    @cached_query
     def get_au_plus_one_collection_by_category(db: Session, staff_id: str = None, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
         """au+1Collection中分類別集計を取得"""
         
+        facts = RollupService.facts(
+            start_date, end_date, large_category='au+1 Collection', staff_id=staff_id, store_code=store_code
+        )
         query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            SalesTransaction.small_category,
-            func.count(SalesTransaction.id).label("transaction_count"),
-            func.sum(SalesTransaction.total_price).label("total_sales"),
-            func.sum(SalesTransaction.gross_profit).label("gross_profit")
-        ).filter(SalesTransaction.large_category == 'au+1 Collection')
-        
-        if staff_id:
-            query = query.filter(SalesTransaction.staff_id == staff_id)
-        
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
-        
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
+            facts.c.staff_id,
+            facts.c.staff_name,
+            facts.c.small_category,
+            func.sum(facts.c.row_count).label("transaction_count"),
+            func.sum(facts.c.total_price).label("total_sales"),
+            func.sum(facts.c.gross_profit).label("gross_profit")
+        )
         
         results = query.group_by(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            SalesTransaction.small_category
-        ).order_by(SalesTransaction.staff_name, SalesTransaction.small_category).all()
+            facts.c.staff_id,
+            facts.c.staff_name,
+            facts.c.small_category
+        ).order_by(facts.c.staff_name, facts.c.small_category).all()
         
         return results
     
     @staticmethod
+    @cached_query
     def get_au_plus_one_collection_daily(db: Session, staff_id: str = None, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
         """au+1Collection日別推移を取得"""
         
+        facts = RollupService.facts(
+            start_date, end_date, large_category='au+1 Collection', staff_id=staff_id, store_code=store_code
+        )
         query = db.query(
-            func.date(SalesTransaction.transaction_date).label("date"),
-            func.count(SalesTransaction.id).label("transaction_count"),
-            func.sum(SalesTransaction.total_price).label("total_sales"),
-            func.sum(SalesTransaction.gross_profit).label("gross_profit")
-        ).filter(SalesTransaction.large_category == 'au+1 Collection')
-        
-        if staff_id:
-            query = query.filter(SalesTransaction.staff_id == staff_id)
-        
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
-        
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
+            facts.c.sales_date.label("date"),
+            func.sum(facts.c.row_count).label("transaction_count"),
+            func.sum(facts.c.total_price).label("total_sales"),
+            func.sum(facts.c.gross_profit).label("gross_profit")
+        )
         
         results = query.group_by(
-            func.date(SalesTransaction.transaction_date)
-        ).order_by(func.date(SalesTransaction.transaction_date)).all()
+            facts.c.sales_date
+        ).order_by(facts.c.sales_date).all()
         
         return results
     
     @staticmethod
-    def get_smartphone_sales_summary(db: Session, staff_id: str = None, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
-        """スマートフォン販売（移動機 + iPhone/スマートフォン）の集計を取得"""
+    @cached_query
+    def get_au_plus_one_collection_total(db: Session, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
+        """au+1Collection全体統計（全スタッフ合計）を取得"""
         
+        facts = RollupService.facts(start_date, end_date, large_category='au+1 Collection', store_code=store_code)
         query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            func.sum(SalesTransaction.quantity).label("total_quantity"),
-            func.sum(SalesTransaction.gross_profit).label("total_gross_profit"),
-            func.sum(SalesTransaction.total_price).label("total_sales")
-        ).filter(
-            SalesTransaction.large_category == '移動機',
-            SalesTransaction.small_category.in_(['iPhone', 'スマートフォン'])
+            func.sum(facts.c.row_count).label("transaction_count"),
+            func.sum(facts.c.total_price).label("total_sales"),
+            func.sum(facts.c.gross_profit).label("gross_profit")
         )
         
-        if staff_id:
-            query = query.filter(SalesTransaction.staff_id == staff_id)
-        
-        if store_code:
-            query = query.filter(SalesTransaction.store_code == store_code)
-        
-        if start_date:
-            query = query.filter(SalesTransaction.transaction_date >= start_date)
+        return query.first()
+    
+    @staticmethod
+    @cached_query
+    def get_smartphone_sales_summary(db: Session, staff_id: str = None, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
+        """スマートフォン販売（移動機 + iPhone/スマートフォン）の集計を取得"""
         
-        if end_date:
-            query = query.filter(SalesTransaction.transaction_date <= end_date)
+        facts = RollupService.facts(
+            start_date, end_date,
+            large_category='移動機', small_category=['iPhone', 'スマートフォン'],
+            staff_id=staff_id, store_code=store_code
+        )
+        query = db.query(
+            facts.c.staff_id,
+            facts.c.staff_name,
+            func.sum(facts.c.quantity).label("total_quantity"),
+            func.sum(facts.c.gross_profit).label("total_gross_profit"),
+            func.sum(facts.c.total_price).label("total_sales")
+        )
         
         results = query.group_by(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name
-        ).order_by(SalesTransaction.staff_name).all()
+            facts.c.staff_id,
+            facts.c.staff_name
+        ).order_by(facts.c.staff_name).all()
         
         return results
-
+    
     @staticmethod
+    @cached_query
     def get_unit_price_per_smartphone(db: Session, staff_id: str = None, store_code: str = None, start_date: datetime = None, end_date: datetime = None):
         """
         スマートフォン台当たり単価を計算
         = au+1 Collection粗利総額 ÷ (大分類='移動機' かつ 小分類='スマートフォン'または'iPhone')台数
         """
         
-        # au+1 Collection の粗利を取得
-        au1_query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            func.sum(SalesTransaction.gross_profit).label("au1_gross_profit")
-        ).filter(SalesTransaction.large_category == 'au+1 Collection')
-        
-        if staff_id:
-            au1_query = au1_query.filter(SalesTransaction.staff_id == staff_id)
-        if store_code:
-            au1_query = au1_query.filter(SalesTransaction.store_code == store_code)
-        if start_date:
-            au1_query = au1_query.filter(SalesTransaction.transaction_date >= start_date)
-        if end_date:
-            au1_query = au1_query.filter(SalesTransaction.transaction_date <= end_date)
-        
-        au1_results = au1_query.group_by(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name
-        ).all()
-        
-        # スマートフォンの台数を取得
-        smartphone_query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            func.sum(SalesTransaction.quantity).label("smartphone_count")
-        ).filter(
-            SalesTransaction.large_category == '移動機',
-            SalesTransaction.small_category == 'スマートフォン'
+        # au+1 Collection の粗利・スマートフォン台数・iPhone台数を1回の集計で取得
+        facts = RollupService.facts(
+            start_date, end_date, large_category=['au+1 Collection', '移動機'],
+            staff_id=staff_id, store_code=store_code
         )
-        
-        if staff_id:
-            smartphone_query = smartphone_query.filter(SalesTransaction.staff_id == staff_id)
-        if store_code:
-            smartphone_query = smartphone_query.filter(SalesTransaction.store_code == store_code)
-        if start_date:
-            smartphone_query = smartphone_query.filter(SalesTransaction.transaction_date >= start_date)
-        if end_date:
-            smartphone_query = smartphone_query.filter(SalesTransaction.transaction_date <= end_date)
-        
-        smartphone_results = smartphone_query.group_by(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name
-        ).all()
-        
-        # iPhoneの台数を取得
-        iphone_query = db.query(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name,
-            func.sum(SalesTransaction.quantity).label("iphone_count")
+        is_au1 = facts.c.large_category == 'au+1 Collection'
+        is_smartphone = and_(facts.c.large_category == '移動機', facts.c.small_category == 'スマートフォン')
+        is_iphone = and_(facts.c.large_category == '移動機', facts.c.small_category == 'iPhone')
+        results = db.query(
+            facts.c.staff_id,
+            facts.c.staff_name,
+            sum_if(facts.c.gross_profit, is_au1).label("au1_gross_profit"),
+            sum_if(facts.c.quantity, is_smartphone).label("smartphone_count"),
+            sum_if(facts.c.quantity, is_iphone).label("iphone_count")
         ).filter(
-            SalesTransaction.large_category == '移動機',
-            SalesTransaction.small_category == 'iPhone'
-        )
-        
-        if staff_id:
-            iphone_query = iphone_query.filter(SalesTransaction.staff_id == staff_id)
-        if store_code:
-            iphone_query = iphone_query.filter(SalesTransaction.store_code == store_code)
-        if start_date:
-            iphone_query = iphone_query.filter(SalesTransaction.transaction_date >= start_date)
-        if end_date:
-            iphone_query = iphone_query.filter(SalesTransaction.transaction_date <= end_date)
-        
-        iphone_results = iphone_query.group_by(
-            SalesTransaction.staff_id,
-            SalesTransaction.staff_name
+            or_(is_au1, is_smartphone, is_iphone)
+        ).group_by(
+            facts.c.staff_id,
+            facts.c.staff_name
         ).all()
         
-        # 結果を統合
+        # 結果を整形
         combined_results = []
-        au1_map = {(r.staff_id, r.staff_name): r.au1_gross_profit for r in au1_results}
-        smartphone_map = {(r.staff_id, r.staff_name): r.smartphone_count for r in smartphone_results}
-        iphone_map = {(r.staff_id, r.staff_name): r.iphone_count for r in iphone_results}
         
-        # 両方のデータを持つスタッフをフィルタ
-        all_staff = set(au1_map.keys()) | set(smartphone_map.keys()) | set(iphone_map.keys())
-        
-        for staff_id_val, staff_name_val in all_staff:
-            au1_profit = au1_map.get((staff_id_val, staff_name_val), 0) or 0
-            smartphone_count = smartphone_map.get((staff_id_val, staff_name_val), 0) or 0
-            iphone_count = iphone_map.get((staff_id_val, staff_name_val), 0) or 0
+        for result in results:
+            staff_id_val, staff_name_val = result.staff_id, result.staff_name
+            au1_profit = result.au1_gross_profit or 0
+            smartphone_count = result.smartphone_count or 0
+            iphone_count = result.iphone_count or 0
             total_device_count = smartphone_count + iphone_count
             
             # 台当たり単価を計算
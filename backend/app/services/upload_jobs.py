@@ -0,0 +1,358 @@
+"""
+CSV取込ジョブキュー
+アップロードされたCSVをジョブとして受け付け、リクエストとは別に処理する。
+  - 解析（デコード・read_csv・MNP判定）はプロセスプールで実行し、APIプロセスのCPUを占有しない
+  - DB書き込みは1つの書き込みスレッドで直列に行う（SQLiteの書き込みロック競合を避ける）
+解析プロセスはチャンク単位で結果を上限付きキューに送り、書き込みスレッドは受け取った順に挿入する。
+ジョブは受け付けたプロセスで実行し、進捗は state_backend（app/utils/state_backend.py）にも書き込む。
+STATE_BACKEND=sqlite なら、uvicorn --workers N でどのワーカーに進捗を問い合わせても同じ結果を返す。
+"""
+
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from app.config import UPLOAD_CHUNK_TIMEOUT_SECONDS, UPLOAD_CSV_CHUNK_ROWS, UPLOAD_JOB_PARSE_WORKERS
+from app.database import SessionLocal
+from app.services.csv_service import CSVService, ParsedCSV, encoding_cache
+from app.services.query_cache import query_cache
+from app.services.upload_service import UploadService
+from app.utils.state_backend import StateBackendUnavailable, state_backend
+
+# 解析プロセスが先行して保持できるチャンク数（メモリ使用量の上限）
+_CHUNK_QUEUE_SIZE = 2
+# 完了したジョブの状態を保持する秒数
+_FINISHED_JOB_RETENTION_SECONDS = 3600
+# 実行中・待機中のジョブの状態を state_backend に保持する秒数（プロセスが終了した場合に残り続けないようにする）
+_ACTIVE_JOB_RETENTION_SECONDS = 86400
+# state_backend のレコードの名前空間
+_JOB_RECORD_NAMESPACE = "upload_jobs"
+# 解析プロセスの応答待ちで生存確認を行う間隔（秒）
+_POLL_INTERVAL_SECONDS = 1.0
+
+# ジョブの段階
+STAGE_QUEUED = "queued"  # 書き込み待ち
+STAGE_PARSING = "parsing"  # 解析中（最初のチャンク待ち）
+STAGE_WRITING = "writing"  # チャンク単位で書き込み中
+STAGE_COMPLETED = "completed"
+STAGE_FAILED = "failed"
+
+
+def parse_csv_chunks(path: str, chunk_rows: int, chunk_queue, preferred_encoding: Optional[str] = None,
+                     put_timeout: Optional[float] = None):
+    """
+    解析プロセスで実行：CSVをチャンク単位で解析し、結果をキューに送る
+    送るメッセージ: ("encoding", エンコーディング) / ("chunk", 店舗情報, トランザクション, 読み込み行数) /
+                    ("done",) / ("error", メッセージ)
+    put_timeout: キューの空きを待つ最大秒数（書き込みスレッドがタイムアウトで打ち切ったジョブの解析を終了させる）
+    """
+    try:
+        with open(path, "rb") as file_obj:
+            encoding = CSVService.detect_stream_encoding(file_obj, preferred=preferred_encoding)
+            chunk_queue.put(("encoding", encoding), timeout=put_timeout)
+            for frame in CSVService.iter_csv_frames(file_obj, encoding, chunk_rows):
+                store_info_list = CSVService.extract_store_info(ParsedCSV(frame, encoding))
+                transactions = CSVService.parse_sales_frame(frame)
+                chunk_queue.put(("chunk", store_info_list, transactions, len(frame)), timeout=put_timeout)
+        chunk_queue.put(("done",), timeout=put_timeout)
+    except queue.Full:
+        print(f"❌ CSV Parse Error: 書き込みスレッドが応答しないため解析を中止しました ({path})")
+    except Exception as e:
+        print(f"❌ CSV Parse Error: {str(e)}")
+        try:
+            chunk_queue.put(("error", f"CSV解析失敗: {str(e)}"), timeout=put_timeout)
+        except queue.Full:
+            pass
+
+
+def _is_visible(owner_id: int, user) -> bool:
+    """ジョブを登録したユーザーと管理者のみ参照可能"""
+    return user.role == 'admin' or user.id == owner_id
+
+
+class ParseTimeout(Exception):
+    """解析プロセスから UPLOAD_CHUNK_TIMEOUT_SECONDS 秒以上チャンクが届かない"""
+
+
+class UploadJob:
+    """CSV取込ジョブの進捗"""
+
+    def __init__(self, path: str, filename: str, user):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.filename = filename
+        # 書き込み時の権限判定に必要な情報のみ保持（DBセッションに紐づくオブジェクトは持たない）
+        self.owner = SimpleNamespace(
+            id=user.id, username=user.username, role=user.role, store_code=user.store_code
+        )
+        self.stage = STAGE_QUEUED
+        self.rows_processed = 0
+        self.skipped_rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.filtered_out = 0
+        self.stores: List[str] = []
+        self.errors: List[str] = []
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.finished_monotonic: Optional[float] = None
+        self.encoding: Optional[str] = None
+        self.chunk_queue = None
+        self.future = None
+
+    def is_visible_to(self, user) -> bool:
+        return _is_visible(self.owner.id, user)
+
+    def to_dict(self) -> Dict:
+        message = f"Successfully uploaded {self.inserted} new transactions"
+        if self.duplicates > 0:
+            message += f" (skipped {self.duplicates} duplicates)"
+        if self.filtered_out > 0:
+            message += f" (filtered out {self.filtered_out} records from other stores)"
+        if self.stores:
+            message += "; " + ", ".join(self.stores)
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "stage": self.stage,
+            "encoding": self.encoding,
+            "rows_processed": self.rows_processed,
+            "skipped_rows": self.skipped_rows,
+            "count": self.inserted,
+            "duplicates": self.duplicates,
+            "filtered_out": self.filtered_out,
+            "store_count": len(self.stores),
+            "stores": list(self.stores),
+            "errors": list(self.errors),
+            "message": message if self.stage == STAGE_COMPLETED else None,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class UploadJobQueue:
+    """CSV取込ジョブの受付・実行（解析はプロセスプール、書き込みは単一スレッド）"""
+
+    def __init__(self, parse_workers: int = UPLOAD_JOB_PARSE_WORKERS, chunk_rows: int = UPLOAD_CSV_CHUNK_ROWS,
+                 chunk_timeout: float = UPLOAD_CHUNK_TIMEOUT_SECONDS, backend=None):
+        self.parse_workers = max(1, parse_workers)
+        self.chunk_rows = chunk_rows
+        self.chunk_timeout = chunk_timeout
+        self.backend = backend or state_backend
+        # このプロセスで受け付けたジョブ（他のワーカーのジョブは state_backend から参照する）
+        self.jobs: Dict[str, UploadJob] = {}
+        self.lock = threading.Lock()
+        self._pending: "queue.Queue[Optional[UploadJob]]" = queue.Queue()
+        self._executor = None
+        self._manager = None
+        self._writer = None
+
+    def start(self):
+        """
+        プロセスプール・Manager（いずれも spawn でプロセスを起動）と書き込みスレッドを起動
+        アプリ起動時に呼ぶ（リクエスト処理中にプロセスの起動を待たせない）。起動済みなら何もしない
+        """
+        with self.lock:
+            if self._writer is not None:
+                return
+            # APIプロセスのスレッド状態を引き継がないよう spawn で起動
+            context = multiprocessing.get_context("spawn")
+            self._manager = context.Manager()
+            self._executor = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=context)
+            self._writer = threading.Thread(target=self._write_loop, name="upload-job-writer", daemon=True)
+            self._writer.start()
+
+    def submit(self, path: str, filename: str, user) -> UploadJob:
+        """
+        ディスクに退避したCSVをジョブとして登録し、解析を開始
+        Manager とのプロセス間通信を伴うため、async のルートからは run_in_threadpool で呼ぶ
+        """
+        self.start()
+        job = UploadJob(path, filename, user)
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+            job.chunk_queue = self._manager.Queue(maxsize=_CHUNK_QUEUE_SIZE)
+            # 解析プロセスからは記憶を参照できないため、確認済みのエンコーディングを渡す
+            preferred_encoding = encoding_cache.get(UploadService.encoding_cache_key(job.owner))
+            job.future = self._executor.submit(
+                parse_csv_chunks, path, self.chunk_rows, job.chunk_queue, preferred_encoding, self.chunk_timeout
+            )
+        try:
+            self.backend.evict_records(_JOB_RECORD_NAMESPACE)
+        except StateBackendUnavailable:
+            pass
+        self._publish(job)
+        self._pending.put(job)
+        print(f"[JOB] 取込ジョブ登録: {job.id} ({filename}) - user: {job.owner.username}")
+        return job
+
+    def find(self, job_id: str, user) -> Optional[Dict]:
+        """
+        ジョブの状態（このプロセスで受け付けたジョブでなければ state_backend から取得）
+        ジョブが存在しない・参照権限がない場合は None。state_backend を読めない場合は StateBackendUnavailable
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                return job.to_dict() if job.is_visible_to(user) else None
+        record = self.backend.get_record(_JOB_RECORD_NAMESPACE, job_id)
+        if record is None:
+            return None
+        record = json.loads(record)
+        return record["job"] if _is_visible(record["owner_id"], user) else None
+
+    def snapshot(self, job: UploadJob) -> Dict:
+        with self.lock:
+            return job.to_dict()
+
+    def shutdown(self):
+        """書き込みスレッドとプロセスプールを停止（実行中のジョブは完了を待つ）"""
+        if self._writer is None:
+            return
+        self._pending.put(None)
+        self._writer.join()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._manager.shutdown()
+        self._writer = None
+
+    def _prune(self):
+        """保持期間を過ぎた完了ジョブを削除（lock 取得済みで呼ぶ）"""
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_monotonic is not None and now - job.finished_monotonic > _FINISHED_JOB_RETENTION_SECONDS
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def _update(self, job: UploadJob, **fields):
+        with self.lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+        self._publish(job)
+
+    def _publish(self, job: UploadJob):
+        """ジョブの状態を state_backend に書き込む（他のワーカープロセスからの進捗確認用）"""
+        with self.lock:
+            record = json.dumps({"owner_id": job.owner.id, "job": job.to_dict()})
+            finished = job.finished_at is not None
+        ttl = _FINISHED_JOB_RETENTION_SECONDS if finished else _ACTIVE_JOB_RETENTION_SECONDS
+        try:
+            self.backend.put_record(_JOB_RECORD_NAMESPACE, job.id, record, ttl)
+        except StateBackendUnavailable as e:
+            print(f"[警告] 取込ジョブの状態を保存できません（他のワーカーからは参照できません）: {e}")
+
+    def _write_loop(self):
+        while True:
+            job = self._pending.get()
+            if job is None:
+                return
+            self._run(job)
+
+    def _next_message(self, job: UploadJob):
+        """
+        解析プロセスからのメッセージを待つ（プロセスが異常終了した場合はエラー扱い）
+        chunk_timeout 秒以内に届かない場合は ParseTimeout（解析プロセスが応答しなくても書き込みスレッドを止めない）
+        """
+        deadline = time.monotonic() + self.chunk_timeout
+        while True:
+            try:
+                return job.chunk_queue.get(timeout=max(0, min(_POLL_INTERVAL_SECONDS, deadline - time.monotonic())))
+            except queue.Empty:
+                if job.future.done():
+                    # 送信済みのメッセージは終了前にキューに入っているため、残りを確認して空なら以降は届かない
+                    try:
+                        return job.chunk_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+                    if job.future.cancelled() or job.future.exception() is None:
+                        return ("error", "CSV解析プロセスが結果を返さずに終了しました")
+                    return ("error", f"CSV解析プロセスが異常終了しました: {job.future.exception()}")
+                if time.monotonic() >= deadline:
+                    raise ParseTimeout(f"CSV解析がタイムアウトしました（{self.chunk_timeout:g}秒以上応答がありません）")
+
+    def _run(self, job: UploadJob):
+        """1ジョブ分のチャンクを順に書き込み、最後に1回コミット"""
+        self._update(job, stage=STAGE_PARSING, started_at=datetime.utcnow())
+        db = SessionLocal()
+        seen_store_codes = set()
+        try:
+            while True:
+                message = self._next_message(job)
+                if message[0] == "done":
+                    break
+                if message[0] == "error":
+                    raise ValueError(message[1])
+                if message[0] == "encoding":
+                    self._update(job, encoding=message[1])
+                    continue
+
+                _, store_info_list, transactions, row_count = message
+                self._update(job, stage=STAGE_WRITING)
+                result = UploadService.write_chunk(db, store_info_list, transactions, job.owner, seen_store_codes)
+                with self.lock:
+                    job.rows_processed += row_count
+                    job.skipped_rows += row_count - len(transactions)
+                    job.inserted += result["inserted"]
+                    job.duplicates += result["duplicates"]
+                    job.filtered_out += result["filtered_out"]
+                    job.stores += result["registered_stores"]
+                self._publish(job)
+
+            db.commit()
+            query_cache.bump_generation()
+            self._update(job, stage=STAGE_COMPLETED)
+            # 最後まで取り込めたエンコーディングを次回のアップロードで優先する
+            encoding_cache.put(UploadService.encoding_cache_key(job.owner), job.encoding)
+            print(f"[JOB] 取込ジョブ完了: {job.id} - {job.inserted}件登録, {job.duplicates}件重複")
+        except Exception as e:
+            db.rollback()
+            print(f"❌ CSV Upload Job Error: {str(e)}")
+            print(f"Error traceback: {traceback.format_exc()}")
+            with self.lock:
+                # ロールバックしたため登録件数は0件として報告する
+                job.stage = STAGE_FAILED
+                job.errors.append(str(e))
+                job.inserted = 0
+                job.stores = []
+            if isinstance(e, ParseTimeout):
+                # 応答しない解析は待たない（実行前なら取り消し、実行中ならキューへの送信がタイムアウトして終了する）
+                job.future.cancel()
+            else:
+                # 解析が途中の場合は残りのチャンクを読み捨てて解析プロセスを解放する
+                self._drain(job)
+        finally:
+            db.close()
+            with self.lock:
+                job.finished_at = datetime.utcnow()
+                job.finished_monotonic = time.monotonic()
+                job.chunk_queue = None
+                job.future = None
+            self._publish(job)
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+
+    def _drain(self, job: UploadJob):
+        while not job.future.done():
+            try:
+                job.chunk_queue.get(timeout=_POLL_INTERVAL_SECONDS)
+            except queue.Empty:
+                continue
+
+
+# グローバル取込ジョブキュー
+upload_job_queue = UploadJobQueue()
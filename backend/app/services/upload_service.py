@@ -0,0 +1,190 @@
+from typing import BinaryIO, Dict, Iterable, List, Set
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from app.config import UPLOAD_CSV_CHUNK_ROWS, UPLOAD_INSERT_BATCH_SIZE
+from app.models.sales import SalesTransaction, transaction_fingerprint
+from app.models.store import Store
+from app.schemas import SalesTransactionCreate
+from app.services.csv_service import CSVService, ParsedCSV, encoding_cache
+from app.services.rollup_service import RollupService
+
+class UploadService:
+    """CSVアップロードのDB書き込みサービス"""
+
+    @staticmethod
+    def ingest_csv(db: Session, file_obj: BinaryIO, user, chunk_rows: int = UPLOAD_CSV_CHUNK_ROWS) -> Dict:
+        """
+        ディスクに退避したCSVをチャンク単位で解析・登録（メモリ使用量はファイルサイズに依存しない）
+        一般ユーザー(role != 'admin')の場合は自身の店舗のデータのみ登録する
+        コミットは呼び出し側で行うため、アップロード全体が1トランザクションのまま保たれる
+        Returns: {"inserted", "duplicates", "filtered_out", "registered_stores"}
+        """
+        cache_key = UploadService.encoding_cache_key(user)
+        encoding = CSVService.detect_stream_encoding(file_obj, preferred=encoding_cache.get(cache_key))
+        
+        parsed_count = 0
+        totals = {"inserted": 0, "duplicates": 0, "filtered_out": 0, "registered_stores": []}
+        seen_store_codes: Set[str] = set()
+        
+        for frame in CSVService.iter_csv_frames(file_obj, encoding, chunk_rows):
+            store_info_list = CSVService.extract_store_info(ParsedCSV(frame, encoding))
+            transactions = CSVService.parse_sales_frame(frame)
+            del frame
+            parsed_count += len(transactions)
+            
+            result = UploadService.write_chunk(db, store_info_list, transactions, user, seen_store_codes)
+            for key in totals:
+                totals[key] += result[key]
+        
+        print(f"[CSV] {parsed_count}件のトランザクションを抽出")
+        # 最後まで解析できたエンコーディングを次回のアップロードで優先する
+        encoding_cache.put(cache_key, encoding)
+        return totals
+
+    @staticmethod
+    def encoding_cache_key(user):
+        """確認済みエンコーディングの記憶単位（店舗 + アップロードユーザー）"""
+        return (user.store_code, user.id) if user else None
+
+    @staticmethod
+    def write_chunk(
+        db: Session,
+        store_info_list: List[Dict],
+        transactions: List[SalesTransactionCreate],
+        user,
+        seen_store_codes: Set[str]
+    ) -> Dict:
+        """
+        解析済みの1チャンク分の店舗情報・トランザクションをDBに書き込む（コミットは呼び出し側）
+        user: role / store_code を持つオブジェクト（一般ユーザーは自身の店舗のデータのみ登録）
+        Returns: {"inserted", "duplicates", "filtered_out", "registered_stores"}
+        """
+        # チャンク内の店舗情報をDBに登録（一般ユーザーは自身の店舗のみ）
+        registered_stores = UploadService.register_stores(db, store_info_list, user, seen_store_codes)
+        
+        # 非管理者ユーザーがアップロードする場合、ユーザーの店舗のデータのみを抽出
+        filtered_out_count = 0
+        if user and user.role != 'admin':
+            own_store_transactions = [t for t in transactions if t.store_code == user.store_code]
+            filtered_out_count = len(transactions) - len(own_store_transactions)
+            transactions = own_store_transactions
+        
+        # 完全重複（フィンガープリント一致）の行はDBの一意制約により挿入されない
+        inserted_count = UploadService.insert_transactions(db, transactions)
+        return {
+            "inserted": inserted_count,
+            "duplicates": len(transactions) - inserted_count,
+            "filtered_out": filtered_out_count,
+            "registered_stores": registered_stores,
+        }
+
+    @staticmethod
+    def register_stores(db: Session, store_info_list: List[Dict], user, seen_store_codes: Set[str]) -> List[str]:
+        """
+        CSVから抽出した店舗情報をDBに登録（既存店舗は仮の店舗名のみ更新）
+        seen_store_codes: 処理済みの店舗コード（チャンクをまたいで同じ店舗を再処理しない）
+        Returns: 登録・更新内容のメッセージ
+        """
+        registered_stores = []
+        for store_info in store_info_list:
+            if store_info['store_code'] in seen_store_codes:
+                continue
+            seen_store_codes.add(store_info['store_code'])
+            
+            # 非管理者ユーザーの場合、自身の店舗のみ処理
+            if user and user.role != 'admin' and store_info['store_code'] != user.store_code:
+                print(f"⚠️ スキップ: {store_info['store_name']} ({store_info['store_code']}) - ユーザーの店舗ではありません")
+                continue
+            
+            existing_store = db.query(Store).filter(Store.store_code == store_info['store_code']).first()
+            if not existing_store:
+                new_store = Store(
+                    store_code=store_info['store_code'],
+                    store_name=store_info['store_name'],
+                    location=store_info.get('location', '未設定')
+                )
+                db.add(new_store)
+                registered_stores.append(f"新規：{store_info['store_name']} ({store_info['store_code']})")
+            else:
+                # 既存店舗の場合は店舗名を更新
+                if existing_store.store_name.startswith('店舗 ') and store_info['store_name']:
+                    existing_store.store_name = store_info['store_name']
+                    db.add(existing_store)
+                    registered_stores.append(f"更新：{store_info['store_name']} ({store_info['store_code']})")
+        return registered_stores
+
+    @staticmethod
+    def insert_transactions(
+        db: Session,
+        transactions: Iterable[SalesTransactionCreate],
+        batch_size: int = UPLOAD_INSERT_BATCH_SIZE
+    ) -> int:
+        """
+        トランザクションを一括挿入（ORMオブジェクトを生成せず Core の executemany で書き込む）
+        フィンガープリントが既存行（または同一ファイル内の先行行）と一致する行はDB側で無視される
+        挿入した行は同じトランザクションで日別集計（sales_daily_rollup）に加算する
+        コミットは呼び出し側で行うため、アップロード全体が1トランザクションのまま保たれる
+        Returns: 挿入件数（渡した件数との差が重複件数）
+        """
+        inserted = 0
+        batch: List[dict] = []
+
+        for transaction in transactions:
+            row = transaction.model_dump()
+            row['fingerprint'] = transaction_fingerprint(
+                transaction.transaction_date, transaction.ticket_number, transaction.staff_id,
+                transaction.product_code, transaction.quantity, transaction.total_price
+            )
+            batch.append(row)
+            if len(batch) >= batch_size:
+                inserted += UploadService._insert_batch(db, batch)
+                batch = []
+
+        if batch:
+            inserted += UploadService._insert_batch(db, batch)
+
+        return inserted
+
+    @staticmethod
+    def _insert_batch(db: Session, rows: List[dict]) -> int:
+        inserted_rows = UploadService._insert_ignoring_duplicates(db, rows)
+        RollupService.apply_rows(db, inserted_rows)
+        return len(inserted_rows)
+
+    @staticmethod
+    def _insert_ignoring_duplicates(db: Session, rows: List[dict]) -> List[dict]:
+        """フィンガープリント重複を無視して挿入し、実際に挿入した行を返す"""
+        table = SalesTransaction.__table__
+        dialect = db.get_bind().dialect.name
+
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            # ON CONFLICT 非対応のDBでは既存フィンガープリントを事前に除外して挿入
+            existing = set(db.execute(
+                select(table.c.fingerprint).where(table.c.fingerprint.in_([r['fingerprint'] for r in rows]))
+            ).scalars())
+            new_rows = []
+            for row in rows:
+                if row['fingerprint'] not in existing:
+                    existing.add(row['fingerprint'])
+                    new_rows.append(row)
+            if new_rows:
+                db.execute(insert(table), new_rows)
+            return new_rows
+
+        stmt = (
+            dialect_insert(table)
+            .on_conflict_do_nothing(index_elements=['fingerprint'])
+            .returning(table.c.fingerprint)
+        )
+        inserted = set(db.execute(stmt, rows).scalars())
+        # 同じフィンガープリントの行がバッチ内に複数ある場合は先行行が挿入される
+        inserted_rows = []
+        for row in rows:
+            if row['fingerprint'] in inserted:
+                inserted.discard(row['fingerprint'])
+                inserted_rows.append(row)
+        return inserted_rows
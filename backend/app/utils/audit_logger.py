@@ -1,6 +1,154 @@
-from datetime import datetime, timezone
-from typing import Optional, Dict, Any
+"""
+監査ログの書き込み
+イベントごとにスレッドとDBセッションを作ると、ログイン集中時に多数のスレッドが SQLite の書き込みロックを奪い合うため、
+件数上限付きのキューに積み、1つの書き込みスレッドがまとめて（1トランザクションで）書き込む。
+  - AUDIT_LOG_BATCH_SIZE 件たまるか、最初のイベントから AUDIT_LOG_FLUSH_INTERVAL_SECONDS 秒経過で書き込む
+  - キューが満杯の場合: drop は記録を諦めて dropped に加算、block は空くまで最大 _BLOCK_TIMEOUT_SECONDS 秒待つ
+  - アプリ終了時（shutdown）にキューに残ったイベントを書き込む
+"""
+
+import queue
 import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+
+from sqlalchemy import insert
+
+from app.config import (
+    AUDIT_LOG_BATCH_SIZE,
+    AUDIT_LOG_FLUSH_INTERVAL_SECONDS,
+    AUDIT_LOG_OVERFLOW,
+    AUDIT_LOG_QUEUE_SIZE,
+)
+
+# overflow=block の場合にキューの空きを待つ最大秒数（超えたら破棄）
+_BLOCK_TIMEOUT_SECONDS = 5.0
+# キューの終端（shutdown 時に投入）
+_STOP = object()
+
+
+class AuditLogWriter:
+    """監査ログの一括書き込み（件数上限付きキュー + 単一の書き込みスレッド）"""
+
+    def __init__(self, queue_size: int = AUDIT_LOG_QUEUE_SIZE, batch_size: int = AUDIT_LOG_BATCH_SIZE,
+                 flush_interval: float = AUDIT_LOG_FLUSH_INTERVAL_SECONDS, overflow: str = AUDIT_LOG_OVERFLOW):
+        if overflow not in ("drop", "block"):
+            raise ValueError(f"AUDIT_LOG_OVERFLOW は drop または block を指定してください: {overflow}")
+        self.queue_size = queue_size
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    def _start(self):
+        """初回のイベントで書き込みスレッドを起動"""
+        with self.lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._write_loop, name="audit-log-writer", daemon=True)
+            self._writer.start()
+
+    def submit(self, row: Dict[str, Any]) -> bool:
+        """イベントをキューに積む（満杯で破棄した場合は False）"""
+        if self._writer is None:
+            self._start()
+        try:
+            if self.overflow == "block":
+                self._queue.put(row, timeout=_BLOCK_TIMEOUT_SECONDS)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+                dropped = self.dropped
+            # 集中時に出力が増えないよう、1件目と1000件ごとに出力
+            if dropped % 1000 == 1:
+                print(f"⚠️ Audit log queue full, {dropped} events dropped so far")
+            return False
+        with self.lock:
+            self.enqueued += 1
+        return True
+
+    def _write_loop(self):
+        while True:
+            row = self._queue.get()
+            if row is _STOP:
+                return
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stop = True
+                    break
+                batch.append(row)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        """1トランザクションでまとめて INSERT（失敗した場合はバッチ全体を failed に加算して継続）"""
+        from app.database import SessionLocal
+        from app.models.audit_log import AuditLog
+
+        session = SessionLocal()
+        try:
+            session.execute(insert(AuditLog), batch)
+            session.commit()
+            with self.lock:
+                self.written += len(batch)
+                self.batches += 1
+            print(f"📝 Logs recorded: {len(batch)} events ({batch[-1]['event_type']} - {batch[-1]['username']})")
+        except Exception as e:
+            session.rollback()
+            with self.lock:
+                self.failed += len(batch)
+            print(f"⚠️ Error logging {len(batch)} events (will continue): {e}")
+        finally:
+            session.close()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self.queue_size,
+                "batch_size": self.batch_size,
+                "flush_interval_seconds": self.flush_interval,
+                "overflow": self.overflow,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+            }
+
+    def shutdown(self):
+        """キューに残ったイベントを書き込んでから書き込みスレッドを停止"""
+        if self._writer is None:
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._writer = None
+
+
+# グローバル監査ログ書き込み
+audit_log_writer = AuditLogWriter()
+
 
 def log_event(
     event_type: str,
@@ -15,47 +163,30 @@ def log_event(
     status_code: Optional[int] = None,
     db = None
 ):
-    """イベントをログに記録（非同期で実行）"""
-    def _log():
-        try:
-            from app.models.audit_log import AuditLog
-            
-            if db is None:
-                from app.database import SessionLocal
-                session = SessionLocal()
-                should_close = True
-            else:
-                session = db
-                should_close = False
-            
-            try:
-                log = AuditLog(
-                    timestamp=datetime.now(timezone.utc),
-                    event_type=event_type,
-                    user_id=user_id,
-                    username=username,
-                    ip_address=ip_address,
-                    user_agent=user_agent,
-                    resource=resource,
-                    action=action,
-                    details=details or {},
-                    success=success,
-                    status_code=status_code
-                )
-                
-                session.add(log)
-                session.commit()
-                print(f"📝 Log recorded: {event_type} - {username} ({ip_address})")
-            except Exception as e:
-                session.rollback()
-                print(f"⚠️ Error logging event (will continue): {e}")
-            finally:
-                if should_close:
-                    session.close()
-        except Exception as e:
-            print(f"⚠️ Unexpected error in logging: {e}")
-    
-    # バックグラウンドスレッドでログを記録
-    thread = threading.Thread(target=_log, daemon=True)
-    thread.start()
+    """イベントをログに記録（キューに積み、書き込みスレッドがまとめて書き込む。db 指定時はそのセッションで即時に記録）"""
+    row = dict(
+        timestamp=datetime.now(timezone.utc),
+        event_type=event_type,
+        user_id=user_id,
+        username=username,
+        ip_address=ip_address,
+        user_agent=user_agent,
+        resource=resource,
+        action=action,
+        details=details or {},
+        success=success,
+        status_code=status_code
+    )
+
+    if db is None:
+        audit_log_writer.submit(row)
+        return
 
+    from app.models.audit_log import AuditLog
+    try:
+        db.add(AuditLog(**row))
+        db.commit()
+        print(f"📝 Log recorded: {event_type} - {username} ({ip_address})")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Error logging event (will continue): {e}")
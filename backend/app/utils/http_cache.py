@@ -0,0 +1,45 @@
+"""
+条件付きGET（ETag / If-None-Match）
+集計APIのレスポンスは売上データの版（query_cache.data_version）と URL のみで決まるため、
+これらから ETag を作り、クライアントの If-None-Match と一致すれば集計せずに 304 を返す。
+"""
+
+import hashlib
+
+from fastapi import Depends, HTTPException, Request, Response
+
+from app.services.query_cache import query_cache
+from app.utils.state_backend import StateBackendUnavailable
+from app.utils.jwt_auth import get_current_user
+
+
+def compute_etag(request: Request) -> str:
+    """データの版・パス・クエリパラメータ（順不同）から強いETagを作る"""
+    params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    digest = hashlib.sha256(f"{query_cache.data_version}|{request.url.path}?{params}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match は弱い比較（W/ の有無を問わない）"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def conditional_etag(request: Request, response: Response, current_user=Depends(get_current_user)):
+    """
+    集計APIの依存関係：認証後に ETag を確認し、一致すれば 304 を返す（集計クエリは実行しない）
+    一致しない場合はレスポンスに ETag を付与する。ブラウザには毎回再検証させる（no-cache）
+    データの版は状態保存先（STATE_BACKEND=sqlite ではファイル）から読むため、def としてスレッドプールで実行する
+    版を読めない場合は ETag を付けずに通常どおり集計する
+    """
+    try:
+        etag = compute_etag(request)
+    except StateBackendUnavailable as e:
+        print(f"[警告] データの版を取得できないため、ETag を付けずに応答します: {e}")
+        return
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
@@ -11,6 +11,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_HOURS
+from app.utils.principal_cache import make_principal, principal_cache
 
 security = HTTPBearer()
 
@@ -23,12 +24,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def get_current_user(
+def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ):
     """
-    Authorization: Bearer <token> ヘッダーを検証し、ユーザーを返す。
+    Authorization: Bearer <token> ヘッダーを検証し、ユーザー（principal_cache のスナップショット）を返す。
     トークンが無効・期限切れ・ユーザーが非アクティブの場合は 401 を返す。
     """
     from app.models.user import User
@@ -46,7 +47,12 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    def load_principal():
+        user = db.query(User).filter(User.id == int(user_id)).first()
+        return make_principal(user) if user is not None else None
+
+    # 同じユーザーの連続したリクエストでは users テーブルを参照しない（変更時は principal_cache を破棄）
+    user = principal_cache.get_or_load(int(user_id), load_principal)
     if user is None or not user.is_active:
         raise credentials_exception
     return user
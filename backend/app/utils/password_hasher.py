@@ -0,0 +1,101 @@
+"""
+パスワードハッシュ（bcrypt）の専用スレッドプール
+bcrypt は1回あたり数百ミリ秒CPUを使うため、ログインが集中するとAPI全体の処理スレッドが埋まる。
+ハッシュ計算・照合を件数上限付きの専用プールで実行し、待ちが上限を超えたら即座に 503 を返す。
+  - bcrypt は計算中に GIL を解放するため、スレッドプールで複数コアを使える
+  - 実行中 + 待機中の件数が PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT に達したら受け付けない
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.config import PASSWORD_HASH_QUEUE_LIMIT, PASSWORD_HASH_WORKERS
+
+# 混雑時に再試行を促す秒数（Retry-After ヘッダー）
+_RETRY_AFTER_SECONDS = 5
+
+
+class PasswordHasherBusy(Exception):
+    """パスワードハッシュの待ちが上限に達している"""
+
+
+class PasswordHasher:
+    """件数上限付きのパスワードハッシュ専用スレッドプール"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        # 実行中 + 待機中の件数の上限
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise PasswordHasherBusy()
+        with self.lock:
+            self.pending += 1
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            with self.lock:
+                self.pending -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        return self._run(self.context.hash, password)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._run(self.context.verify, password, password_hash)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+# グローバルパスワードハッシュプール
+password_hasher = PasswordHasher()
+
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="ただいま混み合っています。しばらくしてから再度お試しください",
+        headers={"Retry-After": str(_RETRY_AFTER_SECONDS)},
+    )
+
+
+def hash_password(password: str) -> str:
+    """パスワードをハッシュ化（混雑時は 503）"""
+    try:
+        return password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise _busy()
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """パスワードを照合（混雑時は 503）"""
+    try:
+        return password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _busy()
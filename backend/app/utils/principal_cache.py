@@ -0,0 +1,124 @@
+"""
+認証ユーザー（principal）キャッシュ
+get_current_user はリクエストごとに users テーブルを参照していたため、
+ユーザー ID をキーに必要な属性のみ（DBセッションに紐づかないスナップショット）を短時間保持する。
+  - 件数上限付きの LRU + 有効期限（TTL）
+  - routes/auth.py のユーザー変更（削除・店舗変更・パスワード変更 / リセット）のコミット後に invalidate() で即時破棄
+  - 参照中に破棄された場合、参照前の値を保存しない（破棄前の古い値が残らない）
+  - 破棄の版は state_backend（app/utils/state_backend.py）に保存する。
+    STATE_BACKEND=sqlite なら他プロセスでの変更も次のリクエストから反映される（memory では TTL 経過まで反映されない）
+    版を読めない場合（StateBackendUnavailable）はキャッシュを使わずに users テーブルを参照する
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional, Tuple
+
+from app.config import PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS
+from app.utils.state_backend import StateBackendUnavailable, state_backend
+
+# state_backend のカウンタ名
+_VERSION_COUNTER = "principal_cache.version"
+
+# キャッシュするユーザーの属性（パスワードハッシュは保持しない）
+PRINCIPAL_FIELDS = ("id", "username", "staff_id", "staff_name", "store_code", "role", "is_active")
+
+
+def make_principal(user) -> SimpleNamespace:
+    """User からリクエスト間で共有できるスナップショットを作成"""
+    return SimpleNamespace(**{name: getattr(user, name) for name in PRINCIPAL_FIELDS})
+
+
+class PrincipalCache:
+    """ユーザー ID → principal のキャッシュ（LRU + TTL）"""
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS,
+                 backend=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend or state_backend
+        self.hits = 0
+        self.misses = 0
+        # ユーザー ID → (版, 期限（monotonic）, principal または None（ユーザーなし）)
+        self._entries: "OrderedDict[int, Tuple[int, float, Optional[SimpleNamespace]]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    @property
+    def version(self) -> int:
+        """invalidate() のたびに繰り上がる版（他プロセスでの破棄も反映される）"""
+        return self.backend.counter(_VERSION_COUNTER)
+
+    def get_or_load(self, user_id: int, load: Callable[[], Optional[SimpleNamespace]]) -> Optional[SimpleNamespace]:
+        """キャッシュ済みの principal を返す。なければ load() の結果を保存して返す"""
+        if not self.enabled:
+            return load()
+
+        now = time.monotonic()
+        try:
+            version = self.version
+        except StateBackendUnavailable as e:
+            print(f"[警告] principal キャッシュの版を取得できないため、キャッシュを使わずに参照します: {e}")
+            return load()
+        with self.lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+
+        principal = load()
+
+        # 参照中に破棄された場合は保存しない
+        try:
+            current_version = self.version
+        except StateBackendUnavailable:
+            return principal
+        with self.lock:
+            if version == current_version:
+                self._entries[user_id] = (version, time.monotonic() + self.ttl_seconds, principal)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: int = None):
+        """
+        ユーザーの変更をコミットした後に呼ぶ（user_id 省略時は全件破棄）
+        版を繰り上げるため、他プロセスでは全件が破棄される（ユーザーの変更は頻繁ではない）
+        """
+        try:
+            self.backend.increment(_VERSION_COUNTER)
+        except StateBackendUnavailable as e:
+            print(f"[ERROR] principal キャッシュの版を繰り上げられません（他プロセスのキャッシュは有効期限まで残ります）: {e}")
+        with self.lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "backend": self.backend.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            }
+
+
+# グローバル principal キャッシュ
+principal_cache = PrincipalCache()
@@ -1,45 +1,118 @@
-from datetime import datetime, timedelta, timezone
-from collections import defaultdict
-import threading
+"""
+レート制限（スライディングウィンドウカウンタ方式）
+識別子（IPアドレス等）ごとに「現在の窓の回数」と「直前の窓の回数」だけを保持し、
+直前の窓の回数を窓内の経過割合で按分した推定値で判定する（識別子あたりのメモリは一定）。
+  - 時刻は time.monotonic()（システム時刻の変更の影響を受けない。Linux では同じホストのプロセス間で共通）
+  - 回数は state_backend（app/utils/state_backend.py）に保存する
+    memory: 識別子をハッシュで振り分けたシャードごとにロックを持ち、別の識別子同士は競合しない
+    sqlite: 同じホストの全プロセスで回数を共有する（uvicorn --workers N でも上限が N 倍にならない）
+  - 2窓以上アクセスのない識別子は定期的に削除（異なるIPが増え続けてもメモリが増え続けない）
+  - 保存先を読み書きできない場合（StateBackendUnavailable）は 500 にせず、fail_open に従い許可または拒否する
+    API全体の制限は許可（可用性を優先）、ログインの制限は拒否（ロック中もブルートフォース対策を止めない）
+"""
+
+import math
+import time
+import uuid
+from typing import List
+
+from app.utils.state_backend import StateBackendUnavailable, state_backend
+
+# 保存先を読み書きできない場合に返す再試行までの秒数（sqlite のロック待ちの上限と同程度）
+_UNAVAILABLE_RETRY_SECONDS = 5
+
 
 class RateLimiter:
     """レート制限（ブルートフォース対策）"""
-    def __init__(self, max_attempts: int = 5, window_seconds: int = 300):
+    def __init__(self, max_attempts: int = 5, window_seconds: int = 300, eviction_interval: float = None,
+                 namespace: str = None, backend=None, fail_open: bool = True):
         self.max_attempts = max_attempts
         self.window_seconds = window_seconds
-        self.attempts = defaultdict(list)
-        self.lock = threading.Lock()
-    
+        # 期限切れの識別子を削除する間隔（秒）
+        self.eviction_interval = eviction_interval if eviction_interval is not None else window_seconds
+        # 状態保存先の中での区別（省略時はインスタンスごとに固有）
+        self.namespace = namespace or f"limiter-{uuid.uuid4().hex[:12]}"
+        self.backend = backend or state_backend
+        # 保存先を読み書きできない場合に許可するか（False なら拒否）
+        self.fail_open = fail_open
+        self.next_eviction = 0.0
+
+    def _advance(self, counter: List[int], window: int):
+        """counter を現在の窓に進める（呼び出し側で排他的に取得済み）"""
+        if counter[0] == window:
+            return
+        # 1つ前の窓なら現在の回数が直前の回数になり、それより前なら両方 0
+        counter[2] = counter[1] if counter[0] == window - 1 else 0
+        counter[1] = 0
+        counter[0] = window
+
+    def _evict(self, window: int, now: float):
+        """2窓以上アクセスのない識別子を削除（推定値が 0 のため削除しても判定は変わらない）"""
+        self.next_eviction = now + self.eviction_interval
+        self.backend.evict_windows(self.namespace, window - 1)
+
     def is_allowed(self, identifier: str) -> bool:
-        """リクエストが許可されているか確認"""
-        now = datetime.now(timezone.utc)
-        
-        with self.lock:
-            # 期限切れの試行を削除
-            cutoff_time = now - timedelta(seconds=self.window_seconds)
-            self.attempts[identifier] = [
-                attempt_time for attempt_time in self.attempts[identifier]
-                if attempt_time > cutoff_time
-            ]
-            
-            # 試行上限をチェック
-            if len(self.attempts[identifier]) >= self.max_attempts:
+        """リクエストが許可されているか確認（許可した場合は回数に加算）"""
+        try:
+            return self._check(identifier)
+        except StateBackendUnavailable as e:
+            if self.fail_open:
+                print(f"[警告] レート制限の回数を取得できないため許可します（{self.namespace}）: {e}")
+                return True
+            print(f"[ERROR] レート制限の回数を取得できないため拒否します（{self.namespace}）: {e}")
+            return False
+
+    def _check(self, identifier: str) -> bool:
+        now = time.monotonic()
+        window, offset = divmod(now, self.window_seconds)
+        window = int(window)
+        if now >= self.next_eviction:
+            self._evict(window, now)
+
+        with self.backend.window_counter(self.namespace, identifier, window) as counter:
+            self._advance(counter, window)
+
+            # 直前の窓の回数を、現在の窓と重なっている割合で按分
+            estimated = counter[2] * (1 - offset / self.window_seconds) + counter[1]
+            if estimated >= self.max_attempts:
                 return False
-            
-            # 新しい試行を記録
-            self.attempts[identifier].append(now)
+
+            counter[1] += 1
             return True
-    
+
     def get_remaining_time(self, identifier: str) -> int:
         """ブロックが解除されるまでの秒数"""
-        if identifier not in self.attempts or len(self.attempts[identifier]) < self.max_attempts:
+        now = time.monotonic()
+        window, offset = divmod(now, self.window_seconds)
+        window = int(window)
+        # 読み取りのみのため、窓を進めた値をコピーで計算する
+        try:
+            counter = self.backend.read_window_counter(self.namespace, identifier)
+        except StateBackendUnavailable:
+            return _UNAVAILABLE_RETRY_SECONDS
+        if counter is None:
             return 0
-        
-        oldest_attempt = self.attempts[identifier][0]
-        cutoff_time = oldest_attempt + timedelta(seconds=self.window_seconds)
-        remaining = (cutoff_time - datetime.now(timezone.utc)).total_seconds()
-        return max(0, int(remaining))
+        self._advance(counter, window)
+
+        _, current, previous = counter
+        fraction = offset / self.window_seconds
+        if previous * (1 - fraction) + current < self.max_attempts:
+            return 0
+        if current < self.max_attempts:
+            # 現在の窓内で、直前の窓の按分が十分に減る時点
+            unblock_fraction = 1 - (self.max_attempts - current) / previous
+            wait = (unblock_fraction - fraction) * self.window_seconds
+        else:
+            # 次の窓で、現在の窓の回数の按分が上限を下回る時点
+            next_fraction = 1 - self.max_attempts / current
+            wait = (1 - fraction + next_fraction) * self.window_seconds
+        # 境界ちょうどでは推定値が上限と等しく拒否されるため、1秒先を返す
+        return max(0, math.floor(wait) + 1)
+
+    def tracked_identifiers(self) -> int:
+        """保持している識別子の数"""
+        return self.backend.count_windows(self.namespace)
 
 # グローバルレート制限インスタンス
-login_limiter = RateLimiter(max_attempts=5, window_seconds=300)  # 5分間に5回まで
-api_limiter = RateLimiter(max_attempts=100, window_seconds=60)  # 1分間に100回まで
+login_limiter = RateLimiter(max_attempts=5, window_seconds=300, namespace="login", fail_open=False)  # 5分間に5回まで
+api_limiter = RateLimiter(max_attempts=100, window_seconds=60, namespace="api")  # 1分間に100回まで
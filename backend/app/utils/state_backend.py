@@ -0,0 +1,272 @@
+"""
+プロセス間で共有する状態（レート制限の回数・キャッシュの世代カウンタ）の保存先
+  - memory: プロセス内（デフォルト。ワーカー1つで動かす場合）
+  - sqlite: ローカルの SQLite ファイル（uvicorn --workers N など、同じホストで複数プロセスを動かす場合）
+保存先は環境変数 STATE_BACKEND で選択する。売上DB（DATABASE_URL）とは別のファイルを使う。
+各キャッシュの値そのものはプロセスごとに持ち、世代カウンタのみ共有して無効化を全プロセスに伝える。
+取込ジョブの進捗など他プロセスからも参照する小さな値は、有効期限付きのレコード（JSON 文字列）として保存する。
+sqlite はファイル I/O とロック待ちを伴うため（blocking = True）、イベントループからは直接呼ばずスレッドプールで実行する。
+ロックを取得できない場合は StateBackendUnavailable を送出する（呼び出し側でレート制限は許可、キャッシュは使わずに継続）。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.config import STATE_BACKEND, STATE_SQLITE_PATH
+
+# レート制限の窓カウンタ: [窓番号, 現在の窓の回数, 直前の窓の回数]
+WindowCounter = List[int]
+
+# シャード数（memory のロックの粒度）
+_SHARD_COUNT = 16
+# sqlite のロック待ちの最大秒数
+_SQLITE_TIMEOUT_SECONDS = 5.0
+
+
+class StateBackendUnavailable(Exception):
+    """状態保存先を読み書きできない（sqlite のロック待ちのタイムアウトなど）"""
+
+
+class _Shard:
+    __slots__ = ("lock", "counters")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (名前空間, 識別子) → 窓カウンタ
+        self.counters: Dict[Tuple[str, str], WindowCounter] = {}
+
+
+class MemoryStateBackend:
+    """プロセス内の状態（複数プロセス間では共有されない）"""
+
+    name = "memory"
+    # 呼び出しがファイル I/O・ロック待ちを伴うか（True ならイベントループから直接呼ばない）
+    blocking = False
+
+    def __init__(self):
+        # プロセスごとの識別子（再起動で世代カウンタが 0 に戻っても data_version が以前と重ならないようにする）
+        self.instance_id = uuid.uuid4().hex[:12]
+        self._counters: Dict[str, int] = {}
+        self._counters_lock = threading.Lock()
+        self._shards = [_Shard() for _ in range(_SHARD_COUNT)]
+        # (名前空間, キー) → (期限（time.time()）, 値)
+        self._records: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._records_lock = threading.Lock()
+
+    # ── カウンタ ──
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def increment(self, name: str) -> int:
+        with self._counters_lock:
+            value = self._counters.get(name, 0) + 1
+            self._counters[name] = value
+            return value
+
+    # ── レート制限の窓カウンタ ──
+    @contextmanager
+    def window_counter(self, namespace: str, identifier: str, window: int) -> Iterator[WindowCounter]:
+        """識別子の窓カウンタを排他的に更新する（なければ [window, 0, 0] を作成）"""
+        key = (namespace, identifier)
+        shard = self._shards[hash(key) % _SHARD_COUNT]
+        with shard.lock:
+            counter = shard.counters.get(key)
+            if counter is None:
+                counter = shard.counters[key] = [window, 0, 0]
+            yield counter
+
+    def read_window_counter(self, namespace: str, identifier: str) -> Optional[WindowCounter]:
+        key = (namespace, identifier)
+        shard = self._shards[hash(key) % _SHARD_COUNT]
+        with shard.lock:
+            counter = shard.counters.get(key)
+            return list(counter) if counter is not None else None
+
+    def evict_windows(self, namespace: str, before_window: int):
+        """窓番号が before_window より前の窓カウンタを削除"""
+        for shard in self._shards:
+            with shard.lock:
+                expired = [
+                    key for key, counter in shard.counters.items()
+                    if key[0] == namespace and counter[0] < before_window
+                ]
+                for key in expired:
+                    del shard.counters[key]
+
+    def count_windows(self, namespace: str) -> int:
+        total = 0
+        for shard in self._shards:
+            with shard.lock:
+                total += sum(1 for key in shard.counters if key[0] == namespace)
+        return total
+
+    # ── 有効期限付きレコード ──
+    def put_record(self, namespace: str, key: str, value: str, ttl_seconds: float):
+        with self._records_lock:
+            self._records[(namespace, key)] = (time.time() + ttl_seconds, value)
+
+    def get_record(self, namespace: str, key: str) -> Optional[str]:
+        with self._records_lock:
+            record = self._records.get((namespace, key))
+        if record is None or record[0] <= time.time():
+            return None
+        return record[1]
+
+    def evict_records(self, namespace: str):
+        """期限切れのレコードを削除"""
+        now = time.time()
+        with self._records_lock:
+            expired = [key for key, record in self._records.items() if key[0] == namespace and record[0] <= now]
+            for key in expired:
+                del self._records[key]
+
+
+class SQLiteStateBackend:
+    """
+    ローカルの SQLite ファイルに保存する状態（同じホストの全プロセスで共有）
+    WAL モードで読み込みは書き込みと並行でき、窓カウンタの更新は BEGIN IMMEDIATE で直列化する。
+    """
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS state_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS state_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_windows ("
+            " namespace TEXT NOT NULL, identifier TEXT NOT NULL,"
+            " window INTEGER NOT NULL, current INTEGER NOT NULL, previous INTEGER NOT NULL,"
+            " PRIMARY KEY (namespace, identifier))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_windows_window ON rate_limit_windows (namespace, window)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state_records ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        # 状態ファイルの識別子（ファイルを作り直すと世代カウンタが 0 に戻るため data_version に含める）
+        conn.execute("INSERT OR IGNORE INTO state_meta (key, value) VALUES ('instance_id', ?)", (uuid.uuid4().hex[:12],))
+        self.instance_id = conn.execute("SELECT value FROM state_meta WHERE key = 'instance_id'").fetchone()[0]
+
+    def _connection(self) -> sqlite3.Connection:
+        """スレッドごとの接続（自動コミット。トランザクションは明示的に開始する）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=_SQLITE_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        """SQL を実行（ロック待ちのタイムアウトなどは StateBackendUnavailable）"""
+        try:
+            return self._connection().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            raise StateBackendUnavailable(f"{self.path}: {e}") from e
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """書き込みトランザクション（BEGIN IMMEDIATE で開始時に書き込みロックを取得）"""
+        conn = self._connection()
+        self._execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            self._execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    # ── カウンタ ──
+    def counter(self, name: str) -> int:
+        row = self._execute("SELECT value FROM state_counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def increment(self, name: str) -> int:
+        with self._transaction():
+            self._execute(
+                "INSERT INTO state_counters (name, value) VALUES (?, 1)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,),
+            )
+            return self._execute("SELECT value FROM state_counters WHERE name = ?", (name,)).fetchone()[0]
+
+    # ── レート制限の窓カウンタ ──
+    @contextmanager
+    def window_counter(self, namespace: str, identifier: str, window: int) -> Iterator[WindowCounter]:
+        with self._transaction():
+            row = self._execute(
+                "SELECT window, current, previous FROM rate_limit_windows WHERE namespace = ? AND identifier = ?",
+                (namespace, identifier),
+            ).fetchone()
+            counter = list(row) if row else [window, 0, 0]
+            original = list(counter)
+            yield counter
+            if counter != original or row is None:
+                self._execute(
+                    "INSERT INTO rate_limit_windows (namespace, identifier, window, current, previous)"
+                    " VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT(namespace, identifier) DO UPDATE SET"
+                    " window = excluded.window, current = excluded.current, previous = excluded.previous",
+                    (namespace, identifier, *counter),
+                )
+
+    def read_window_counter(self, namespace: str, identifier: str) -> Optional[WindowCounter]:
+        row = self._execute(
+            "SELECT window, current, previous FROM rate_limit_windows WHERE namespace = ? AND identifier = ?",
+            (namespace, identifier),
+        ).fetchone()
+        return list(row) if row else None
+
+    def evict_windows(self, namespace: str, before_window: int):
+        self._execute("DELETE FROM rate_limit_windows WHERE namespace = ? AND window < ?", (namespace, before_window))
+
+    def count_windows(self, namespace: str) -> int:
+        return self._execute("SELECT COUNT(*) FROM rate_limit_windows WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    # ── 有効期限付きレコード ──
+    def put_record(self, namespace: str, key: str, value: str, ttl_seconds: float):
+        self._execute(
+            "INSERT INTO state_records (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (namespace, key, value, time.time() + ttl_seconds),
+        )
+
+    def get_record(self, namespace: str, key: str) -> Optional[str]:
+        row = self._execute(
+            "SELECT value FROM state_records WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def evict_records(self, namespace: str):
+        self._execute("DELETE FROM state_records WHERE namespace = ? AND expires_at <= ?", (namespace, time.time()))
+
+
+def create_state_backend(name: str = STATE_BACKEND, sqlite_path: str = STATE_SQLITE_PATH):
+    """STATE_BACKEND の値から保存先を作成"""
+    if name == "memory":
+        return MemoryStateBackend()
+    if name == "sqlite":
+        print(f"[STATE] 共有状態の保存先: SQLite ({sqlite_path})")
+        return SQLiteStateBackend(sqlite_path)
+    raise ValueError(f"STATE_BACKEND は memory または sqlite を指定してください: {name}")
+
+
+# グローバル状態保存先（レート制限・キャッシュの世代カウンタ）
+state_backend = create_state_backend()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""同時接続数ごとのスループットのベンチマーク
+
+一時DBでアプリを uvicorn で起動し、並列クライアント数を変えながら一定時間リクエストを送り続けて
+1秒あたりの処理件数と応答時間（中央値・95パーセンタイル）を計測する。
+ルートハンドラーがイベントループをブロックしていると、並列数を増やしても処理件数が伸びない。
+
+シナリオ:
+    users     GET  /api/auth/admin/users      （DBの読み込み: 認証ユーザー + ユーザー一覧）
+    password  POST /api/admin/verify-password （bcrypt によるパスワード検証 + DB）
+    mixed     半数のクライアントが password、残りが users（重い処理と同時に実行した軽いリクエストの応答時間）
+
+使い方:
+    python bench_concurrency.py                          # 全シナリオを 1,2,4,8,16,32 並列で計測
+    python bench_concurrency.py --scenario users --clients 1,8,32 --duration 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_DB_DIR = tempfile.mkdtemp(prefix="bench_concurrency_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+os.environ.setdefault("SECRET_KEY", "bench-concurrency-secret-key-0123456789")
+
+import httpx
+import uvicorn
+
+from app.database import SessionLocal
+from app.main import app
+from app.models.admin import AdminUser
+from app.models.user import User
+from app.routes.auth import hash_password
+from app.utils.rate_limiter import api_limiter
+
+PASSWORD = "bench1234"
+
+
+def _create_users():
+    db = SessionLocal()
+    try:
+        db.add(User(
+            username="bench", password_hash=hash_password(PASSWORD), staff_id="bench",
+            staff_name="ベンチマーク", store_code="", role="admin", is_active=True,
+        ))
+        db.add(AdminUser(username="admin", password_hash=hash_password(PASSWORD)))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+REQUESTS = {
+    "users": ("GET", "/api/auth/admin/users", None),
+    "password": ("POST", "/api/admin/verify-password", {"password": PASSWORD}),
+}
+# シナリオ → クライアントごとのリクエスト（クライアント番号で循環）
+SCENARIOS = {
+    "users": ("users",),
+    "password": ("password",),
+    "mixed": ("password", "users"),
+}
+
+
+def run_level(base_url: str, token: str, scenario: str, clients: int, duration: float):
+    """
+    clients 並列で duration 秒リクエストを送り続ける
+    Returns: {リクエスト名: (1秒あたりの件数, 中央値ms, 95パーセンタイルms, エラー件数)}
+    """
+    headers = {"Authorization": f"Bearer {token}"}
+    started_at = time.perf_counter()
+    deadline = started_at + duration
+
+    def client_loop(index: int):
+        name = SCENARIOS[scenario][index % len(SCENARIOS[scenario])]
+        method, path, body = REQUESTS[name]
+        latencies, errors = [], 0
+        with httpx.Client(base_url=base_url, headers=headers, timeout=120) as client:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = client.request(method, path, json=body)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+        return name, latencies, errors
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(client_loop, range(clients)))
+    # 締め切り後に完了したリクエストも含めるため、実際の経過時間で割る
+    elapsed = time.perf_counter() - started_at
+
+    summary = {}
+    for name in dict.fromkeys(result[0] for result in results):
+        latencies = sorted(latency for result in results if result[0] == name for latency in result[1])
+        errors = sum(result[2] for result in results if result[0] == name)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        summary[name] = (len(latencies) / elapsed, statistics.median(latencies) * 1000, p95 * 1000, errors)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), action="append", help="計測するシナリオ（複数指定可）")
+    parser.add_argument("--clients", default="1,2,4,8,16,32", help="並列クライアント数（カンマ区切り）")
+    parser.add_argument("--duration", type=float, default=3.0, help="1段階あたりの計測秒数")
+    args = parser.parse_args()
+
+    _create_users()
+    # ベンチマーク中は API 全体のレート制限を外す
+    api_limiter.max_attempts = sys.maxsize
+    port = _free_port()
+    server = _start_server(port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    login = httpx.post(f"{base_url}/api/auth/login", json={"username": "bench", "password": PASSWORD})
+    login.raise_for_status()
+    token = login.json()["access_token"]
+
+    levels = [int(value) for value in args.clients.split(",")]
+    for scenario in args.scenario or list(SCENARIOS):
+        print(f"\n[{scenario}] " + ", ".join(" ".join(REQUESTS[name][:2]) for name in SCENARIOS[scenario]))
+        print(f"{'clients':>8} {'request':>10} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'errors':>8}")
+        for clients in levels:
+            for name, (throughput, p50, p95, errors) in run_level(base_url, token, scenario, clients, args.duration).items():
+                print(f"{clients:>8} {name:>10} {throughput:>10.1f} {p50:>10.1f} {p95:>10.1f} {errors:>8}")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""CSV読み込みプランのベンチマーク
+
+全カラムを型推論で読み込む従来の read_csv と、CSVReadPlan（必要なカラムのみ・
+分類名はカテゴリ型）で読み込んだ場合の、読み込み時間・解析時間（parse_sales_frame）・
+読み込み時のピークメモリ・DataFrame のメモリ使用量を比較する。
+
+使い方:
+    python bench_csv_parse.py                 # 生成したサンプルCSV（80カラム、20万行）で計測
+    python bench_csv_parse.py --rows 500000   # 行数を指定
+    python bench_csv_parse.py a.csv           # 実ファイルで計測
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from io import StringIO
+
+import pandas as pd
+
+from app.services.csv_service import CSVReadPlan, CSVService
+from sample_pos_csv import generate_csv_bytes
+
+
+def read_full(content_str: str) -> pd.DataFrame:
+    """従来の読み込み（全カラム・型推論）"""
+    df = pd.read_csv(StringIO(content_str))
+    df.columns = range(df.shape[1])
+    return df
+
+
+def read_planned(content_str: str) -> pd.DataFrame:
+    """CSVReadPlan による読み込み"""
+    text = StringIO(content_str)
+    plan = CSVReadPlan(pd.read_csv(text, nrows=0).columns.tolist())
+    text.seek(0)
+    return plan.label(plan.read_csv(text))
+
+
+def measure(label: str, reader, content_str: str, repeat: int):
+    # 処理時間（tracemalloc は Python 側の処理を大きく遅くするため計測を分ける）
+    read_times, parse_times = [], []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        df = reader(content_str)
+        read_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        transactions = CSVService.parse_sales_frame(df)
+        parse_times.append(time.perf_counter() - started)
+        del df, transactions
+
+    # 読み込み時のピークメモリと読み込み後の DataFrame のサイズ
+    gc.collect()
+    tracemalloc.start()
+    df = reader(content_str)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    frame_bytes = df.memory_usage(deep=True).sum()
+    del df
+
+    print(
+        f"{label:<10} read {min(read_times):6.2f}s  parse {min(parse_times):6.2f}s  "
+        f"read peak {peak / 2**20:7.1f}MB  DataFrame {frame_bytes / 2**20:7.1f}MB"
+    )
+    return min(read_times), min(parse_times), peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CSV読み込みプランのベンチマーク")
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.files:
+        inputs = [(path, open(path, "rb").read()) for path in args.files]
+    else:
+        inputs = [(f"sample {args.rows}行", generate_csv_bytes(args.rows, seed=9, messy=True))]
+
+    for label, file_bytes in inputs:
+        content_str = file_bytes.decode(CSVService.detect_encoding(file_bytes))
+        print(f"== {label} ({len(file_bytes) / 2**20:.1f}MB)")
+        full_read, full_parse, full_peak = measure("全カラム", read_full, content_str, args.repeat)
+        plan_read, plan_parse, plan_peak = measure("プラン", read_planned, content_str, args.repeat)
+        print(
+            f"   → 読み込み {full_read / plan_read:.2f}倍 / 読み込み+解析 "
+            f"{(full_read + full_parse) / (plan_read + plan_parse):.2f}倍 / "
+            f"ピークメモリ {plan_peak / full_peak:.0%}"
+        )
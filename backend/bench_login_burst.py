@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""ログイン集中時のAPI応答時間の負荷試験
+
+一時DBでアプリを uvicorn で起動し、軽いAPI（GET /api/auth/admin/users）を送り続けるクライアントの
+応答時間を「平常時」と「ログインを一斉に送っている間」で比較する。
+ログインの bcrypt は件数上限付きの専用プール（app/utils/password_hasher.py）で実行され、
+上限を超えたログインは 503 で即座に返るため、他のAPIの応答時間はほぼ変わらない。
+
+使い方:
+    python bench_login_burst.py                    # 200件のログインを100並列で送信
+    python bench_login_burst.py --logins 500 --burst-clients 200
+    python bench_login_burst.py --unbounded        # 比較用: 上限なし（API処理スレッドで bcrypt を実行するのと同等）
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from bench_concurrency import PASSWORD, _create_users, _free_port, _start_server
+from app.config import THREADPOOL_WORKERS
+from app.utils import password_hasher as password_hasher_module
+from app.utils.password_hasher import PasswordHasher
+from app.utils.rate_limiter import api_limiter, login_limiter
+
+PROBE_PATH = "/api/auth/admin/users"
+
+
+def _summary(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return "n=0"
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return (
+        f"n={len(latencies):>5}  p50={statistics.median(latencies) * 1000:>8.1f}ms  "
+        f"p95={p95 * 1000:>8.1f}ms  max={latencies[-1] * 1000:>8.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200, help="送信するログインの件数")
+    parser.add_argument("--burst-clients", type=int, default=100, help="ログインを同時に送るクライアント数")
+    parser.add_argument("--probe-clients", type=int, default=4, help="軽いAPIを送り続けるクライアント数")
+    parser.add_argument("--baseline", type=float, default=3.0, help="平常時の計測秒数")
+    parser.add_argument("--unbounded", action="store_true", help="パスワードハッシュの件数上限を外して比較する")
+    args = parser.parse_args()
+
+    if args.unbounded:
+        password_hasher_module.password_hasher = PasswordHasher(workers=THREADPOOL_WORKERS, queue_limit=sys.maxsize // 2)
+    hasher = password_hasher_module.password_hasher
+
+    _create_users()
+    # 負荷試験中はレート制限を外す
+    api_limiter.max_attempts = sys.maxsize
+    login_limiter.max_attempts = sys.maxsize
+    port = _free_port()
+    server = _start_server(port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    login = httpx.post(f"{base_url}/api/auth/login", json={"username": "bench", "password": PASSWORD})
+    login.raise_for_status()
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    phase = {"name": "baseline"}
+    probe_latencies = {"baseline": [], "burst": []}
+    stop = threading.Event()
+
+    def probe():
+        with httpx.Client(base_url=base_url, headers=headers, timeout=120) as client:
+            while not stop.is_set():
+                name = phase["name"]
+                started = time.perf_counter()
+                client.get(PROBE_PATH)
+                probe_latencies[name].append(time.perf_counter() - started)
+
+    probes = [threading.Thread(target=probe) for _ in range(args.probe_clients)]
+    for thread in probes:
+        thread.start()
+    time.sleep(args.baseline)
+
+    phase["name"] = "burst"
+    login_results = []
+
+    def send_login(_):
+        started = time.perf_counter()
+        response = httpx.post(
+            f"{base_url}/api/auth/login", json={"username": "bench", "password": PASSWORD}, timeout=300
+        )
+        return response.status_code, time.perf_counter() - started
+
+    burst_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.burst_clients) as pool:
+        login_results = list(pool.map(send_login, range(args.logins)))
+    burst_elapsed = time.perf_counter() - burst_started
+    stop.set()
+    for thread in probes:
+        thread.join()
+    server.should_exit = True
+
+    print(f"password hasher: workers={hasher.workers} queue_limit={'unbounded' if args.unbounded else hasher.queue_limit}")
+    print(f"\n[{PROBE_PATH}] ({args.probe_clients} clients)")
+    print(f"  baseline : {_summary(probe_latencies['baseline'])}")
+    print(f"  burst    : {_summary(probe_latencies['burst'])}")
+    print(f"\n[POST /api/auth/login] {args.logins} logins, {args.burst_clients} clients, {burst_elapsed:.1f}s")
+    for code in sorted({code for code, _ in login_results}):
+        print(f"  {code}: {_summary([latency for status, latency in login_results if status == code])}")
+
+
+if __name__ == "__main__":
+    main()
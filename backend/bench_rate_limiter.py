@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""レート制限のマイクロベンチマーク
+
+RateLimiter.is_allowed の1回あたりの処理時間を、スレッド数と識別子の種類を変えて計測する。
+比較用に、以前の実装（識別子ごとに datetime のリストを持ち、1つのロックで毎回リストを作り直す）も計測する。
+sliding-window は状態の保存先（STATE_BACKEND）ごとに計測する（sqlite は一時ファイル）。
+あわせて、異なる識別子を大量に送った後の保持件数とメモリ使用量、しばらくアクセスがなかった後の保持件数を比較する。
+
+使い方:
+    python bench_rate_limiter.py
+    python bench_rate_limiter.py --calls 200000 --threads 1,4,16
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from app.utils.rate_limiter import RateLimiter
+from app.utils.state_backend import MemoryStateBackend, SQLiteStateBackend
+
+
+class ListRateLimiter:
+    """以前の実装（比較用）"""
+
+    def __init__(self, max_attempts: int = 5, window_seconds: int = 300):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self.attempts = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def is_allowed(self, identifier: str) -> bool:
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            cutoff_time = now - timedelta(seconds=self.window_seconds)
+            self.attempts[identifier] = [
+                attempt_time for attempt_time in self.attempts[identifier]
+                if attempt_time > cutoff_time
+            ]
+            if len(self.attempts[identifier]) >= self.max_attempts:
+                return False
+            self.attempts[identifier].append(now)
+            return True
+
+    def tracked_identifiers(self) -> int:
+        return len(self.attempts)
+
+
+_STATE_DIR = tempfile.mkdtemp(prefix="bench_rate_limiter_")
+
+
+def _sqlite_limiter(**kwargs):
+    path = os.path.join(_STATE_DIR, f"state-{len(os.listdir(_STATE_DIR))}.db")
+    return RateLimiter(backend=SQLiteStateBackend(path), **kwargs)
+
+
+IMPLEMENTATIONS = {
+    "list (以前)": ListRateLimiter,
+    "sliding (memory)": lambda **kwargs: RateLimiter(backend=MemoryStateBackend(), **kwargs),
+    "sliding (sqlite)": _sqlite_limiter,
+}
+# 識別子の種類: 名前 → (スレッド番号, 呼び出し番号) から識別子を作る関数
+KEY_PATTERNS = {
+    "1 key": lambda thread, i: "10.0.0.1",
+    "1k keys": lambda thread, i: f"10.0.{thread}.{i % 1000}",
+}
+
+
+def measure(factory, threads: int, calls: int, key) -> float:
+    """threads 並列で合計 calls 回 is_allowed を呼び、1回あたりの平均時間（マイクロ秒）を返す"""
+    # API 全体と同じ設定（1分間に100回）。上限に達しても判定の処理は同じ
+    limiter = factory(max_attempts=100, window_seconds=60)
+    per_thread = calls // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index: int):
+        barrier.wait()
+        for i in range(per_thread):
+            limiter.is_allowed(key(index, i))
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - started) / (per_thread * threads) * 1_000_000
+
+
+def measure_memory(factory, identifiers: int):
+    """
+    異なる識別子で1回ずつ呼んだ後の保持件数・確保済みメモリ（MB）と、
+    2窓分待ってから別の識別子で呼んだ後の保持件数（アクセスのない識別子が削除されるか）
+    sqlite はファイルに保存するため、メモリは接続が確保した分のみ
+    """
+    tracemalloc.start()
+    limiter = factory(max_attempts=100, window_seconds=1)
+    for i in range(identifiers):
+        limiter.is_allowed(f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}")
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tracked = limiter.tracked_identifiers()
+
+    time.sleep(2.1)
+    for i in range(256):
+        limiter.is_allowed(f"192.168.0.{i}")
+    return tracked, current / 1024 / 1024, limiter.tracked_identifiers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100_000, help="1回の計測での呼び出し回数")
+    parser.add_argument("--threads", default="1,4,16", help="スレッド数（カンマ区切り）")
+    parser.add_argument("--identifiers", type=int, default=100_000, help="メモリ計測で使う識別子の数")
+    args = parser.parse_args()
+
+    print(f"{'implementation':>16} {'keys':>8} {'threads':>8} {'us/call':>10}")
+    for name, factory in IMPLEMENTATIONS.items():
+        for pattern, key in KEY_PATTERNS.items():
+            for threads in [int(value) for value in args.threads.split(",")]:
+                print(f"{name:>16} {pattern:>8} {threads:>8} {measure(factory, threads, args.calls, key):>10.2f}")
+
+    print(f"\n{'implementation':>16} {'identifiers':>12} {'tracked':>10} {'memory MB':>10} {'after idle':>11}")
+    for name, factory in IMPLEMENTATIONS.items():
+        tracked, memory, after_idle = measure_memory(factory, args.identifiers)
+        print(f"{name:>16} {args.identifiers:>12} {tracked:>10} {memory:>10.1f} {after_idle:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+"""CSV解析のパリティ検証スクリプト
+
+CSVService.parse_sales_csv（列単位の一括変換）の出力が、従来の
+df.iterrows() による行単位パーサーの出力と完全に一致することを確認する。
+アップロード時のチャンク読み込み（CSVService.iter_csv_frames）の出力も
+チャンクサイズによらず一括読み込みと一致することを確認する。
+日時の一括変換（_parse_datetime_column）も1件ずつの strptime と一致することを確認する。
+数字のみのコード（担当者ID・商品コードなど）は、後半のチャンクに空欄があっても
+元の文字列のまま（"5555.0" にならず、先頭の 0 も保持）読み込まれることを確認する。
+
+使い方:
+    python check_csv_parity.py              # 生成したサンプルCSVで検証
+    python check_csv_parity.py a.csv b.csv  # 実ファイルで検証
+"""
+import csv
+import random
+import sys
+import tempfile
+from datetime import datetime
+from io import StringIO
+
+import chardet
+import pandas as pd
+
+from app.schemas import SalesTransactionCreate
+from app.services.csv_service import CSVService, MNPJudge, _parse_datetime, _parse_datetime_column
+from sample_pos_csv import generate_csv_bytes, generate_rows
+
+# 文字列のまま読み込むカラムの位置（統括拠点コード・名、売上日付・時刻、伝票番号、商品コード・名、担当者ID・姓・名、契約区分）
+TEXT_POSITIONS = [1, 2, 4, 5, 7, 16, 17, 57, 58, 59, 64]
+
+
+def reference_parse(file_bytes: bytes):
+    """従来の行単位パーサー（比較基準）"""
+    encoding = (chardet.detect(file_bytes).get('encoding') or 'utf-8').lower()
+    try:
+        content_str = file_bytes.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        content_str = None
+        for enc in ['utf-8', 'shift_jis', 'cp932', 'euc_jp', 'latin-1']:
+            try:
+                content_str = file_bytes.decode(enc)
+                break
+            except UnicodeDecodeError:
+                continue
+    header = pd.read_csv(StringIO(content_str), nrows=0).columns
+    df = pd.read_csv(StringIO(content_str), dtype={header[i]: str for i in TEXT_POSITIONS if i < len(header)})
+
+    grouped_by_ticket = {}
+    for idx, row in df.iterrows():
+        ticket_num = str(row.iloc[7]).strip() if len(row) > 7 else f"UNKNOWN_{idx}"
+        grouped_by_ticket.setdefault(ticket_num, []).append({
+            'large_category': str(row.iloc[21]).strip() if len(row) > 21 else '',
+            'small_category': str(row.iloc[23]).strip() if len(row) > 23 else '',
+            'procedure_name': str(row.iloc[48]).strip() if len(row) > 48 and pd.notna(row.iloc[48]) else '',
+            'product_name': str(row.iloc[17]).strip() if len(row) > 17 else '',
+            'お客様契約区分名': str(row.iloc[64]).strip() if len(row) > 64 else '',
+        })
+    ticket_service_categories = {
+        ticket_num: MNPJudge.judge_service_category(line_data_list)
+        for ticket_num, line_data_list in grouped_by_ticket.items()
+    }
+
+    def to_number(value, convert, default):
+        try:
+            return convert(value) if pd.notna(value) else default
+        except Exception:
+            return default
+
+    transactions = []
+    for idx, row in df.iterrows():
+        date_str = str(row.iloc[4]).strip()
+        time_str = str(row.iloc[5]).strip() if len(row) > 5 else "00:00:00"
+        transaction_date = None
+        for fmt in ["%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d", "%Y%m%d %H:%M:%S"]:
+            try:
+                transaction_date = datetime.strptime(f"{date_str} {time_str}", fmt)
+                break
+            except ValueError:
+                continue
+        if transaction_date is None:
+            continue
+
+        staff_first = str(row.iloc[58]).strip() if len(row) > 58 else ""
+        staff_last = str(row.iloc[59]).strip() if len(row) > 59 else ""
+        ticket_num = str(row.iloc[7]).strip() if len(row) > 7 else ""
+        service_category = 'その他'
+        if ticket_num in grouped_by_ticket:
+            service_category = ticket_service_categories[ticket_num][len(grouped_by_ticket[ticket_num]) - 1]
+
+        transactions.append(SalesTransactionCreate(
+            transaction_date=transaction_date,
+            store_code=str(row.iloc[1]).strip() if len(row) > 1 else "",
+            product_code=str(row.iloc[16]).strip() if len(row) > 16 else "",
+            product_name=str(row.iloc[17]).strip() if len(row) > 17 else "",
+            ticket_number=ticket_num,
+            large_category=str(row.iloc[21]).strip() if len(row) > 21 else "",
+            small_category=str(row.iloc[23]).strip() if len(row) > 23 else "",
+            procedure_name=str(row.iloc[48]).strip() if len(row) > 48 and pd.notna(row.iloc[48]) else "",
+            procedure_name_2=str(row.iloc[50]).strip() if len(row) > 50 and pd.notna(row.iloc[50]) else "",
+            quantity=to_number(row.iloc[30], int, 1) if len(row) > 30 else 1,
+            unit_price=to_number(row.iloc[31], float, 0) if len(row) > 31 else 0,
+            total_price=to_number(row.iloc[32], float, 0) if len(row) > 32 else 0,
+            gross_profit=to_number(row.iloc[73], float, 0) if len(row) > 73 else 0,
+            staff_id=str(row.iloc[57]).strip() if len(row) > 57 else "",
+            staff_name=f"{staff_first}{staff_last}".strip(),
+            service_category=service_category,
+        ))
+    return transactions
+
+
+def check(label: str, file_bytes: bytes) -> bool:
+    expected = [t.model_dump() for t in reference_parse(file_bytes)]
+    actual = [t.model_dump() for t in CSVService.parse_sales_csv(file_bytes)]
+    if expected == actual:
+        print(f"[OK] {label}: {len(actual)}件一致")
+        return True
+
+    print(f"[NG] {label}: 期待 {len(expected)}件 / 実際 {len(actual)}件")
+    for i, (e, a) in enumerate(zip(expected, actual)):
+        if e != a:
+            diff = {k: (e[k], a[k]) for k in e if e[k] != a[k]}
+            print(f"     最初の不一致 #{i}: {diff}")
+            break
+    return False
+
+
+def check_streaming(label: str, file_bytes: bytes, chunk_rows: int) -> bool:
+    """チャンク単位の読み込み結果が一括読み込みの結果と一致するか確認"""
+    expected = [t.model_dump() for t in CSVService.parse_sales_csv(file_bytes)]
+    actual = []
+    with tempfile.TemporaryFile() as spool:
+        spool.write(file_bytes)
+        encoding = CSVService.detect_stream_encoding(spool)
+        for frame in CSVService.iter_csv_frames(spool, encoding, chunk_rows):
+            actual += [t.model_dump() for t in CSVService.parse_sales_frame(frame)]
+    if expected == actual:
+        print(f"[OK] {label} (chunk={chunk_rows}): {len(actual)}件一致")
+        return True
+    print(f"[NG] {label} (chunk={chunk_rows}): 期待 {len(expected)}件 / 実際 {len(actual)}件")
+    return False
+
+
+def check_mnp_judge(label: str, rows: int = 20000, seed: int = 0) -> bool:
+    """MNPJudge.judge_frame の行ごとの結果が judge_service_category と一致するか確認"""
+    rnd = random.Random(seed)
+    values = {
+        'large_category': ['移動機', 'SIM', 'au+1 Collection', 'サービス', ''],
+        'small_category': ['iPhone', 'スマートフォン', 'タブレット', 'au-SIM', 'eSIM', 'UQ-SIM', 'UQ-SIM2', '店頭設定サポート', ''],
+        'procedure_name': ['', 'MNP', '番号移行', '機種変更', 'MNP 機種変更', '新規'],
+        'product_name': ['Galaxy au', 'AQUOS uq', 'UQ mobile', 'iPhone', 'ケース', 'ＡＵ'],
+        'お客様契約区分名': ['au', 'UQ', '', 'nan'],
+    }
+    frame = pd.DataFrame([
+        dict(ticket_number=f"T{rnd.randint(0, rows // 3)}", **{k: rnd.choice(v) for k, v in values.items()})
+        for _ in range(rows)
+    ])
+    actual = MNPJudge.judge_frame(frame)
+
+    for ticket_num, group in frame.groupby('ticket_number', sort=False):
+        expected = MNPJudge.judge_service_category(group.to_dict('records'))
+        for i, idx in enumerate(group.index):
+            if expected[i] != actual[idx]:
+                print(f"[NG] {label}: 伝票 {ticket_num} 行 {idx}: 期待 {expected[i]!r} / 実際 {actual[idx]!r}")
+                return False
+    print(f"[OK] {label}: {rows}行一致")
+    return True
+
+
+def check_datetime_column(label: str, trials: int = 300, seed: int = 0) -> bool:
+    """_parse_datetime_column の結果が1件ずつの _parse_datetime と一致するか確認"""
+    rnd = random.Random(seed)
+    candidates = [
+        "2024/01/05 10:00:00", "2024/1/5 9:00:00", "2024/01/05 10:00", "2024/1/5 9:5", "20240105 10:00:00",
+        "2024/01/05 nan", "nan 10:00:00", "不明 10:00:00", "2024/01/05 10:00:00.5", "2024/01/05  10:00:00",
+        " 2024/01/05 10:00:00", "2024-01-05 10:00:00", "2024/01/05T10:00:00", "2024/01/05 10:00:00+09:00",
+        "0001/01/01 00:00:00", "9999/12/31 23:59:59", "1677/01/01 00:00:00", "2262/05/01 00:00:00",
+        "2024/02/30 10:00:00", "2024/13/01 00:00:00", "2024/01/05 24:00:00", "2024/01/05 10:60:00",
+        "2024/01/05 10:00:60", "2024/01/05 10:00:61", "20240105 10:00:60", "20240105 1:2:3", "2024/01/05 ",
+        "2024/01/05 10", "20240105 10:00", "２０２４/01/05 10:00:00", "2024/01/05 1:00:00 PM",
+    ]
+    for _ in range(trials):
+        values = [rnd.choice(candidates) for _ in range(rnd.randint(0, 200))]
+        actual = _parse_datetime_column(values)
+        for value, result in zip(values, actual):
+            expected = _parse_datetime(value)
+            if result != expected or type(result) is not type(expected):
+                print(f"[NG] {label}: {value!r}: 期待 {expected!r} / 実際 {result!r}")
+                return False
+    print(f"[OK] {label}: {trials}回一致")
+    return True
+
+
+def numeric_code_rows(row_count: int = 3000, seed: int = 5):
+    """コードを数字のみにし、後半の行で担当者ID・商品コード・伝票番号・統括拠点コードを空欄にしたサンプル"""
+    rows = generate_rows(row_count, seed=seed)
+    for row in rows[1:]:
+        row[1] = row[1][1:]                                   # "S002078" → "002078"（先頭の 0 を含む）
+        row[7] = row[7][1:]                                   # "T00000012" → "00000012"
+        row[16] = row[16][1:]                                 # "P01234" → "01234"
+        row[57] = str(5550 + int(row[57][1:]))                # "U001" → "5551"
+    for position, line in ((57, row_count - 10), (16, row_count - 20), (7, row_count - 30), (1, row_count - 40)):
+        rows[line][position] = ""
+    return rows
+
+
+def check_numeric_codes(label: str, rows) -> bool:
+    """数字のみのコードがチャンク分割によらず元の文字列のまま読み込まれるか確認"""
+    buffer = StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    file_bytes = buffer.getvalue().encode()
+    results = [check(label, file_bytes)]
+    results += [check_streaming(label, file_bytes, chunk_rows) for chunk_rows in (97, 1000)]
+
+    parsed = CSVService.parse_sales_csv(file_bytes)
+    for field, position in (("staff_id", 57), ("product_code", 16), ("ticket_number", 7), ("store_code", 1)):
+        expected = {row[position] or "nan" for row in rows[1:]}
+        actual = {getattr(t, field) for t in parsed}
+        if actual != expected:
+            print(f"[NG] {label}: {field} 期待外の値 {sorted(actual - expected)[:5]}")
+            results.append(False)
+    if all(results):
+        print(f"[OK] {label}: コードの文字列表現が一致")
+    return all(results)
+
+
+def sample_files():
+    narrow = "\n".join(",".join(line.split(",")[:40]) for line in generate_csv_bytes(200, seed=3).decode().splitlines())
+    return [
+        ("sample utf-8", generate_csv_bytes(2000, seed=1)),
+        ("sample cp932", generate_csv_bytes(2000, encoding="cp932", seed=2)),
+        ("sample messy", generate_csv_bytes(5000, seed=4, messy=True)),
+        ("sample narrow (40 columns)", narrow.encode()),
+    ]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        files = [(path, open(path, "rb").read()) for path in sys.argv[1:]]
+    else:
+        files = sample_files()
+    results = [check(label, content) for label, content in files]
+    results += [
+        check_streaming(label, content, chunk_rows)
+        for label, content in files
+        for chunk_rows in (97, 1000)
+    ]
+    if len(sys.argv) == 1:
+        results.append(check_numeric_codes("sample numeric codes (後半に空欄)", numeric_code_rows()))
+    results.append(check_mnp_judge("MNPJudge.judge_frame"))
+    results.append(check_datetime_column("_parse_datetime_column"))
+    sys.exit(0 if all(results) else 1)
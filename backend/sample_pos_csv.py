@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""POS売上明細CSVのサンプルを生成するスクリプト
+
+パリティ検証・ベンチマーク用に、本番のPOSエクスポートと同じカラム配置
+（80カラム、実績担当者・粗利などの位置が一致）のCSVを生成する。
+
+使い方:
+    python sample_pos_csv.py 出力先.csv [行数] [--encoding cp932] [--messy]
+"""
+import argparse
+import csv
+import random
+import zlib
+from datetime import datetime, timedelta
+from io import StringIO
+
+COLUMN_COUNT = 80
+
+_STORES = [("S002001", "テスト店舗1"), ("S002078", "テスト店舗2"), ("S003050", "テスト店舗3")]
+_STAFF = [("U001", "田中", "太郎"), ("U002", "佐藤", "花子"), ("U003", "鈴木", "一郎"), ("U004", "高橋", "")]
+
+# (大分類, 中分類, 商品名, 単価, 粗利)
+_PRODUCTS = [
+    ("移動機", "iPhone", "iPhone 15 128GB", 124800, 0),
+    ("移動機", "スマートフォン", "Galaxy S24 au", 98000, 0),
+    ("移動機", "スマートフォン", "UQ mobile AQUOS wish", 32000, 0),
+    ("移動機", "タブレット", "iPad 10th", 68800, 0),
+    ("SIM", "au-SIM", "au ICカード", 0, 0),
+    ("SIM", "eSIM", "au eSIM", 0, 0),
+    ("SIM", "UQ-SIM", "UQ ICカード", 0, 0),
+    ("SIM", "UQ-SIM2", "UQ ICカード(2)", 0, 0),
+    ("SIM", "その他SIM", "povo SIM", 0, 0),
+    ("au+1 Collection", "ケース", "スマホケース", 3980, 1592),
+    ("au+1 Collection", "充電器", "USB-C 充電器", 2980, 1192),
+    ("au+1 Collection", "保護フィルム", "ガラスフィルム", 2480, 1488),
+    ("サービス", "店頭設定サポート", "データ移行サポート", 2200, 2200),
+    ("サービス", "クレジットカード", "au PAY カード", 0, 0),
+]
+_PROCEDURES = ["", "", "", "MNP", "MNP(3G)", "番号移行", "機種変更", "新規"]
+_CONTRACTS = ["au", "au", "UQ", ""]
+
+
+def _row(line_no, ticket, store, when, staff, product, procedure, contract, messy, rnd):
+    row = [""] * COLUMN_COUNT
+    large, small, name, price, profit = product
+    quantity = rnd.choice([1, 1, 1, 2])
+
+    row[0] = str(line_no)
+    row[1], row[2] = store
+    row[4] = when.strftime("%Y/%m/%d")
+    row[5] = when.strftime("%H:%M:%S")
+    row[7] = ticket
+    row[16] = f"P{zlib.crc32(name.encode()) % 100000:05d}"
+    row[17] = name
+    row[21] = large
+    row[23] = small
+    row[30] = str(quantity)
+    row[31] = str(price)
+    row[32] = str(price * quantity)
+    row[48] = procedure
+    row[50] = rnd.choice(["", "", "割賦"])
+    row[57], row[58], row[59] = staff
+    row[64] = contract
+    row[73] = str(profit * quantity)
+
+    if messy:
+        roll = rnd.random()
+        if roll < 0.01:
+            row[4] = "不明"                      # 日付パース失敗
+        elif roll < 0.02:
+            row[5] = when.strftime("%H:%M")      # 秒なし
+        elif roll < 0.03:
+            row[4] = when.strftime("%Y%m%d")     # 区切りなし日付
+        elif roll < 0.04:
+            row[30] = "1.0"                      # int() では変換できない数量
+        elif roll < 0.05:
+            row[31] = "1,000"                    # float() では変換できない単価
+        elif roll < 0.06:
+            row[73] = ""                         # 粗利欠損
+        elif roll < 0.07:
+            row[17] = f"  {name}  "              # 前後の空白
+        elif roll < 0.08:
+            row[58], row[59] = "", ""            # 担当者名なし
+    return row
+
+
+def generate_rows(row_count: int, seed: int = 0, messy: bool = False):
+    """ヘッダー行とデータ行のリストを返す（伝票ごとに1〜4行）"""
+    rnd = random.Random(seed)
+    header = [f"col{i}" for i in range(COLUMN_COUNT)]
+    header[1], header[2], header[4], header[5], header[7] = "統括拠点コード", "統括拠点名", "売上日付", "売上時刻", "売上伝票番号"
+    rows = [header]
+
+    base = datetime(2024, 1, 1, 10, 0, 0)
+    ticket_no = 0
+    while len(rows) - 1 < row_count:
+        ticket_no += 1
+        ticket = f"T{ticket_no:08d}"
+        store = rnd.choice(_STORES)
+        staff = rnd.choice(_STAFF)
+        when = base + timedelta(minutes=7 * ticket_no, seconds=rnd.randint(0, 59))
+        procedure = rnd.choice(_PROCEDURES)
+        contract = rnd.choice(_CONTRACTS)
+        for _ in range(rnd.randint(1, 4)):
+            if len(rows) - 1 >= row_count:
+                break
+            product = rnd.choice(_PRODUCTS)
+            rows.append(_row(len(rows), ticket, store, when, staff, product, procedure, contract, messy, rnd))
+
+    if messy and len(rows) > 10:
+        # 同一伝票の行が離れて出現するケース
+        rows.append(list(rows[2]))
+    return rows
+
+
+def generate_csv_bytes(row_count: int, encoding: str = "utf-8", seed: int = 0, messy: bool = False) -> bytes:
+    """サンプルCSVをバイト列で返す"""
+    buffer = StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(generate_rows(row_count, seed=seed, messy=messy))
+    return buffer.getvalue().encode(encoding)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="POS売上明細CSVのサンプルを生成")
+    parser.add_argument("output")
+    parser.add_argument("rows", nargs="?", type=int, default=1000)
+    parser.add_argument("--encoding", default="utf-8")
+    parser.add_argument("--messy", action="store_true", help="不正な日付・数値などを混入させる")
+    args = parser.parse_args()
+
+    with open(args.output, "wb") as f:
+        f.write(generate_csv_bytes(args.rows, encoding=args.encoding, messy=args.messy))
+    print(f"{args.output} に {args.rows} 行を書き出しました（{args.encoding}）")
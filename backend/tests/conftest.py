@@ -0,0 +1,83 @@
+"""
+API テストの共通設定
+app を読み込む前に一時ディレクトリの売上DB・共有状態を指定する（開発用の sales.db は変更しない）
+実行: backend ディレクトリで python -m pytest -q
+"""
+
+import os
+import sys
+import tempfile
+
+_TEST_DIR = tempfile.mkdtemp(prefix="sales-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DIR, 'sales.db')}"
+os.environ["STATE_BACKEND"] = "memory"
+os.environ["DEBUG"] = "false"
+os.environ.setdefault("SECRET_KEY", "test-secret-key-for-pytest-only-0123456789")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+
+from app.main import app
+from app.database import SessionLocal
+from app.models.user import User
+from app.utils.rate_limiter import api_limiter
+
+TEST_PASSWORD = "pass1234"
+
+
+@pytest.fixture(scope="session")
+def client():
+    """テスト用クライアント（admin と一般ユーザー staff のパスワードを TEST_PASSWORD に設定）"""
+    db = SessionLocal()
+    try:
+        admin = db.query(User).filter(User.username == "admin").first()
+        admin.password_hash = CryptContext(schemes=["bcrypt"]).hash(TEST_PASSWORD)
+        db.add(User(
+            username="staff", password_hash=admin.password_hash, staff_id="T0001", staff_name="テスト",
+            store_code="S002078", role="user", is_active=True,
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+    # テスト中は API 全体のレート制限にかからないようにする
+    api_limiter.max_attempts = 10**9
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def _login(client, username: str) -> dict:
+    response = client.post("/api/auth/login", json={"username": username, "password": TEST_PASSWORD})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    return _login(client, "admin")
+
+
+@pytest.fixture(scope="session")
+def staff_headers(client):
+    return _login(client, "staff")
+
+
+@pytest.fixture
+def clean_sales(client, admin_headers):
+    """売上データ・日別集計を空にしてからテストを実行"""
+    response = client.post("/api/admin/clear-data", headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+
+@pytest.fixture
+def upload(client, admin_headers):
+    """CSV をアップロードして (ステータス, JSON) を返す"""
+    def _upload(content: bytes, headers: dict = None, filename: str = "sales.csv"):
+        response = client.post(
+            "/api/upload", files={"file": (filename, content, "text/csv")}, headers=headers or admin_headers
+        )
+        return response.status_code, response.json()
+    return _upload
+
@@ -0,0 +1,52 @@
+"""集計APIの ETag / If-None-Match（304 Not Modified）"""
+
+from sample_pos_csv import generate_csv_bytes
+
+SUMMARY_URL = "/api/summary/daily"
+
+
+def test_matching_etag_returns_304(clean_sales, client, admin_headers, upload):
+    upload(generate_csv_bytes(40, seed=21))
+    first = client.get(SUMMARY_URL, headers=admin_headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    cached = client.get(SUMMARY_URL, headers={**admin_headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    # 弱い比較・複数指定
+    weak = client.get(SUMMARY_URL, headers={**admin_headers, "If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+
+
+def test_etag_depends_on_query_parameters(clean_sales, client, admin_headers, upload):
+    upload(generate_csv_bytes(40, seed=22))
+    etag = client.get(SUMMARY_URL, headers=admin_headers).headers["etag"]
+
+    filtered = client.get(
+        SUMMARY_URL, params={"store_code": "S002001"}, headers={**admin_headers, "If-None-Match": etag}
+    )
+    assert filtered.status_code == 200
+    assert filtered.headers["etag"] != etag
+
+
+def test_upload_changes_etag(clean_sales, client, admin_headers, upload):
+    upload(generate_csv_bytes(40, seed=23))
+    before = client.get(SUMMARY_URL, headers=admin_headers)
+    etag = before.headers["etag"]
+
+    _, result = upload(generate_csv_bytes(40, seed=24))
+    assert result["count"] > 0
+    after = client.get(SUMMARY_URL, headers={**admin_headers, "If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["etag"] != etag
+    assert after.json() != before.json()
+
+
+def test_unauthenticated_request_is_not_304(client, admin_headers):
+    etag = client.get(SUMMARY_URL, headers=admin_headers).headers["etag"]
+    response = client.get(SUMMARY_URL, headers={"If-None-Match": etag})
+    assert response.status_code in (401, 403)
@@ -0,0 +1,48 @@
+"""スライディングウィンドウのレート制限と、状態保存先を読み書きできない場合の動作"""
+
+from contextlib import contextmanager
+
+from app.utils.rate_limiter import RateLimiter
+from app.utils.state_backend import MemoryStateBackend, StateBackendUnavailable
+
+
+class LockedStateBackend(MemoryStateBackend):
+    """sqlite のロック待ちがタイムアウトした状態（読み書きが StateBackendUnavailable）"""
+
+    @contextmanager
+    def window_counter(self, namespace, identifier, window):
+        raise StateBackendUnavailable("database is locked")
+        yield
+
+    def read_window_counter(self, namespace, identifier):
+        raise StateBackendUnavailable("database is locked")
+
+    def evict_windows(self, namespace, before_window):
+        raise StateBackendUnavailable("database is locked")
+
+
+def test_blocks_after_max_attempts():
+    limiter = RateLimiter(max_attempts=3, window_seconds=60, backend=MemoryStateBackend())
+    assert [limiter.is_allowed("10.0.0.1") for _ in range(4)] == [True, True, True, False]
+    assert limiter.get_remaining_time("10.0.0.1") > 0
+    # 別の識別子は影響を受けない
+    assert limiter.is_allowed("10.0.0.2")
+
+
+def test_fail_open_limiter_allows_when_backend_is_locked():
+    limiter = RateLimiter(max_attempts=1, window_seconds=60, backend=LockedStateBackend())
+    assert all(limiter.is_allowed("10.0.0.1") for _ in range(3))
+
+
+def test_fail_closed_limiter_rejects_when_backend_is_locked():
+    limiter = RateLimiter(max_attempts=100, window_seconds=60, backend=LockedStateBackend(), fail_open=False)
+    assert not limiter.is_allowed("10.0.0.1")
+    assert limiter.get_remaining_time("10.0.0.1") > 0
+
+
+def test_login_is_rejected_when_backend_is_locked(client, monkeypatch):
+    from app.utils.rate_limiter import login_limiter
+
+    monkeypatch.setattr(login_limiter, "backend", LockedStateBackend())
+    response = client.post("/api/auth/login", json={"username": "admin", "password": "wrong"})
+    assert response.status_code == 429
@@ -0,0 +1,59 @@
+"""日別集計（sales_daily_rollup）と生データの整合性"""
+
+from app.database import SessionLocal
+from app.models.sales import SalesTransaction
+from sample_pos_csv import generate_csv_bytes
+
+
+def _assert_rollup_consistent(client, admin_headers):
+    response = client.get("/api/admin/rollup/check", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["consistent"], result["samples"]
+    return result
+
+
+def test_rollup_matches_raw_rows_after_uploads(clean_sales, client, admin_headers, upload):
+    upload(generate_csv_bytes(80, seed=3))
+    first = _assert_rollup_consistent(client, admin_headers)
+    assert first["rollup_rows"] > 0
+
+    # 重複行（集計に加算されない）と新規行の混在
+    upload(generate_csv_bytes(120, seed=3))
+    upload(generate_csv_bytes(40, seed=4, messy=True))
+    second = _assert_rollup_consistent(client, admin_headers)
+    assert second["rollup_rows"] >= first["rollup_rows"]
+
+    client.post("/api/admin/clear-data", headers=admin_headers)
+    cleared = _assert_rollup_consistent(client, admin_headers)
+    assert cleared["rollup_rows"] == 0
+
+
+def test_daily_summary_matches_raw_rows(clean_sales, client, admin_headers, upload):
+    upload(generate_csv_bytes(100, seed=5))
+    upload(generate_csv_bytes(150, seed=5))
+
+    db = SessionLocal()
+    try:
+        rows = db.query(SalesTransaction).all()
+    finally:
+        db.close()
+    # 生データを (日付, 店舗) ごとに集計した [売上, 粗利, 行数]
+    expected = {}
+    for row in rows:
+        totals = expected.setdefault((row.transaction_date.date().isoformat(), row.store_code), [0.0, 0.0, 0])
+        totals[0] += row.total_price or 0
+        totals[1] += row.gross_profit or 0
+        totals[2] += 1
+
+    response = client.get("/api/summary/daily", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    actual = {
+        (entry["date"], entry["store_code"]): [entry["total_sales"], entry["gross_profit"], entry["transaction_count"]]
+        for entry in response.json()
+    }
+    assert actual.keys() == expected.keys()
+    for key, (total_sales, gross_profit, count) in expected.items():
+        assert abs(actual[key][0] - total_sales) < 0.01
+        assert abs(actual[key][1] - gross_profit) < 0.01
+        assert actual[key][2] == count
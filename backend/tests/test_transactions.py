@@ -0,0 +1,86 @@
+"""取引一覧 /api/transactions の cursor ページング"""
+
+from sqlalchemy import update
+
+from app.database import SessionLocal
+from app.models.sales import SalesTransaction
+from sample_pos_csv import generate_csv_bytes
+
+
+def _expected_ids(store_code: str = None):
+    """(transaction_date（NULL は先頭）, id) の昇順の id"""
+    db = SessionLocal()
+    try:
+        query = db.query(SalesTransaction.transaction_date, SalesTransaction.id)
+        if store_code:
+            query = query.filter(SalesTransaction.store_code == store_code)
+        rows = query.all()
+    finally:
+        db.close()
+    rows.sort(key=lambda row: (row.transaction_date is not None, row.transaction_date or 0, row.id))
+    return [row.id for row in rows]
+
+
+def _page_through(client, headers, limit: int):
+    ids, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/transactions", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        ids.extend(row["id"] for row in response.json())
+        pages += 1
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return ids, pages
+
+
+def _set_dates(ids, value):
+    db = SessionLocal()
+    try:
+        db.execute(update(SalesTransaction).where(SalesTransaction.id.in_(ids)).values(transaction_date=value))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_cursor_pages_cover_tied_and_null_dates(clean_sales, client, admin_headers, upload):
+    upload(generate_csv_bytes(80, seed=11))
+    all_ids = _expected_ids()
+    # 日付が解釈できなかった行（NULL）と、ページ境界をまたぐ同時刻の行を作る
+    _set_dates(all_ids[5:14], None)
+    tied = all_ids[20:35]
+    db = SessionLocal()
+    try:
+        tied_date = db.get(SalesTransaction, tied[0]).transaction_date
+    finally:
+        db.close()
+    _set_dates(tied, tied_date)
+
+    expected = _expected_ids()
+    for limit in (1, 4, 7, 100):
+        ids, pages = _page_through(client, admin_headers, limit)
+        assert ids == expected
+        assert pages == max(1, -(-len(expected) // limit))
+
+
+def test_cursor_pages_only_null_dates(clean_sales, client, admin_headers, upload):
+    upload(generate_csv_bytes(12, seed=12))
+    _set_dates(_expected_ids(), None)
+
+    ids, _ = _page_through(client, admin_headers, 5)
+    assert ids == _expected_ids()
+
+
+def test_cursor_respects_store_restriction(clean_sales, client, admin_headers, staff_headers, upload):
+    upload(generate_csv_bytes(60, seed=13))
+    _set_dates(_expected_ids()[:6], None)
+
+    ids, _ = _page_through(client, staff_headers, 4)
+    assert ids == _expected_ids("S002078")
+
+
+def test_invalid_cursor_is_rejected(client, admin_headers):
+    response = client.get("/api/transactions", params={"cursor": "not-a-cursor"}, headers=admin_headers)
+    assert response.status_code == 400
@@ -0,0 +1,39 @@
+"""CSV アップロードの重複除外"""
+
+from app.database import SessionLocal
+from app.models.sales import SalesTransaction
+from sample_pos_csv import generate_csv_bytes
+
+
+def _transaction_count() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(SalesTransaction).count()
+    finally:
+        db.close()
+
+
+def test_repeated_upload_skips_all_rows(clean_sales, upload):
+    content = generate_csv_bytes(60, seed=1)
+    status, first = upload(content)
+    assert status == 200
+    assert first["count"] > 0
+    stored = _transaction_count()
+    assert stored == first["count"]
+
+    status, second = upload(content)
+    assert status == 200
+    assert second["count"] == 0
+    assert second["duplicates"] == 60
+    assert _transaction_count() == stored
+
+
+def test_overlapping_upload_adds_only_new_rows(clean_sales, client, admin_headers, upload):
+    # generate_csv_bytes(30) は generate_csv_bytes(90) の先頭30行と同じ内容
+    _, whole = upload(generate_csv_bytes(90, seed=2))
+    client.post("/api/admin/clear-data", headers=admin_headers)
+
+    _, head = upload(generate_csv_bytes(30, seed=2))
+    _, rest = upload(generate_csv_bytes(90, seed=2))
+    assert head["count"] + rest["count"] == whole["count"]
+    assert _transaction_count() == whole["count"]